@@ -0,0 +1,41 @@
+"""Measure Search's per-call overhead against an in-memory StubTransport.
+
+No network is involved, so the time is all spent in chwrapper and
+requests. Usage::
+
+    python benchmarks/client_overhead.py [calls]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chwrapper  # noqa: E402
+
+PROFILE = {"company_name": "DYSON JAMES LIMITED", "company_number": "03772814",
+           "company_status": "active", "links": {"self": "/company/03772814"}}
+
+
+def main(calls=5000):
+    transport = chwrapper.StubTransport(limit=2 * calls + 1)
+    transport.add("/company/03772814", PROFILE)
+    clients = [
+        ("rate limited", chwrapper.Search(access_token="pk.test",
+                                          transport=transport)),
+        ("no rate limit", chwrapper.Search(access_token="pk.test",
+                                           rate_limit=False,
+                                           transport=transport)),
+    ]
+    for label, client in clients:
+        started = time.perf_counter()
+        for _ in range(calls):
+            client.profile("03772814")
+        elapsed = time.perf_counter() - started
+        print("{:<16} {:8.1f} us/call".format(label, elapsed / calls * 1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,53 @@
+"""Measure diff_snapshots throughput on officer list snapshots.
+
+Usage::
+
+    python benchmarks/diff_snapshots.py [resources]
+
+"""
+
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chwrapper.services.changes import diff_snapshots  # noqa: E402
+
+
+def officers(count):
+    return {
+        "etag": "a",
+        "active_count": count,
+        "items": [
+            {"name": "OFFICER, {}".format(i),
+             "officer_role": "director",
+             "appointed_on": "2010-01-01",
+             "address": {"premises": str(i), "locality": "London"},
+             "links": {"self": "/company/00012345/appointments/{}".format(i),
+                       "officer": {"appointments": "/officers/{}".format(i)}}}
+            for i in range(count)
+        ],
+    }
+
+
+def main(resources=20000):
+    old = officers(20)
+    cases = [
+        ("same etag", copy.deepcopy(old)),
+        ("unchanged", dict(copy.deepcopy(old), etag="b")),
+        ("one resignation", dict(copy.deepcopy(old), etag="b")),
+    ]
+    cases[2][1]["items"][7]["resigned_on"] = "2020-01-01"
+    for label, new in cases:
+        started = time.perf_counter()
+        for _ in range(resources):
+            diff_snapshots(old, new)
+        elapsed = time.perf_counter() - started
+        print("{:<16} {:12,.0f} resources/hour".format(
+            label, resources / elapsed * 3600))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,44 @@
+"""Compare cold import times for chwrapper.
+
+Each measurement runs in a fresh interpreter so nothing is shared between
+runs. Usage::
+
+    python benchmarks/import_time.py [repeats]
+
+"""
+
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = [
+    ("python startup", "pass"),
+    ("import chwrapper", "import chwrapper"),
+    ("import validators", "import chwrapper.services.validators"),
+    ("import requests", "import requests"),
+    ("chwrapper.Search", "import chwrapper; chwrapper.Search"),
+]
+
+TIMER = (
+    "import time; _t = time.perf_counter(); {}; "
+    "print(time.perf_counter() - _t)"
+)
+
+
+def measure(statement, repeats):
+    timings = []
+    for _ in range(repeats):
+        out = subprocess.check_output(
+            [sys.executable, "-c", TIMER.format(statement)])
+        timings.append(float(out))
+    return statistics.median(timings)
+
+
+def main(repeats=20):
+    for label, statement in STATEMENTS:
+        print("{:<20} {:8.2f} ms".format(
+            label, measure(statement, repeats) * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
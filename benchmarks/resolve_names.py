@@ -0,0 +1,65 @@
+"""Measure NameIndex.candidates latency on synthetic company names.
+
+Names are built from a small vocabulary, so words such as HOLDINGS and
+SERVICES, and their trigrams, are as common as on the real register.
+Usage::
+
+    python benchmarks/resolve_names.py [names] [queries]
+
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chwrapper.services.resolve import NameIndex  # noqa: E402
+
+COMMON = ["HOLDINGS", "SERVICES", "TRADING", "CONSULTING", "PROPERTIES",
+          "GROUP", "INVESTMENTS", "MANAGEMENT", "ENGINEERING", "UK"]
+SUFFIXES = ["LIMITED", "LTD", "PLC", "LLP"]
+
+
+def word(rng):
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPRSTUVWY")
+                   for _ in range(rng.randint(4, 9)))
+
+
+def names(count, seed=1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        words = [word(rng) for _ in range(rng.randint(1, 2))]
+        words += rng.sample(COMMON, rng.randint(1, 2))
+        yield " ".join(words + [rng.choice(SUFFIXES)])
+
+
+def main(count=300000, queries=200):
+    index = NameIndex()
+    started = time.perf_counter()
+    for key, name in enumerate(names(count)):
+        index.add(name, str(key))
+    print("{:<24} {:10.2f} s".format(
+        "index {:,} names".format(count), time.perf_counter() - started))
+
+    rng = random.Random(2)
+    sample = list(names(count))
+    cases = [
+        ("exact names", rng.sample(sample, queries)),
+        ("misspelt names", [name.replace("S", "Z", 1)
+                            for name in rng.sample(sample, queries)]),
+        ("common words only", [" ".join(rng.sample(COMMON, 2))
+                               for _ in range(queries)]),
+    ]
+    for label, batch in cases:
+        started = time.perf_counter()
+        for name in batch:
+            index.candidates(name)
+        elapsed = time.perf_counter() - started
+        print("{:<24} {:10.2f} ms/query".format(
+            label, elapsed / len(batch) * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,5 +1,74 @@
-__all__ = [".services.search.Search"]
+__all__ = ["Service", "Search", "ClientFactory", "RateLimiter",
+           "AdaptiveConcurrency", "CachePolicy", "ResponseCache",
+           "CircuitBreakers", "CircuitOpenError", "Deadline",
+           "DeadlineExceeded", "DisqualifiedIndex", "EntityResolver",
+           "NameIndex", "Prefetcher", "Resource", "InvalidIdentifier",
+           "diff_snapshots", "StubTransport", "Urllib3Transport",
+           "AsyncTransport", "RequestsTransport", "RecordingTransport",
+           "ReplayTransport", "TrafficArchive", "replay_traffic",
+           "RateLimitStore",
+           "JobPlanner", "PSCSnapshot", "AccountsTable", "read_accounts",
+           "DocumentDownloader", "Pipeline", "Stage", "search_stage",
+           "JobQueue", "SQLiteJobQueue", "run_worker", "DNSCache"]
 __version__ = "0.3.0"
 
-from chwrapper.services.base import Service
-from chwrapper.services.search import Search
+import importlib
+
+# Public names are resolved on first access so that importing chwrapper
+# doesn't pull in requests until a client is actually needed.
+_LAZY_ATTRIBUTES = {
+    "Service": "chwrapper.services.base",
+    "Search": "chwrapper.services.search",
+    "ClientFactory": "chwrapper.services.factory",
+    "RateLimiter": "chwrapper.services.base",
+    "AdaptiveConcurrency": "chwrapper.services.concurrency",
+    "CachePolicy": "chwrapper.services.cache",
+    "ResponseCache": "chwrapper.services.cache",
+    "CircuitBreakers": "chwrapper.services.breaker",
+    "CircuitOpenError": "chwrapper.services.breaker",
+    "Deadline": "chwrapper.services.deadline",
+    "DeadlineExceeded": "chwrapper.services.deadline",
+    "EntityResolver": "chwrapper.services.resolve",
+    "NameIndex": "chwrapper.services.resolve",
+    "DisqualifiedIndex": "chwrapper.services.screening",
+    "Prefetcher": "chwrapper.services.prefetch",
+    "Resource": "chwrapper.services.resources",
+    "InvalidIdentifier": "chwrapper.services.validators",
+    "diff_snapshots": "chwrapper.services.changes",
+    "StubTransport": "chwrapper.services.transport",
+    "Urllib3Transport": "chwrapper.services.transport",
+    "AsyncTransport": "chwrapper.services.transport",
+    "RequestsTransport": "chwrapper.services.transport",
+    "RecordingTransport": "chwrapper.services.replay",
+    "ReplayTransport": "chwrapper.services.replay",
+    "TrafficArchive": "chwrapper.services.replay",
+    "replay_traffic": "chwrapper.services.replay",
+    "RateLimitStore": "chwrapper.services.state",
+    "JobPlanner": "chwrapper.services.planner",
+    "PSCSnapshot": "chwrapper.services.bulk",
+    "AccountsTable": "chwrapper.services.accounts",
+    "read_accounts": "chwrapper.services.accounts",
+    "DocumentDownloader": "chwrapper.services.documents",
+    "Pipeline": "chwrapper.services.pipeline",
+    "Stage": "chwrapper.services.pipeline",
+    "search_stage": "chwrapper.services.pipeline",
+    "JobQueue": "chwrapper.services.jobqueue",
+    "SQLiteJobQueue": "chwrapper.services.jobqueue",
+    "run_worker": "chwrapper.services.jobqueue",
+    "DNSCache": "chwrapper.services.warmup",
+}
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        msg = "module {!r} has no attribute {!r}".format(__name__, name)
+        raise AttributeError(msg) from None
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
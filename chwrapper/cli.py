@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.cli
+~~~~~~~~~~~~~
+
+This module provides the ``chwrapper`` command for bulk lookups.
+
+Inputs are read one per line from a file or stdin, looked up concurrently
+and written out in input order as NDJSON or CSV. Progress is checkpointed
+so that an interrupted job can be restarted with the same arguments and
+will continue from the last checkpoint. The output file is cut back to
+its length at that checkpoint first, so no rows are repeated; output to
+stdout can't be, and rows written after the last checkpoint are repeated.
+
+"""
+
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .services.cache import ResponseCache
+from .services.concurrency import AdaptiveConcurrency
+from .services.deadline import Deadline
+from .services.factory import ClientFactory
+from .services.planner import JobPlanner
+from .services.validators import InvalidIdentifier
+
+ENDPOINTS = (
+    'profile',
+    'address',
+    'officers',
+    'insolvency',
+    'filing_history',
+    'charges',
+    'persons_significant_control',
+    'appointments',
+    'disqualified',
+    'search_companies',
+    'search_officers',
+)
+
+CSV_FIELDS = ('input', 'status', 'error', 'data')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='chwrapper',
+        description='Bulk lookups against the Companies House API.')
+    parser.add_argument('endpoint', choices=ENDPOINTS,
+                        help='Search method to call for each input')
+    parser.add_argument('-i', '--input', default='-',
+                        help='File of company numbers or search terms, one '
+                             'per line. Defaults to stdin.')
+    parser.add_argument('-o', '--output', default='-',
+                        help='Output file. Defaults to stdout.')
+    parser.add_argument('-f', '--format', choices=('ndjson', 'csv'),
+                        default='ndjson')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='Number of concurrent requests. Default 4.')
+    parser.add_argument('-c', '--checkpoint',
+                        help='Checkpoint file used to resume an interrupted '
+                             'job.')
+    parser.add_argument('--checkpoint-every', type=int, default=100,
+                        help='Rows written between checkpoints. Default 100.')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Adapt concurrency to latency and rate limit '
+                             'feedback, up to --workers requests in flight.')
+    parser.add_argument('--deadline', type=float,
+                        help='Seconds allowed for each lookup, including '
+                             'rate limit waits and retries.')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Retries for rate limited (429) responses.')
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='Responses kept in memory, so repeated inputs '
+                             'are looked up once. 0 disables the cache. '
+                             'Default 10000.')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the estimated calls and run time as '
+                             'JSON instead of running the job.')
+    parser.add_argument('--access-token',
+                        help='Companies House API key. Defaults to the '
+                             'COMPANIES_HOUSE_KEY environment variable.')
+    return parser.parse_args(argv)
+
+
+def read_checkpoint(path):
+    """Return the (lines done, output offset) saved at *path*.
+
+    The offset is None for a new job or when the output went to stdout.
+    """
+    if not path or not os.path.exists(path):
+        return 0, None
+    with open(path) as f:
+        state = json.load(f)
+    return state['done'], state.get('offset')
+
+
+def write_checkpoint(path, done, offset=None):
+    state = {'done': done}
+    if offset is not None:
+        state['offset'] = offset
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _call(client, endpoint, value, controller, deadline):
+    if controller is None:
+        return getattr(client, endpoint)(value, deadline=deadline)
+    with controller.slot() as done:
+        res = getattr(client, endpoint)(value, deadline=deadline)
+        done(res)
+    return res
+
+
+def lookup(client, endpoint, value, retries=3, controller=None,
+           deadline=None):
+    """Call *endpoint* for one input value and return an output record.
+
+    Args:
+        client (Search): Client to make the call with.
+        endpoint (str): Name of the Search method to call.
+        value (str): Company number, officer id or search term.
+        retries (Optional[int]): Retries for rate limited responses.
+        controller (Optional[AdaptiveConcurrency]): Limits how many calls
+            are in flight across threads.
+        deadline (Optional[float]): Seconds allowed for the lookup,
+            including retries.
+    """
+    record = {'input': value, 'status': None, 'error': None, 'data': None}
+    deadline = Deadline.coerce(deadline)
+    try:
+        for _ in range(retries + 1):
+            res = _call(client, endpoint, value, controller, deadline)
+            if res.status_code != 429:
+                break
+    except InvalidIdentifier as e:
+        record['error'] = str(e)
+        return record
+    except requests.exceptions.HTTPError as e:
+        record['status'] = e.response.status_code
+        record['error'] = str(e)
+        return record
+    except requests.exceptions.RequestException as e:
+        record['error'] = str(e)
+        return record
+
+    record['status'] = res.status_code
+    if res.status_code == 429:
+        record['error'] = 'Rate limited'
+        return record
+    try:
+        record['data'] = res.json()
+    except ValueError as e:
+        record['error'] = 'Invalid JSON response: {}'.format(e)
+    return record
+
+
+class _Writer(object):
+
+    def __init__(self, stream, fmt, write_header):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_FIELDS)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            row = dict(record)
+            if row['data'] is not None:
+                row['data'] = json.dumps(row['data'])
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(record) + '\n')
+
+
+def _open(path, mode):
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(path, mode, newline='' if 'r' not in mode else None)
+
+
+def run(args, client_factory=None):
+    """Run a bulk job described by parsed *args*.
+
+    Args:
+        args (argparse.Namespace): Arguments from :func:`parse_args`.
+        client_factory (Optional[callable]): Returns the Search client to use
+            in the calling thread. Defaults to a ClientFactory.
+
+    Returns:
+        int: The number of input lines processed, including earlier runs.
+    """
+    if client_factory is None:
+        cache = None
+        if args.cache_size > 0:
+            cache = ResponseCache(max_entries=args.cache_size,
+                                  compression='zlib')
+        client_factory = ClientFactory(access_token=args.access_token,
+                                       cache=cache)
+
+    if args.dry_run:
+        return dry_run(args, client_factory())
+
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveConcurrency(maximum=max(1, args.workers))
+
+    def work(value):
+        return lookup(client_factory(), args.endpoint, value, args.retries,
+                      controller, args.deadline)
+
+    done, offset = read_checkpoint(args.checkpoint)
+    resuming = done > 0
+    source = _open(args.input, 'r')
+    sink = _open(args.output, 'a' if resuming else 'w')
+    if resuming and offset is not None and sink is not sys.stdout:
+        # Drop rows written after the checkpoint; they're looked up again
+        sink.truncate(offset)
+    writer = _Writer(sink, args.format, write_header=not resuming)
+
+    def flush(done):
+        sink.flush()
+        if args.checkpoint:
+            write_checkpoint(args.checkpoint, done,
+                             None if sink is sys.stdout else sink.tell())
+
+    # Futures are drained in submission order with a bounded window, so
+    # output stays in input order and memory use doesn't grow with input.
+    pending = collections.deque()
+    window = max(1, args.workers) * 2
+    since_checkpoint = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for lineno, line in enumerate(source, 1):
+                if lineno <= done:
+                    continue
+                value = line.strip()
+                pending.append((lineno, pool.submit(work, value)
+                                if value else None))
+                while len(pending) >= window or (
+                        pending and pending[0][1] is None):
+                    done, since_checkpoint = _drain(
+                        pending, writer, done, since_checkpoint)
+                    if since_checkpoint >= args.checkpoint_every:
+                        flush(done)
+                        since_checkpoint = 0
+            while pending:
+                done, since_checkpoint = _drain(
+                    pending, writer, done, since_checkpoint)
+        flush(done)
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+        if source is not sys.stdin:
+            source.close()
+    return done
+
+
+def dry_run(args, client):
+    """Write the plan for the job described by *args* to stdout.
+
+    Only the first page of each input is fetched by the job, so no probe
+    requests are made. A new process starts with an empty cache, so only
+    a *client_factory* passed to :func:`run` with a populated cache gives
+    cache hits.
+
+    Returns:
+        int: The number of input lines the job would process.
+    """
+    done, _ = read_checkpoint(args.checkpoint)
+    source = _open(args.input, 'r')
+    try:
+        lines = [line for lineno, line in enumerate(source, 1)
+                 if lineno > done]
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    planner = JobPlanner(client, workers=max(1, args.workers))
+    plan = planner.plan(lines, [args.endpoint], probes=0, paginate=False)
+    sys.stdout.write(json.dumps(plan.as_dict()) + '\n')
+    return done + len(lines)
+
+
+def _drain(pending, writer, done, since_checkpoint):
+    lineno, future = pending.popleft()
+    if future is not None:
+        writer.write(future.result())
+        since_checkpoint += 1
+    return lineno, since_checkpoint
+
+
+def main(argv=None):
+    run(parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.accounts
+~~~~~~~~~~~~~~~~~~
+
+This module extracts tagged facts from the Companies House accounts bulk
+data, ZIP files of iXBRL and XBRL documents, into a columnar table keyed
+by company number and period.
+
+"""
+
+import csv
+import math
+import os
+import re
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from html.entities import name2codepoint
+from xml.etree import ElementTree
+
+# Local names of the facts extracted by default. Names are matched without
+# their namespace, so the old UK GAAP and the FRC taxonomies both match.
+DEFAULT_FACTS = (
+    'Equity',
+    'NetAssetsLiabilities',
+    'CashBankOnHand',
+    'CurrentAssets',
+    'Creditors',
+    'NetCurrentAssetsLiabilities',
+    'TotalAssetsLessCurrentLiabilities',
+    'TurnoverRevenue',
+    'ProfitLoss',
+    'AverageNumberEmployeesDuringPeriod',
+)
+
+# Bulk file names end with the company number and balance sheet date, as
+# in Prod224_0001_00012345_20200331.html
+_FILE_NAME = re.compile(
+    r'_([A-Z0-9]{8})_(\d{4})(\d{2})(\d{2})\.(?:x?html?|xml)$', re.IGNORECASE)
+
+_REGISTERED_NUMBER = 'UKCompaniesHouseRegisteredNumber'
+_IX_FACTS = frozenset(['nonFraction', 'nonNumeric'])
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+_ENTITY = re.compile(rb'&([A-Za-z][A-Za-z0-9]*);')
+_XML_ENTITIES = frozenset([b'amp', b'lt', b'gt', b'quot', b'apos'])
+
+
+def _numeric_entity(match):
+    name = match.group(1)
+    code = name2codepoint.get(name.decode('ascii'))
+    if name in _XML_ENTITIES or code is None:
+        return match.group(0)
+    return b'&#%d;' % code
+
+
+def _chunks(f, size=65536):
+    """Read *f* in chunks with HTML entities made numeric.
+
+    iXBRL is XHTML, which often uses entities such as ``&nbsp;`` that XML
+    doesn't define.
+    """
+    carry = b''
+    while True:
+        data = f.read(size)
+        if not data:
+            if carry:
+                yield _ENTITY.sub(_numeric_entity, carry)
+            return
+        data = carry + data
+        # Hold back an entity split across chunks
+        cut = data.rfind(b'&')
+        if cut != -1 and b';' not in data[cut:] and len(data) - cut < 32:
+            data, carry = data[:cut], data[cut:]
+        else:
+            carry = b''
+        yield _ENTITY.sub(_numeric_entity, data)
+
+
+def _number(attrib, text):
+    """Parse a fact's text, applying iXBRL format, scale and sign."""
+    text = text.strip()
+    fmt = attrib.get('format', '')
+    if fmt.endswith(('zerodash', 'fixed-zero')) or text in ('-', ''):
+        value = 0.0
+    else:
+        if fmt.endswith('numcommadecimal'):
+            text = text.replace('.', '').replace(' ', '').replace(',', '.')
+        else:
+            text = text.replace(',', '').replace(' ', '')
+        value = float(text)
+    scale = attrib.get('scale')
+    if scale:
+        value *= 10 ** int(scale)
+    if attrib.get('sign') == '-':
+        value = -value
+    return value
+
+
+def _events(parser, f):
+    for chunk in _chunks(f):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def parse_accounts(source, facts=DEFAULT_FACTS, name=None,
+                   comparatives=False):
+    """Extract facts from one iXBRL or XBRL document.
+
+    The document is read with a pull parser and each element is discarded
+    once it has been handled. Facts reported against a dimension, such as
+    one class of share, are left out.
+
+    Args:
+        source (str, file): Path or binary file object of the document.
+        facts (Optional[iterable]): Local names of the facts to extract.
+        name (Optional[str]): File name, used for the company number and
+            balance sheet date. Defaults to *source* when it's a path.
+        comparatives (Optional[bool]): Also return the prior period figures
+            that accounts report alongside the current ones. Defaults to
+            False when the balance sheet date is known from *name*.
+
+    Returns:
+        list: ``(company_number, period_end, values)`` tuples, where
+        *values* maps fact names to floats.
+    """
+    if name is None and isinstance(source, str):
+        name = source
+    facts = frozenset(facts)
+    company_number = period_end = None
+    match = _FILE_NAME.search(os.path.basename(name or ''))
+    if match is not None:
+        company_number = match.group(1).upper()
+        period_end = '{}-{}-{}'.format(*match.group(2, 3, 4))
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return parse_accounts(f, facts, name, comparatives)
+
+    contexts = {}
+    found = []
+    in_context = in_fact = 0
+    # Open elements, so finished ones can be detached from their parent;
+    # clearing alone would leave the root's child list growing
+    open_elements = []
+    parser = ElementTree.XMLPullParser(('start', 'end'))
+    for event, element in _events(parser, source):
+        local = _local(element.tag)
+        is_fact = (local in _IX_FACTS or local in facts
+                   or local == _REGISTERED_NUMBER)
+        if event == 'start':
+            open_elements.append(element)
+            in_context += local == 'context'
+            in_fact += is_fact
+            continue
+        open_elements.pop()
+        if local == 'context':
+            in_context -= 1
+            if not any(_local(e.tag) in ('segment', 'scenario')
+                       for e in element.iter()):
+                ends = [e.text for e in element.iter()
+                        if _local(e.tag) in ('instant', 'endDate')]
+                if ends:
+                    contexts[element.get('id')] = ends[0].strip()
+            element.clear()
+        elif is_fact:
+            in_fact -= 1
+            fact = element.get('name', local).rsplit(':', 1)[-1]
+            if fact in facts and element.get('contextRef') is not None:
+                text = ''.join(element.itertext())
+                found.append((fact, element.get('contextRef'),
+                              dict(element.attrib), text))
+            elif fact == _REGISTERED_NUMBER and company_number is None:
+                company_number = ''.join(element.itertext()).strip()
+            if in_fact == 0:
+                element.clear()
+        elif not in_context and not in_fact:
+            element.clear()
+        if open_elements and not in_context and not in_fact:
+            open_elements[-1].remove(element)
+
+    periods = {}
+    for fact, context, attrib, text in found:
+        period = contexts.get(context)
+        if period is None or (period != period_end and period_end
+                              and not comparatives):
+            continue
+        try:
+            value = _number(attrib, text)
+        except ValueError:
+            continue
+        periods.setdefault(period, {}).setdefault(fact, value)
+    return [(company_number, period, values)
+            for period, values in sorted(periods.items())]
+
+
+class AccountsTable(object):
+    """Extracted facts, one row per company and period.
+
+    Each fact is a column of doubles, with NaN where a company didn't
+    report it, alongside *company_numbers* and *periods* columns. Adding a
+    row for a company and period already in the table updates it.
+    """
+
+    def __init__(self, facts=DEFAULT_FACTS):
+        self.facts = tuple(facts)
+        self.company_numbers = []
+        self.periods = []
+        self.columns = {fact: array('d') for fact in self.facts}
+        self.errors = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self.company_numbers)
+
+    def add(self, company_number, period, values):
+        key = (company_number, period)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self.company_numbers)
+            self.company_numbers.append(company_number)
+            self.periods.append(period)
+            for column in self.columns.values():
+                column.append(math.nan)
+        for fact, value in values.items():
+            if fact in self.columns:
+                self.columns[fact][row] = value
+
+    def get(self, company_number, period):
+        """Return the facts reported for a company and period, or None."""
+        row = self._rows.get((company_number, period))
+        if row is None:
+            return None
+        return {fact: column[row] for fact, column in self.columns.items()
+                if not math.isnan(column[row])}
+
+    def rows(self):
+        """Yield each row as a dict, with None for missing facts."""
+        for row, key in enumerate(zip(self.company_numbers, self.periods)):
+            record = {'company_number': key[0], 'period_end': key[1]}
+            for fact, column in self.columns.items():
+                value = column[row]
+                record[fact] = None if math.isnan(value) else value
+            yield record
+
+    def to_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(
+                f, fieldnames=('company_number', 'period_end') + self.facts)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+
+def _parse_members(path, names, facts, comparatives):
+    """Parse some of the documents in a ZIP, for a worker process."""
+    results, errors = [], []
+    with zipfile.ZipFile(path) as archive:
+        for name in names:
+            try:
+                with archive.open(name) as f:
+                    results.extend(parse_accounts(f, facts, name,
+                                                  comparatives))
+            except (ElementTree.ParseError, ValueError) as e:
+                errors.append((name, str(e)))
+    return results, errors
+
+
+def read_accounts(paths, facts=DEFAULT_FACTS, workers=None,
+                  comparatives=False, chunk_size=200):
+    """Extract facts from accounts bulk data ZIPs into an AccountsTable.
+
+    Documents are split into chunks parsed in a process pool. Documents
+    that can't be parsed are listed in the table's *errors* rather than
+    stopping the run.
+
+    Args:
+        paths (str, list): Bulk data ZIP files.
+        facts (Optional[iterable]): Local names of the facts to extract.
+        workers (Optional[int]): Worker processes. Defaults to the number
+            of CPUs; 1 parses in this process.
+        comparatives (Optional[bool]): Also keep prior period figures.
+            Defaults to False.
+        chunk_size (Optional[int]): Documents per task sent to a worker.
+            Defaults to 200.
+
+    Returns:
+        AccountsTable
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    facts = tuple(facts)
+    tasks = []
+    for path in paths:
+        with zipfile.ZipFile(path) as archive:
+            names = sorted(name for name in archive.namelist()
+                           if _FILE_NAME.search(name)
+                           or name.lower().endswith(('.html', '.xhtml',
+                                                     '.xml')))
+        tasks.extend((path, names[i:i + chunk_size], facts, comparatives)
+                     for i in range(0, len(names), chunk_size))
+
+    table = AccountsTable(facts)
+    if workers == 1:
+        results = (_parse_members(*task) for task in tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_parse_members, *zip(*tasks)) if tasks else []
+    try:
+        for rows, errors in results:
+            for company_number, period, values in rows:
+                table.add(company_number, period, values)
+            table.errors.extend(errors)
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    return table
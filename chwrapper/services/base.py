@@ -22,19 +22,192 @@
 
 
 from datetime import datetime
-from time import sleep
+from time import monotonic, sleep, time
+from urllib.parse import urlparse
 import os
+import threading
 import requests
 
 from .. import __version__
+from .breaker import CircuitOpenError
+from .deadline import DeadlineExceeded, current_deadline
+from .state import DEFAULT_HOST, DOCUMENT_HOST, RateLimitStore
 
 
-class RateLimitAdapter(requests.adapters.HTTPAdapter):
+class RateLimiter(object):
+    """Rate limit state shared between every adapter that uses it.
 
-    def __init__(self, **kwargs):
+    Tracks the remaining calls and reset time reported by the API. Each
+    request reserves a call before it is sent, so threads sharing a limiter
+    don't spend the same quota twice, and wait for the window to reset once
+    it is used up. Safe to share between threads.
+
+    Without a store the state belongs to one process, and forked workers
+    each spend from their own copy of it. With a store, calls are reserved
+    from the window saved in its file, so every process using the same file
+    and key draws on one budget.
+    """
+
+    def __init__(self, store=None, access_token=None, host=DEFAULT_HOST):
+        """Construct a RateLimiter.
+
+        Args:
+            store (Optional[RateLimitStore]): Saves the state as responses
+                arrive. A window that hasn't reset yet is restored from it,
+                so a restarted process doesn't burst through quota it has
+                already spent. Defaults to None.
+            access_token (Optional[str]): API key the state belongs to in
+                *store*. Defaults to None.
+            host (Optional[str]): API host the state belongs to in *store*.
+        """
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.store = store
+        self.key = RateLimitStore.key(access_token, host)
+        self._lock = threading.Lock()
+        saved = store.load(self.key) if store is not None else None
+        if saved is not None:
+            self.limit = saved['limit']
+            self.remaining = saved['remaining']
+            self.reset = saved['reset']
+
+    def acquire(self, deadline=None):
+        """Reserve a call, sleeping until the window resets if none remain.
+
+        Args:
+            deadline (Optional[Deadline]): Raise DeadlineExceeded at once,
+                rather than sleeping, if the window resets after it.
+        """
+        while True:
+            shared = None
+            if self.store is not None:
+                shared = self.store.reserve(self.key)
+            with self._lock:
+                now = time()
+                if shared is not None:
+                    reserved, self.remaining, self.reset = shared
+                    if reserved:
+                        return
+                else:
+                    if self.reset is not None and self.reset <= now:
+                        self.remaining = self.reset = None
+                    if self.remaining is None or self.remaining > 0:
+                        if self.remaining is not None:
+                            self.remaining -= 1
+                        return
+                delay = self.reset - now + 1
+            if deadline is not None and delay > deadline.remaining():
+                raise DeadlineExceeded(
+                    "Rate limit resets after the deadline")
+            sleep(delay)
+
+    def update(self, headers):
+        """Update the state from a response's rate limit headers."""
+        try:
+            remaining = int(headers["X-Ratelimit-Remain"])
+            reset = int(headers["X-Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            if "X-Ratelimit-Limit" in headers:
+                self.limit = int(headers["X-Ratelimit-Limit"])
+            if self.reset is None or reset > self.reset:
+                self.remaining, self.reset = remaining, reset
+            elif reset == self.reset:
+                # Responses can arrive out of order; the lowest count wins
+                self.remaining = min(self.remaining, remaining)
+            state = self.limit, self.remaining, self.reset
+        if self.store is not None:
+            self.store.save(self.key, *state)
+
+    def save(self):
+        """Save the current state to the store now, if there is one."""
+        if self.store is not None:
+            with self._lock:
+                state = self.limit, self.remaining, self.reset
+            self.store.save(self.key, *state, force=True)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        if self.store is not None:
+            self.store._after_fork()
+
+
+class CircuitBreakerAdapter(requests.adapters.HTTPAdapter):
+    """Checks a per-host circuit breaker before each request is sent.
+
+    Requests go out through the adapter's own connection pool, or through
+    *transport* when one is given.
+    """
+
+    def __init__(self, breakers=None, transport=None, **kwargs):
+        self.breakers = breakers
+        self.transport = transport
+        super(CircuitBreakerAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.breakers is None:
+            return self._send(request, **kwargs)
+
+        breaker = self.breakers.get(urlparse(request.url).netloc)
+        if not breaker.allow():
+            msg = "Circuit open for {}".format(breaker.name)
+            raise CircuitOpenError(msg, request=request)
+        request.breaker_started = monotonic()
+        try:
+            return self._send(request, **kwargs)
+        except DeadlineExceeded:
+            # Gave up before reaching the host, so says nothing about it
+            breaker.cancel()
+            raise
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            breaker.record(False)
+            raise
+        except Exception:
+            # Says nothing certain about the host, but a half-open trial
+            # left taken would keep the circuit from ever closing
+            breaker.cancel()
+            raise
+
+    def _send(self, request, **kwargs):
+        if self.transport is None:
+            return super(CircuitBreakerAdapter, self).send(request, **kwargs)
+        return self._received(request,
+                              self.transport.send(request, **kwargs))
+
+    def build_response(self, req, resp):
+        resp = super(CircuitBreakerAdapter, self).build_response(req, resp)
+        return self._received(req, resp)
+
+    def _received(self, req, resp):
+        started = getattr(req, "breaker_started", None)
+        if started is not None:
+            # Recorded before any rate limit sleep so it isn't counted as
+            # latency
+            self.breakers.get(urlparse(req.url).netloc).record(
+                resp.status_code < 500, monotonic() - started)
+        return resp
+
+
+class RateLimitAdapter(CircuitBreakerAdapter):
+    """Waits on a RateLimiter before each request and updates it from each
+    response.
+
+    A response without an ``X-Ratelimit-Remain`` header is taken as the
+    last call of the window, unless the adapter isn't *strict*, in which
+    case it's let through.
+    """
+
+    def __init__(self, limiter=None, strict=True, **kwargs):
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.strict = strict
         super(RateLimitAdapter, self).__init__(**kwargs)
 
     def rate_limit(self, resp):
+        if not self.strict and "X-Ratelimit-Remain" not in resp.headers:
+            return resp
         if resp.headers.get("X-Ratelimit-Remain", "0") == "0":
             try:
                 timestamp = int(resp.headers["X-Ratelimit-Reset"])
@@ -45,15 +218,29 @@ class RateLimitAdapter(requests.adapters.HTTPAdapter):
             reset_dt = datetime.utcfromtimestamp(timestamp)
             td = reset_dt - datetime.utcnow()
 
+            delay = td.total_seconds() + 1
+
+            # Don't hold a response past the caller's deadline; the limiter
+            # makes the next call wait for the reset instead.
+            deadline = current_deadline()
+            if (deadline is not None and delay >= 0
+                    and delay > deadline.remaining()):
+                return resp
+
             try:
-                sleep(td.total_seconds() + 1)
+                sleep(delay)
             except ValueError as e:
                 msg = "X-Rate-Limit-Reset time is negative"
                 raise ValueError(msg) from e
         return resp
 
-    def build_response(self, req, resp):
-        resp = super(RateLimitAdapter, self).build_response(req, resp)
+    def _send(self, request, **kwargs):
+        self.limiter.acquire(current_deadline())
+        return super(RateLimitAdapter, self)._send(request, **kwargs)
+
+    def _received(self, req, resp):
+        resp = super(RateLimitAdapter, self)._received(req, resp)
+        self.limiter.update(resp.headers)
         self.rate_limit(resp)
         return resp
 
@@ -65,16 +252,32 @@ class Service(object):
         self._DOCUMENT_URI = "https://document-api.companieshouse.gov.uk/"
         self._ignore_codes = []
 
-    def get_session(self, access_token=None, env=None, rate_limit=True):
-        access_token = (
-            access_token
-            or (env or os.environ).get("CompaniesHouseKey")
-            or (env or os.environ).get("COMPANIES_HOUSE_KEY")
-        )
+    def get_session(self, access_token=None, env=None, rate_limit=True,
+                    limiter=None, breakers=None, transport=None,
+                    document_limiter=None):
+        access_token = self.resolve_token(access_token, env)
         session = requests.Session()
 
+        # The transport is shared, so it's left for its owner to close rather
+        # than mounted directly where closing the session would close it.
         if rate_limit:
-            session.mount(self._BASE_URI, RateLimitAdapter())
+            session.mount(self._BASE_URI,
+                          RateLimitAdapter(limiter=limiter, breakers=breakers,
+                                           transport=transport))
+        elif breakers is not None or transport is not None:
+            session.mount(self._BASE_URI,
+                          CircuitBreakerAdapter(breakers=breakers,
+                                                transport=transport))
+        if rate_limit:
+            # Document responses don't all carry rate limit headers
+            session.mount(self._DOCUMENT_URI,
+                          RateLimitAdapter(limiter=document_limiter,
+                                           strict=False, breakers=breakers,
+                                           transport=transport))
+        elif breakers is not None or transport is not None:
+            session.mount(self._DOCUMENT_URI,
+                          CircuitBreakerAdapter(breakers=breakers,
+                                                transport=transport))
 
         session.params.update(access_token=access_token)
 
@@ -89,6 +292,15 @@ class Service(object):
         session.auth = (access_token, "")
         return session
 
+    @staticmethod
+    def resolve_token(access_token=None, env=None):
+        """Return *access_token*, or the key set in the environment."""
+        return (
+            access_token
+            or (env or os.environ).get("CompaniesHouseKey")
+            or (env or os.environ).get("COMPANIES_HOUSE_KEY")
+        )
+
     @property
     def product_token(self):
         """A product token for use in User-Agent headers."""
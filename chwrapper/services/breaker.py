@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.breaker
+~~~~~~~~~~~~~~~~~
+
+This module provides per-host circuit breakers, so that calls to a failing
+Companies House host fail fast rather than waiting on timeouts.
+
+"""
+
+import threading
+from collections import deque
+from time import monotonic
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while a host's circuit is open."""
+
+
+class CircuitBreaker(object):
+    """Tracks the health of one host.
+
+    The breaker starts *closed* and lets requests through. When at least
+    *min_calls* requests in the last *window* seconds have completed and
+    *failure_rate* or more of them failed, it *opens* and rejects requests
+    for *reset_timeout* seconds. It then goes *half-open* and lets
+    *half_open_calls* trial requests through: if they succeed it closes,
+    otherwise it opens again.
+
+    Connection errors, timeouts and 5xx responses are failures, as are
+    responses slower than *slow_call* seconds when that is set.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=30.0,
+                 reset_timeout=30.0, half_open_calls=1, slow_call=None,
+                 listeners=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.slow_call = slow_call
+        self.listeners = list(listeners or [])
+        self.state = CLOSED
+        self._calls = deque()
+        self._opened_at = None
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self.state == OPEN:
+                if monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    return False
+                self._trials += 1
+            return True
+
+    def cancel(self):
+        """Give back a call that was allowed through but never sent."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record(self, success, latency=None):
+        """Record the outcome of a request that was allowed through."""
+        if (success and latency is not None and self.slow_call is not None
+                and latency > self.slow_call):
+            success = False
+        with self._lock:
+            now = monotonic()
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if success else OPEN)
+                return
+            self._calls.append((now, success))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if (self.state == CLOSED and len(self._calls) >= self.min_calls
+                    and failures >= self.failure_rate * len(self._calls)):
+                self._transition(OPEN)
+
+    def _after_fork(self):
+        # Trials in flight in the parent never complete in the child
+        self._lock = threading.Lock()
+        self._trials = 0
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        self._trials = 0
+        self._calls.clear()
+        if state == OPEN:
+            self._opened_at = monotonic()
+        for listener in self.listeners:
+            listener(self.name, previous, state)
+
+
+class CircuitBreakers(object):
+    """A registry of circuit breakers, one per host, created on demand.
+
+    Share one registry between clients so they see the same host health.
+    """
+
+    def __init__(self, listener=None, **kwargs):
+        """Construct a CircuitBreakers registry.
+
+        Args:
+            listener (Optional[callable]): Called as ``listener(host,
+                old_state, new_state)`` whenever a breaker changes state.
+            kwargs (dict): additional keywords passed to each
+                CircuitBreaker.
+        """
+        self.listener = listener
+        self.breaker_kwargs = kwargs
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                listeners = [self.listener] if self.listener else []
+                breaker = CircuitBreaker(host, listeners=listeners,
+                                         **self.breaker_kwargs)
+                self._breakers[host] = breaker
+            return breaker
+
+    def states(self):
+        """Return a dict mapping each host seen so far to its state."""
+        with self._lock:
+            return {host: b.state for host, b in self._breakers.items()}
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        for breaker in self._breakers.values():
+            breaker._after_fork()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.bulk
+~~~~~~~~~~~~~~
+
+This module streams the Companies House persons with significant control
+snapshot, a set of ZIP files of JSON lines, from local disk.
+
+"""
+
+import glob
+import io
+import json
+import re
+import zipfile
+from itertools import groupby
+
+from .cache import CachedResponse, cache_key
+from .validators import normalise_company_numbers
+
+BASE_URI = 'https://api.companieshouse.gov.uk/'
+
+_PSC_PATH = 'company/{}/persons-with-significant-control'
+
+# Lets lines for unwanted companies be skipped without decoding them
+_COMPANY_NUMBER = re.compile(rb'"company_number"\s*:\s*"([^"]*)"')
+
+_STATEMENT_SUFFIX = '-statement'
+
+
+def _parts(paths):
+    if isinstance(paths, str):
+        paths = [paths]
+    found = []
+    for path in paths:
+        found.extend(sorted(glob.glob(path)) or [path])
+    return found
+
+
+def _lines(path):
+    """Yield the lines of a snapshot part, or of each file in a ZIP part."""
+    if not zipfile.is_zipfile(path):
+        with open(path, 'rb') as f:
+            yield from f
+        return
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(archive.namelist()):
+            if name.endswith('/'):
+                continue
+            with archive.open(name) as member:
+                yield from io.BufferedReader(member)
+
+
+class PSCSnapshot(object):
+    """A streaming reader for the PSC snapshot.
+
+    Lines are read and decoded one at a time, so memory use doesn't depend
+    on the size of the snapshot. Records are the same shape as the items
+    returned by :meth:`Search.persons_significant_control`, and
+    :meth:`companies` groups them into the same list responses. The
+    snapshot's totals line and exemption records are skipped.
+    """
+
+    def __init__(self, paths, fields=None, company_numbers=None,
+                 statements=False):
+        """Construct a PSCSnapshot.
+
+        Args:
+            paths (str, list): Snapshot parts, as paths or glob patterns
+                such as ``'psc-snapshot-*.zip'``. Read in sorted order.
+            fields (Optional[iterable]): Keep only these fields of each
+                record. Defaults to all of them.
+            company_numbers (Optional[iterable]): Only read records for
+                these companies. Invalid numbers are ignored.
+            statements (Optional[bool]): Read PSC statements rather than
+                persons with significant control. Defaults to False.
+        """
+        self.paths = _parts(paths)
+        self.fields = frozenset(fields) if fields is not None else None
+        self.company_numbers = None
+        if company_numbers is not None:
+            self.company_numbers = frozenset(
+                num for num in normalise_company_numbers(
+                    company_numbers, errors='coerce') if num is not None)
+        self.statements = statements
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        """Yield ``(company_number, record)`` pairs in snapshot order."""
+        for number, data in self._rows():
+            yield number, self._project(data)
+
+    def _project(self, data):
+        if self.fields is None:
+            return data
+        return {name: value for name, value in data.items()
+                if name in self.fields}
+
+    def _rows(self):
+        wanted = self.company_numbers
+        encoded = (None if wanted is None else
+                   frozenset(num.encode('ascii') for num in wanted))
+        for path in self.paths:
+            for line in _lines(path):
+                if encoded is not None:
+                    match = _COMPANY_NUMBER.search(line)
+                    if match is None or match.group(1) not in encoded:
+                        continue
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                number = row.get('company_number')
+                data = row.get('data') or {}
+                if number is not None and self._wanted_kind(
+                        data.get('kind', '')):
+                    yield number, data
+
+    def _wanted_kind(self, kind):
+        if kind.startswith('totals#') or kind == 'exemptions':
+            return False
+        return kind.endswith(_STATEMENT_SUFFIX) == self.statements
+
+    def companies(self):
+        """Yield ``(company_number, body)`` pairs, one per company.
+
+        Each body is shaped like the API's list response for the company.
+        The snapshot lists each company's records together; a company
+        whose records are split up is yielded once per run of them.
+        """
+        for number, group in groupby(self._rows(), key=lambda r: r[0]):
+            yield number, self._body(number, [data for _, data in group])
+
+    def _body(self, number, rows):
+        # Counted before projection, which may drop the ceased fields
+        ceased = sum(1 for row in rows if row.get('ceased_on')
+                     or row.get('ceased'))
+        items = [self._project(row) for row in rows]
+        path = _PSC_PATH.format(number)
+        if self.statements:
+            path += '-statements'
+        return {
+            'items': items,
+            'items_per_page': len(items),
+            'start_index': 0,
+            'total_results': len(items),
+            'active_count': len(items) - ceased,
+            'ceased_count': ceased,
+            'links': {'self': '/' + path},
+        }
+
+    def seed(self, cache, base_uri=BASE_URI):
+        """Store each company's list response in a ResponseCache.
+
+        :meth:`Search.persons_significant_control` then serves them without
+        a request while they're fresh under its cache policy.
+
+        Returns:
+            int: The number of companies stored.
+        """
+        stored = 0
+        headers = {'Content-Type': 'application/json'}
+        for number, body in self.companies():
+            url = base_uri + body['links']['self'][1:]
+            content = json.dumps(body).encode('utf-8')
+            cache.set(cache_key(url),
+                      CachedResponse(url, 200, dict(headers), content))
+            stored += 1
+        return stored
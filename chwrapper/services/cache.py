@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.cache
+~~~~~~~~~~~~~~~
+
+This module provides an in-memory response cache and the freshness
+policies used by Search to serve cached responses.
+
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from urllib.parse import urlencode
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compressor(compression, level):
+    """Return (compress, decompress) functions for a compression name."""
+    if compression == 'zlib':
+        return (lambda data: zlib.compress(data, level)), zlib.decompress
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires zstandard")
+        compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError("Unknown compression: {!r}".format(compression))
+
+
+class CachePolicy(namedtuple('CachePolicy', ['fresh', 'stale'])):
+    """How long a cached response may be served.
+
+    Attributes:
+        fresh (float): Seconds a response is served without contacting the
+            API.
+        stale (float): Further seconds a response may be served while it is
+            refreshed in the background.
+    """
+    __slots__ = ()
+
+
+class CachedResponse(object):
+    """The parts of a response needed to rebuild it from the cache.
+
+    *content* holds the body as stored, which is compressed when
+    *decompress* is set; *body* always gives the original bytes.
+    """
+
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'stored_at',
+                 'decompress', 'size')
+
+    def __init__(self, url, status_code, headers, content, stored_at=None,
+                 decompress=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.stored_at = time() if stored_at is None else stored_at
+        self.decompress = decompress
+        self.size = len(self.body)
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.url, response.status_code,
+                   dict(response.headers), response.content)
+
+    @property
+    def age(self):
+        return time() - self.stored_at
+
+    @property
+    def body(self):
+        """The response body, decompressed if it was stored compressed."""
+        if self.decompress is None:
+            return self.content
+        return self.decompress(self.content)
+
+    def to_response(self):
+        """Rebuild a :class:`requests.Response` flagged with *from_cache*."""
+        # Imported here so reading the cache alone doesn't load requests
+        import requests
+
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(
+            self.headers)
+        response._content = self.body
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        response.from_cache = True
+        return response
+
+
+def cache_key(url, params=None, headers=None):
+    """Build a cache key from a URL, its query parameters and any request
+    headers that select the representation returned.
+
+    The access token isn't part of the key. The API serves the same public
+    data to every key, so clients with different keys share entries, as do
+    entries seeded from bulk files.
+    """
+    key = url
+    if params:
+        key += '?' + urlencode(sorted(params.items()), doseq=True)
+    if headers:
+        key += '#' + urlencode(sorted(headers.items()))
+    return key
+
+
+class ResponseCache(object):
+    """A thread-safe, least recently used in-memory response cache.
+
+    Bodies can be stored compressed, which lets a *max_bytes* budget hold
+    several times as many JSON responses. *stored_bytes* and *body_bytes*
+    report the space used with and without compression.
+
+    Stale entries are refreshed on one pool of background threads shared by
+    every client using the cache, which also makes sure only one refresh of
+    a key runs at a time.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=None, compression=None,
+                 level=None):
+        """Construct a ResponseCache.
+
+        Args:
+            max_entries (Optional[int]): Entries kept before the least
+                recently used are evicted. Defaults to 10000.
+            max_bytes (Optional[int]): Stored body bytes kept before the
+                least recently used are evicted. Defaults to no limit.
+            compression (Optional[str]): ``'zlib'``, or ``'zstd'`` when
+                zstandard is installed, to store bodies compressed.
+                Defaults to None.
+            level (Optional[int]): Compression level. Defaults to 6 for zlib
+                and 3 for zstd.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.stored_bytes = 0
+        self.body_bytes = 0
+        self._compress = self._decompress = None
+        if compression is not None:
+            if level is None:
+                level = 3 if compression == 'zstd' else 6
+            self._compress, self._decompress = _compressor(compression,
+                                                           level)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._refresher_pid = None
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the CachedResponse stored under *key*, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, response):
+        """Store a response, or a CachedResponse, under *key*."""
+        if not isinstance(response, CachedResponse):
+            response = CachedResponse.from_response(response)
+        if self._compress is not None and response.decompress is None:
+            response.content = self._compress(response.content)
+            response.decompress = self._decompress
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = response
+            self.stored_bytes += len(response.content)
+            self.body_bytes += response.size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and len(self._entries) > 1
+                    and self.stored_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def values(self):
+        """Return a snapshot list of the cached entries."""
+        with self._lock:
+            return list(self._entries.values())
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stored_bytes = self.body_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.stored_bytes -= len(entry.content)
+            self.body_bytes -= entry.size
+
+    def refresh(self, key, func, args=(), workers=2):
+        """Call ``func(*args)`` in the background unless *key* is already
+        being refreshed.
+
+        Args:
+            key (str): Key of the entry being refreshed.
+            func (callable): Fetches and stores the entry.
+            args (Optional[tuple]): Arguments for *func*.
+            workers (Optional[int]): Threads in the pool, if it has to be
+                created. Defaults to 2.
+
+        Returns:
+            bool: True if a refresh was started.
+        """
+        with self._lock:
+            if self._refresher_pid != os.getpid():
+                # A forked child inherits the pool but not its threads
+                self._refresher = None
+                self._refreshing = set()
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=workers)
+                self._refresher_pid = os.getpid()
+            refresher = self._refresher
+        refresher.submit(self._run_refresh, key, func, args)
+        return True
+
+    def shutdown(self, wait=True):
+        """Stop the refresh threads, waiting for queued refreshes by
+        default."""
+        with self._lock:
+            refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            refresher.shutdown(wait=wait)
+
+    def _after_fork(self):
+        # A forked child inherits the pool but not its threads
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._refresher_pid = None
+        self._refreshing = set()
+
+    def _run_refresh(self, key, func, args):
+        try:
+            func(*args)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.changes
+~~~~~~~~~~~~~~~~~
+
+This module compares two snapshots of the same Companies House resource
+and reports the fields that changed between them.
+
+"""
+
+from collections import namedtuple
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# Paths tried, in order, to find a stable key for each item of a list, so
+# that a reordered or partly changed list is matched item by item. Officer
+# and PSC items have self links, charges ids and filings transaction ids.
+DEFAULT_ITEM_KEYS = (
+    ('links', 'self'),
+    ('links', 'officer', 'appointments'),
+    ('id',),
+    ('transaction_id',),
+)
+
+# Fields that change without the resource itself changing
+DEFAULT_IGNORE = frozenset(['etag'])
+
+
+class Change(namedtuple('Change', 'kind path old new')):
+    """A field level change between two snapshots.
+
+    *kind* is ``'added'``, ``'removed'`` or ``'changed'``. *path* is a tuple
+    of field names, with list items named by their stable key, such as
+    ``('items', '/company/00012345/charges/abc', 'status')``. *old* is None
+    for additions and *new* is None for removals.
+    """
+
+    __slots__ = ()
+
+
+def diff_snapshots(old, new, item_keys=DEFAULT_ITEM_KEYS,
+                   ignore=DEFAULT_IGNORE):
+    """Return the field level changes from *old* to *new*.
+
+    Snapshots with the same top level ``etag`` are reported unchanged
+    without being compared. Otherwise subtrees that compare equal are
+    skipped whole, so the cost is mostly in the parts that changed.
+
+    Args:
+        old (dict, Response): Earlier snapshot, as decoded JSON or a
+            response to decode. None if the resource is new.
+        new (dict, Response): Later snapshot. None if the resource has gone.
+        item_keys (Optional[tuple]): Paths tried, in order, to key list
+            items. Lists whose items can't all be given distinct keys are
+            compared as sets of values where they can be, and as a whole
+            otherwise.
+        ignore (Optional[set]): Field names skipped at every level.
+            Defaults to ``etag``.
+
+    Returns:
+        list: Change tuples, in field order.
+    """
+    old, new = _body(old), _body(new)
+    if (isinstance(old, dict) and isinstance(new, dict)
+            and old.get('etag') is not None
+            and old.get('etag') == new.get('etag')):
+        return []
+    changes = []
+    _diff(old, new, (), changes, item_keys, ignore)
+    return changes
+
+
+def _body(snapshot):
+    if snapshot is not None and callable(getattr(snapshot, 'json', None)):
+        return snapshot.json()
+    return snapshot
+
+
+def _diff(old, new, path, changes, item_keys, ignore):
+    if old is None or new is None:
+        if old is not new:
+            changes.append(Change(ADDED if old is None else REMOVED, path,
+                                  old, new))
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for name, value in old.items():
+            if name in ignore:
+                continue
+            other = new.get(name)
+            if value != other:
+                _diff(value, other, path + (name,), changes, item_keys,
+                      ignore)
+        for name, value in new.items():
+            if value is not None and name not in old and name not in ignore:
+                changes.append(Change(ADDED, path + (name,), None, value))
+    elif isinstance(old, list) and isinstance(new, list):
+        _diff_list(old, new, path, changes, item_keys, ignore)
+    elif old != new:
+        changes.append(Change(CHANGED, path, old, new))
+
+
+def _diff_list(old, new, path, changes, item_keys, ignore):
+    old_items = _keyed(old, item_keys)
+    new_items = _keyed(new, item_keys) if old_items is not None else None
+    if new_items is not None:
+        for key, item in old_items.items():
+            other = new_items.get(key)
+            if other is None:
+                changes.append(Change(REMOVED, path + (key,), item, None))
+            elif item != other:
+                _diff(item, other, path + (key,), changes, item_keys, ignore)
+        for key, item in new_items.items():
+            if key not in old_items:
+                changes.append(Change(ADDED, path + (key,), None, item))
+        return
+
+    try:
+        old_set, new_set = set(old), set(new)
+    except TypeError:
+        # Unhashable items with no stable key, so only the whole list can
+        # be compared
+        if old != new:
+            changes.append(Change(CHANGED, path, old, new))
+        return
+    for item in old:
+        if item not in new_set:
+            changes.append(Change(REMOVED, path + (item,), item, None))
+    for item in new:
+        if item not in old_set:
+            changes.append(Change(ADDED, path + (item,), None, item))
+
+
+def _keyed(items, item_keys):
+    """Map each item to its stable key, or return None if any has none."""
+    if not items or not isinstance(items[0], dict):
+        return None if items else {}
+    for key_path in item_keys:
+        keyed = {}
+        for item in items:
+            key = _lookup(item, key_path)
+            if key is None or key in keyed:
+                break
+            keyed[key] = item
+        else:
+            return keyed
+    return None
+
+
+def _lookup(item, key_path):
+    for name in key_path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(name)
+        if item is None:
+            return None
+    return item
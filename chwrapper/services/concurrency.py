@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.concurrency
+~~~~~~~~~~~~~~~~~~~~~
+
+This module provides an additive increase, multiplicative decrease (AIMD)
+controller for the number of requests kept in flight, and an ordered map
+over a thread pool that keeps a bounded number of calls in flight.
+
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import monotonic
+
+
+def ordered_map(func, items, workers=4, window=None):
+    """Yield ``func(item)`` for each of *items* in order, using threads.
+
+    Unlike :meth:`ThreadPoolExecutor.map`, items are only taken from the
+    iterable as results are consumed, so memory stays flat however many
+    there are.
+
+    Args:
+        func (callable): Called with each item.
+        items (iterable): Inputs, read lazily.
+        workers (Optional[int]): Threads calling *func*. Defaults to 4.
+        window (Optional[int]): Most calls submitted but not yet yielded.
+            Defaults to twice *workers*.
+    """
+    window = window or max(1, workers) * 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class AdaptiveConcurrency(object):
+    """Adapts the number of requests in flight to how the API is coping.
+
+    Every successful, healthy response raises the limit by ``increase /
+    limit``, so roughly ``increase`` per round trip at the current level.
+    A 429, a 5xx, a failed request or a latency spike cuts the limit by
+    ``decrease``. Cuts are applied at most once per round trip, so a burst
+    of failures from requests that were already in flight counts as a single
+    congestion event. While the rate limit headers show less than
+    ``headroom`` of the window remaining the limit is held steady.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, initial=1, minimum=1, maximum=32, increase=1.0,
+                 decrease=0.5, spike=2.0, headroom=0.1, smoothing=0.2):
+        """Construct an AdaptiveConcurrency controller.
+
+        Args:
+            initial (Optional[int]): Starting limit. Defaults to 1.
+            minimum (Optional[int]): Lowest limit. Defaults to 1.
+            maximum (Optional[int]): Highest limit. Defaults to 32.
+            increase (Optional[float]): Additive increase per round trip.
+            decrease (Optional[float]): Multiplier applied on congestion.
+            spike (Optional[float]): Latency above this multiple of the
+                smoothed latency counts as congestion. Defaults to 2.0.
+            headroom (Optional[float]): Fraction of the rate limit window
+                below which the limit stops growing. Defaults to 0.1.
+            smoothing (Optional[float]): Weight of each new latency sample
+                in the moving average. Defaults to 0.2.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.spike = spike
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.latency = None
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._hold_until = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """The current number of requests allowed in flight."""
+        return int(self._limit)
+
+    def acquire(self, timeout=None):
+        """Wait for a free slot.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait. Defaults to forever.
+
+        Returns:
+            bool: True if a slot was acquired.
+        """
+        with self._cond:
+            acquired = self._cond.wait_for(
+                lambda: self.in_flight < self.limit, timeout)
+            if acquired:
+                self.in_flight += 1
+            return acquired
+
+    def release(self, latency=None, status=None, headers=None, failed=False):
+        """Free a slot and feed back how the request went.
+
+        Args:
+            latency (Optional[float]): Seconds the request took.
+            status (Optional[int]): Response status code.
+            headers (Optional[dict]): Response headers, used for the
+                *X-Ratelimit-Remain* and *X-Ratelimit-Limit* values.
+            failed (Optional[bool]): True if the request raised before a
+                response arrived.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            spiked = self._observe_latency(latency)
+            if failed or spiked or status == 429 or (
+                    status is not None and status >= 500):
+                self._cut()
+            elif not self._low_headroom(headers):
+                self._grow()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of a request.
+
+        Yields a callable to report the response with. A request that
+        raises an HTTPError is reported with its response, any other
+        exception as failed::
+
+            with controller.slot() as done:
+                done(session.get(url))
+        """
+        self.acquire()
+        start = monotonic()
+        result = {}
+
+        def done(response):
+            result['status'] = response.status_code
+            result['headers'] = response.headers
+
+        try:
+            yield done
+        except Exception as e:
+            # HTTPErrors carry the response that caused them
+            response = getattr(e, 'response', None)
+            if response is None:
+                self.release(monotonic() - start, failed=True)
+            else:
+                self.release(monotonic() - start, response.status_code,
+                             response.headers)
+            raise
+        self.release(monotonic() - start, result.get('status'),
+                     result.get('headers'))
+
+    def _observe_latency(self, latency):
+        if latency is None:
+            return False
+        if self.latency is None:
+            self.latency = latency
+            return False
+        spiked = latency > self.latency * self.spike
+        self.latency += self.smoothing * (latency - self.latency)
+        return spiked
+
+    def _low_headroom(self, headers):
+        if not headers:
+            return False
+        try:
+            remaining = int(headers['X-Ratelimit-Remain'])
+            limit = int(headers['X-Ratelimit-Limit'])
+        except (KeyError, ValueError):
+            return False
+        return limit > 0 and remaining < limit * self.headroom
+
+    def _cut(self):
+        now = monotonic()
+        if now < self._hold_until:
+            return
+        self._limit = max(self.minimum, self._limit * self.decrease)
+        self._hold_until = now + (self.latency or 0)
+        self.decreases += 1
+
+    def _grow(self):
+        if self._limit < self.maximum:
+            self._limit = min(self.maximum,
+                              self._limit + self.increase / self._limit)
+            self.increases += 1
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.deadline
+~~~~~~~~~~~~~~~~~~
+
+This module provides the Deadline object used to bound how long a call,
+including any rate limit waits and retries, may take.
+
+"""
+
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+import requests
+
+_local = threading.local()
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a call can't complete before its deadline."""
+
+
+class Deadline(object):
+    """A point in time a call must finish by."""
+
+    def __init__(self, seconds):
+        """Construct a Deadline.
+
+        Args:
+            seconds (float): Seconds from now until the deadline.
+        """
+        self.expires = monotonic() + seconds
+
+    @classmethod
+    def coerce(cls, value):
+        """Return *value* as a Deadline, treating numbers as seconds."""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(value)
+
+    def remaining(self):
+        """Seconds left before the deadline, negative once it has passed."""
+        return self.expires - monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded("Deadline exceeded")
+
+
+def current_deadline():
+    """Return the Deadline the calling thread is working to, if any."""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Make *deadline* visible to the rate limiter for the calling thread."""
+    previous = current_deadline()
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.documents
+~~~~~~~~~~~~~~~~~~~
+
+This module downloads the documents behind filing history items, choosing
+which to fetch, and in what format, from their metadata first.
+
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import requests
+
+# Smallest and most machine readable first
+DEFAULT_PREFERENCE = (
+    'application/xhtml+xml',
+    'application/xml',
+    'application/json',
+    'text/csv',
+    'application/pdf',
+)
+
+EXTENSIONS = {
+    'application/xhtml+xml': 'xhtml',
+    'application/xml': 'xml',
+    'application/json': 'json',
+    'text/csv': 'csv',
+    'application/pdf': 'pdf',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Download(namedtuple('Download', 'item document_id content_type size '
+                                      'path skipped')):
+    """The outcome for one filing history item.
+
+    *skipped* is None for a document that was downloaded, or already had
+    been, and otherwise gives the reason, such as ``'too large'`` or the
+    status of a failed response, such as ``'429 Too Many Requests'``.
+    """
+
+    __slots__ = ()
+
+
+def _status(res):
+    return '{} {}'.format(res.status_code, res.reason or '').strip()
+
+
+def document_id(item):
+    """Return the document id for a filing history item, or None."""
+    link = (item.get('links') or {}).get('document_metadata')
+    if not link:
+        return None
+    return link.rstrip('/').rsplit('/', 1)[-1]
+
+
+class DocumentDownloader(object):
+    """Downloads the documents for selected filing history items.
+
+    Each item's metadata is fetched first, so documents of the wrong size
+    or without an acceptable format are skipped without downloading them.
+    Of the formats available the first in *prefer* is chosen. Downloads run
+    on a few threads whose clients wait on the document API's rate limit,
+    and rate limited responses are retried. Documents are streamed to disk,
+    so *max_bytes* holds even when the metadata doesn't give a size.
+    """
+
+    def __init__(self, client_factory, categories=None, types=None,
+                 max_bytes=None, prefer=DEFAULT_PREFERENCE, workers=2,
+                 retries=3, controller=None):
+        """Construct a DocumentDownloader.
+
+        Args:
+            client_factory (callable): Returns the Search client for the
+                calling thread, such as a ClientFactory.
+            categories (Optional[iterable]): Filing categories to download,
+                such as ``'accounts'``. Defaults to all.
+            types (Optional[iterable]): Filing types to download, such as
+                ``'AA'``. Defaults to all.
+            max_bytes (Optional[int]): Skip documents larger than this in
+                the chosen format, stopping a download that passes it.
+                Defaults to no limit.
+            prefer (Optional[tuple]): Acceptable content types, most
+                preferred first.
+            workers (Optional[int]): Concurrent downloads. Defaults to 2.
+            retries (Optional[int]): Retries for rate limited responses.
+                Defaults to 3.
+            controller (Optional[AdaptiveConcurrency]): Limits how many of
+                the *workers* have a request in flight. Defaults to None.
+        """
+        self.client_factory = client_factory
+        self.categories = frozenset(categories) if categories else None
+        self.types = frozenset(types) if types else None
+        self.max_bytes = max_bytes
+        self.prefer = tuple(prefer)
+        self.workers = workers
+        self.retries = retries
+        self.controller = controller
+
+    def select(self, items):
+        """Return the filing history items that pass the filters."""
+        return [item for item in items
+                if document_id(item) is not None
+                and (self.categories is None
+                     or item.get('category') in self.categories)
+                and (self.types is None or item.get('type') in self.types)]
+
+    def choose(self, metadata):
+        """Return the preferred (content_type, size) from metadata, or None.
+        """
+        resources = metadata.get('resources') or {}
+        for content_type in self.prefer:
+            if content_type in resources:
+                size = (resources[content_type] or {}).get('content_length')
+                return content_type, size
+        return None
+
+    def _call(self, method, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            res = self._send(method, *args, **kwargs)
+            if res.status_code != 429 or attempt == self.retries:
+                return res
+            res.close()
+            # The client's limiter waits for the reset when the headers give
+            # one; otherwise back off before trying again
+            if (res.headers.get('X-Ratelimit-Remain') != '0'
+                    or 'X-Ratelimit-Reset' not in res.headers):
+                sleep(2 ** attempt)
+        return res
+
+    def _send(self, method, *args, **kwargs):
+        if self.controller is None:
+            return method(*args, **kwargs)
+        with self.controller.slot() as done:
+            res = method(*args, **kwargs)
+            done(res)
+        return res
+
+    def fetch(self, item, directory):
+        """Download the document for one item into *directory*.
+
+        Files are named after the company number and transaction id, and
+        ones already present are left alone, so an interrupted run can be
+        repeated.
+
+        Returns:
+            Download
+        """
+        client = self.client_factory()
+        doc_id = document_id(item)
+        res = self._call(client.document_metadata, doc_id)
+        if res.status_code != 200:
+            return Download(item, doc_id, None, None, None, _status(res))
+        metadata = res.json()
+        chosen = self.choose(metadata)
+        if chosen is None:
+            return Download(item, doc_id, None, None, None, 'no format')
+        content_type, size = chosen
+        if (self.max_bytes is not None and size is not None
+                and size > self.max_bytes):
+            return Download(item, doc_id, content_type, size, None,
+                            'too large')
+
+        name = '{}_{}.{}'.format(
+            metadata.get('company_number', 'unknown'),
+            item.get('transaction_id', doc_id),
+            EXTENSIONS.get(content_type, 'bin'))
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return Download(item, doc_id, content_type, size, path, None)
+        res = self._call(client.document, doc_id, content_type=content_type,
+                         stream=True)
+        try:
+            if res.status_code != 200:
+                return Download(item, doc_id, content_type, size, None,
+                                _status(res))
+            written = self._write(res, path + '.part')
+        finally:
+            res.close()
+        if written is None:
+            return Download(item, doc_id, content_type, size, None,
+                            'too large')
+        os.replace(path + '.part', path)
+        return Download(item, doc_id, content_type, written, path, None)
+
+    def _write(self, res, tmp):
+        """Stream a response body to *tmp*, returning the bytes written, or
+        None after removing the file if it passed *max_bytes*."""
+        written = 0
+        with open(tmp, 'wb') as f:
+            for chunk in res.iter_content(CHUNK_SIZE):
+                written += len(chunk)
+                if self.max_bytes is not None and written > self.max_bytes:
+                    break
+                f.write(chunk)
+        if self.max_bytes is not None and written > self.max_bytes:
+            os.remove(tmp)
+            return None
+        return written
+
+    def download(self, items, directory):
+        """Download the documents for the selected *items*.
+
+        Items that fail with an HTTP error are reported as skipped with the
+        error rather than stopping the others.
+
+        Args:
+            items (iterable): Filing history items, as in the *items* of a
+                :meth:`Search.filing_history` response.
+            directory (str): Directory to write the documents to. Created if
+                it doesn't exist.
+
+        Returns:
+            list: A Download for each selected item, in order.
+        """
+        os.makedirs(directory, exist_ok=True)
+        selected = self.select(items)
+
+        def fetch(item):
+            try:
+                return self.fetch(item, directory)
+            except requests.exceptions.RequestException as e:
+                return Download(item, document_id(item), None, None, None,
+                                str(e))
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            return list(pool.map(fetch, selected))
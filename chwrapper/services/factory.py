@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.factory
+~~~~~~~~~~~~~~~~~
+
+This module provides a ClientFactory that hands out Search objects which
+are safe to use from many threads and forked worker processes.
+
+"""
+
+import os
+import threading
+import weakref
+
+from .base import RateLimiter
+from .search import Search
+from .state import DOCUMENT_HOST
+
+_factories = weakref.WeakSet()
+
+
+def _after_fork():
+    for factory in list(_factories):
+        factory._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class ClientFactory(object):
+    """Hands out one client per thread, sharing rate limit state.
+
+    Each thread gets its own client, and so its own requests session and
+    connection pool, while every client shares the factory's RateLimiters,
+    for the API and the document API, so quota is tracked once per process.
+    After a fork the child drops the clients it inherited, without closing
+    their sockets, and builds new ones on demand. Pass a ``cache`` to have
+    the clients share one ResponseCache too.
+
+    The locks of the limiters, and of any ResponseCache, CircuitBreakers,
+    DNSCache or Prefetcher passed in for the clients to share, are replaced
+    in a forked child, since a parent thread may have held them at the
+    fork.
+
+    Forked workers only share quota when the limiter has a RateLimitStore;
+    otherwise each child spends from its own copy of the parent's state.
+    """
+
+    def __init__(self, access_token=None, client_class=Search, limiter=None,
+                 document_limiter=None, **kwargs):
+        """Construct a ClientFactory.
+
+        Args:
+            access_token (str): Companies House API key passed to each
+                client. Defaults to None.
+            client_class (Optional[type]): Client to construct. Defaults to
+                Search.
+            limiter (Optional[RateLimiter]): Rate limit state shared by the
+                clients. Defaults to a new one.
+            document_limiter (Optional[RateLimiter]): Rate limit state for
+                the document API shared by the clients. Defaults to a new
+                one using *limiter*'s store.
+            kwargs (dict): additional keywords passed to each client.
+        """
+        self.access_token = access_token
+        self.client_class = client_class
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        if document_limiter is None:
+            document_limiter = RateLimiter(
+                store=self.limiter.store,
+                access_token=Search.resolve_token(access_token),
+                host=DOCUMENT_HOST)
+        self.document_limiter = document_limiter
+        self.client_kwargs = kwargs
+        self._reset()
+        _factories.add(self)
+
+    def __call__(self):
+        return self.get()
+
+    def get(self):
+        """Return the client for the calling thread, creating it if needed."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self.client_class(access_token=self.access_token,
+                                       limiter=self.limiter,
+                                       document_limiter=self.document_limiter,
+                                       **self.client_kwargs)
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def close(self):
+        """Close the sessions of every client created in this process.
+
+        Also saves the limiters' state if they have a store.
+        """
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.session.close()
+        self._local = threading.local()
+        self.limiter.save()
+        self.document_limiter.save()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._clients = []
+
+    def _after_fork(self):
+        # Only the forking thread exists in the child, so nothing can be
+        # holding the locks copied from the parent
+        self._reset()
+        self.limiter._after_fork()
+        self.document_limiter._after_fork()
+        for shared in self.client_kwargs.values():
+            if hasattr(shared, '_after_fork'):
+                shared._after_fork()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.jobqueue
+~~~~~~~~~~~~~~~~~~
+
+This module splits a large job, such as refreshing a million companies,
+into shards that workers on any number of machines lease, process and
+complete through a shared job queue.
+
+"""
+
+import json
+import sqlite3
+import uuid
+from collections import namedtuple
+from time import monotonic, sleep, time
+
+from .validators import normalise_company_numbers
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Shard(namedtuple('Shard', 'job index items token attempts')):
+    """A leased shard of a job.
+
+    *token* identifies the lease, so a worker whose lease expired and was
+    taken over can't extend the new holder's.
+    """
+
+    __slots__ = ()
+
+
+def partition(company_numbers, shard_size=1000):
+    """Split company numbers into lists of at most *shard_size*.
+
+    Numbers are normalised and de-duplicated, and invalid ones dropped, so
+    each company is in exactly one shard.
+    """
+    seen = set()
+    shard = []
+    for num in normalise_company_numbers(company_numbers, errors='coerce'):
+        if num is None or num in seen:
+            continue
+        seen.add(num)
+        shard.append(num)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+class JobQueue(object):
+    """Interface for job queue backends.
+
+    A shard is leased to one worker at a time for a visibility timeout.
+    If the worker doesn't complete it, or extend the lease, before then,
+    the shard becomes claimable again, so the work of a crashed worker is
+    picked up by the others. Completion is recorded once: completing a
+    shard that is already done changes nothing.
+    """
+
+    def create(self, job, company_numbers, shard_size=1000):
+        """Add a job's shards, returning how many were added.
+
+        Creating a job that already exists adds nothing.
+        """
+        raise NotImplementedError
+
+    def claim(self, job, visibility=300):
+        """Lease the next available shard of *job*, or return None."""
+        raise NotImplementedError
+
+    def extend(self, shard, visibility=300):
+        """Extend a lease, returning False if it's no longer held."""
+        raise NotImplementedError
+
+    def complete(self, shard, results=None):
+        """Mark a shard done and store its results.
+
+        Returns False, and stores nothing, if it was already done.
+        """
+        raise NotImplementedError
+
+    def release(self, shard, failed=False):
+        """Give up a lease early, so the shard is available again, or mark
+        it failed so it isn't retried."""
+        raise NotImplementedError
+
+    def progress(self, job):
+        """Return the number of shards in each state, by state."""
+        raise NotImplementedError
+
+    def next_expiry(self, job):
+        """Return when the first lease on a pending shard of *job* expires,
+        as a :func:`time.time` timestamp, or None if none are leased."""
+        raise NotImplementedError
+
+    def results(self, job):
+        """Yield ``(index, results)`` for each completed shard, in order."""
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """A JobQueue kept in a SQLite database.
+
+    Safe to share between threads and between processes on one machine;
+    each operation uses its own connection and transaction. Useful as a
+    local stand-in for a networked backend.
+    """
+
+    def __init__(self, path, max_attempts=None):
+        """Construct a SQLiteJobQueue.
+
+        Args:
+            path (str): Database file, created if it doesn't exist.
+            max_attempts (Optional[int]): Leases a shard gets before it's
+                marked failed rather than claimed again. Defaults to no
+                limit.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS shards ('
+                ' job TEXT NOT NULL, idx INTEGER NOT NULL,'
+                ' items TEXT NOT NULL, state TEXT NOT NULL,'
+                ' token TEXT, lease_expires REAL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0, results TEXT,'
+                ' PRIMARY KEY (job, idx))')
+            db.execute('CREATE INDEX IF NOT EXISTS shards_state'
+                       ' ON shards (job, state, lease_expires)')
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return _Transaction(db)
+
+    def create(self, job, company_numbers, shard_size=1000):
+        with self._connect() as db:
+            if db.execute('SELECT 1 FROM shards WHERE job = ? LIMIT 1',
+                          (job,)).fetchone():
+                return 0
+            rows = [(job, index, json.dumps(items), PENDING)
+                    for index, items in enumerate(
+                        partition(company_numbers, shard_size))]
+            db.executemany('INSERT INTO shards (job, idx, items, state)'
+                           ' VALUES (?, ?, ?, ?)', rows)
+            return len(rows)
+
+    def claim(self, job, visibility=300):
+        now = time()
+        with self._connect() as db:
+            if self.max_attempts is not None:
+                db.execute(
+                    'UPDATE shards SET state = ?, token = NULL'
+                    ' WHERE job = ? AND state = ? AND attempts >= ?'
+                    ' AND (lease_expires IS NULL OR lease_expires <= ?)',
+                    (FAILED, job, PENDING, self.max_attempts, now))
+            row = db.execute(
+                'SELECT idx, items, attempts FROM shards'
+                ' WHERE job = ? AND state = ?'
+                ' AND (lease_expires IS NULL OR lease_expires <= ?)'
+                ' ORDER BY idx LIMIT 1', (job, PENDING, now)).fetchone()
+            if row is None:
+                return None
+            index, items, attempts = row
+            token = uuid.uuid4().hex
+            db.execute('UPDATE shards SET token = ?, lease_expires = ?,'
+                       ' attempts = ? WHERE job = ? AND idx = ?',
+                       (token, now + visibility, attempts + 1, job, index))
+        return Shard(job, index, json.loads(items), token, attempts + 1)
+
+    def extend(self, shard, visibility=300):
+        with self._connect() as db:
+            cursor = db.execute(
+                'UPDATE shards SET lease_expires = ?'
+                ' WHERE job = ? AND idx = ? AND token = ? AND state = ?',
+                (time() + visibility, shard.job, shard.index, shard.token,
+                 PENDING))
+            return cursor.rowcount == 1
+
+    def complete(self, shard, results=None):
+        with self._connect() as db:
+            cursor = db.execute(
+                'UPDATE shards SET state = ?, results = ?, token = NULL,'
+                ' lease_expires = NULL WHERE job = ? AND idx = ?'
+                ' AND state = ?',
+                (DONE, json.dumps(results), shard.job, shard.index, PENDING))
+            return cursor.rowcount == 1
+
+    def release(self, shard, failed=False):
+        with self._connect() as db:
+            db.execute(
+                'UPDATE shards SET state = ?, token = NULL,'
+                ' lease_expires = NULL'
+                ' WHERE job = ? AND idx = ? AND token = ? AND state = ?',
+                (FAILED if failed else PENDING, shard.job, shard.index,
+                 shard.token, PENDING))
+
+    def progress(self, job):
+        with self._connect() as db:
+            rows = db.execute('SELECT state, COUNT(*) FROM shards'
+                              ' WHERE job = ? GROUP BY state', (job,))
+            counts = {PENDING: 0, DONE: 0, FAILED: 0}
+            counts.update(rows.fetchall())
+            return counts
+
+    def next_expiry(self, job):
+        with self._connect() as db:
+            return db.execute('SELECT MIN(lease_expires) FROM shards'
+                              ' WHERE job = ? AND state = ?',
+                              (job, PENDING)).fetchone()[0]
+
+    def results(self, job):
+        with self._connect() as db:
+            rows = db.execute('SELECT idx, results FROM shards'
+                              ' WHERE job = ? AND state = ? ORDER BY idx',
+                              (job, DONE)).fetchall()
+        for index, results in rows:
+            yield index, json.loads(results)
+
+
+class _Transaction(object):
+    """Runs a connection's statements in one immediate transaction, so
+    claims by concurrent workers can't pick the same shard."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.db.close()
+
+
+def run_worker(queue, job, func, visibility=300, max_shards=None,
+               wait=True, poll=5):
+    """Claim and process shards of *job* until every shard is done or
+    failed.
+
+    Each company number in a shard is passed to *func*, and the results
+    stored with the shard's completion. The lease is extended whenever
+    half of it has gone, so slow shards aren't taken over while they're
+    still being worked on. A shard whose *func* raises is released for
+    another attempt and the exception re-raised.
+
+    While the only pending shards are leased to other workers, the worker
+    waits for them, so it takes over the shard of a worker that crashed
+    once that lease expires.
+
+    Args:
+        queue (JobQueue): Queue holding the job.
+        job (str): Job name.
+        func (callable): Called with each company number, such as
+            ``lambda num: client.profile(num).json()``. Its return value
+            must be JSON serialisable.
+        visibility (Optional[float]): Lease length in seconds. Defaults to
+            300.
+        max_shards (Optional[int]): Stop after this many shards.
+        wait (Optional[bool]): Wait for leased shards rather than
+            returning as soon as none can be claimed. Defaults to True.
+        poll (Optional[float]): Longest wait, in seconds, before checking
+            again whether a leased shard was completed or released.
+            Defaults to 5.
+
+    Returns:
+        int: Shards this worker completed.
+    """
+    completed = 0
+    while max_shards is None or completed < max_shards:
+        shard = queue.claim(job, visibility)
+        if shard is None:
+            if not wait or not queue.progress(job)[PENDING]:
+                break
+            expires = queue.next_expiry(job)
+            delay = poll if expires is None else expires - time()
+            sleep(min(max(delay, 0), poll))
+            continue
+        leased = monotonic()
+        results = {}
+        try:
+            for num in shard.items:
+                if monotonic() - leased > visibility / 2:
+                    if not queue.extend(shard, visibility):
+                        # Taken over by another worker
+                        break
+                    leased = monotonic()
+                results[num] = func(num)
+            else:
+                if queue.complete(shard, results):
+                    completed += 1
+        except BaseException:
+            queue.release(shard)
+            raise
+    return completed
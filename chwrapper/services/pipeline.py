@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.pipeline
+~~~~~~~~~~~~~~~~~~
+
+This module chains stages of work, such as search, profile and officers
+lookups, with bounded queues between them so a slow stage holds back the
+ones before it rather than letting work pile up in memory.
+
+"""
+
+import asyncio
+import inspect
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from .resources import checked
+
+# Marks the end of a stage's input
+_DONE = object()
+
+# Seconds between checks for cancellation while blocked on a queue
+_POLL = 0.1
+
+
+class StageMetrics(object):
+    """Counters for one stage, safe to read while the pipeline runs."""
+
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.emitted = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started = None
+        self._lock = threading.Lock()
+
+    def _record(self, seconds, emitted=0, failed=False):
+        with self._lock:
+            self.busy += seconds
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+                self.emitted += emitted
+
+    @property
+    def throughput(self):
+        """Items processed per second since the pipeline started."""
+        if self.started is None:
+            return 0.0
+        elapsed = monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        with self._lock:
+            return {'received': self.received, 'processed': self.processed,
+                    'emitted': self.emitted, 'failed': self.failed,
+                    'busy': self.busy, 'throughput': self.throughput}
+
+
+class Stage(object):
+    """One step of a Pipeline.
+
+    *func* is called with each item and its return value is passed on, or
+    dropped if it's None. With *flat* the return value is iterated and each
+    element passed on, so a search stage can fan out into its results.
+    *func* may be a coroutine function when the pipeline runs on asyncio.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None, flat=False):
+        """Construct a Stage.
+
+        Args:
+            name (str): Name the stage's metrics are reported under.
+            func (callable): Called with each item.
+            workers (Optional[int]): Items processed at once. Defaults to 1.
+            queue_size (Optional[int]): Items waiting for the stage before
+                earlier stages block. Defaults to twice *workers*.
+            flat (Optional[bool]): Pass on each element of the results.
+                Defaults to False.
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or 2 * self.workers
+        self.flat = flat
+        self.metrics = StageMetrics()
+
+    def _outputs(self, result):
+        if result is None:
+            return []
+        return list(result) if self.flat else [result]
+
+
+def search_stage(client_factory, endpoint, workers=4, name=None,
+                 items=False, retries=3, controller=None, **kwargs):
+    """Return a Stage calling a Search method and passing on its JSON.
+
+    Args:
+        client_factory (callable): Returns the Search client for the calling
+            thread, such as a ClientFactory.
+        endpoint (str): Name of the Search method, such as ``'profile'``.
+        workers (Optional[int]): Calls in flight at once. Defaults to 4.
+        name (Optional[str]): Stage name. Defaults to *endpoint*.
+        items (Optional[bool]): Pass on each of the response's *items*,
+            as from a search, rather than the whole response. Defaults to
+            False.
+        retries (Optional[int]): Retries for rate limited responses.
+            Defaults to 3.
+        controller (Optional[AdaptiveConcurrency]): Limits how many of the
+            *workers* have a call in flight, and may be shared with other
+            stages. Defaults to None.
+        **kwargs: Passed to the Search method with each item.
+
+    A 429 returned while rate limiting, once the limiter has waited for
+    the window to reset, is retried. A response other than a 200 after
+    that raises HTTPError so it counts as a failed item.
+    """
+    def send(method, item):
+        if controller is None:
+            return method(item, **kwargs)
+        with controller.slot() as done:
+            res = method(item, **kwargs)
+            done(res)
+        return res
+
+    def call(item):
+        method = getattr(client_factory(), endpoint)
+        for _ in range(retries + 1):
+            res = send(method, item)
+            if res.status_code != 429:
+                break
+        body = checked(res).json()
+        return body.get('items', []) if items else body
+
+    return Stage(name or endpoint, call, workers=workers, flat=items)
+
+
+class Pipeline(object):
+    """Runs items through a chain of Stages.
+
+    Each stage has its own workers and a bounded queue in front of it, and
+    results come out of the last stage as they're ready, not in input
+    order. Runs on threads with :meth:`run` or on an asyncio event loop
+    with :meth:`run_async`, where stages with plain functions run on a
+    thread pool of the stage's size.
+    """
+
+    def __init__(self, stages, errors='raise'):
+        """Construct a Pipeline.
+
+        Args:
+            stages (list): Stages, in order.
+            errors (Optional[str]): ``'raise'`` to stop the pipeline and
+                raise the first exception from a stage, or ``'skip'`` to
+                count it in the stage's metrics and drop the item. Defaults
+                to ``'raise'``.
+
+        Raises:
+            ValueError: If there are no stages or *errors* is unknown.
+        """
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        if errors not in ('raise', 'skip'):
+            raise ValueError("errors must be 'raise' or 'skip'")
+        self.stages = list(stages)
+        self.errors = errors
+        self._cancelled = threading.Event()
+        self._error = None
+        self._queues = []
+
+    def cancel(self):
+        """Stop the pipeline. Items already in it are dropped."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def metrics(self):
+        """Return each stage's metrics and queue length, by stage name."""
+        metrics = {}
+        for stage, inbox in zip(self.stages, self._queues):
+            metrics[stage.name] = stage.metrics.as_dict()
+            metrics[stage.name]['queued'] = inbox.qsize()
+        return metrics
+
+    def _start(self, make_queue):
+        self._cancelled.clear()
+        self._error = None
+        self._queues = [make_queue(stage.queue_size)
+                        for stage in self.stages]
+        self._queues.append(make_queue(self.stages[-1].queue_size))
+        now = monotonic()
+        for stage in self.stages:
+            stage.metrics = StageMetrics()
+            stage.metrics.started = now
+
+    def _fail(self, error, always=False):
+        if always or self.errors == 'raise':
+            if self._error is None:
+                self._error = error
+            self.cancel()
+
+    def _next_workers(self, index):
+        if index + 1 < len(self.stages):
+            return self.stages[index + 1].workers
+        return 1
+
+    # Threads
+
+    def _put(self, inbox, item):
+        while not self.cancelled:
+            try:
+                inbox.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, inbox):
+        while not self.cancelled:
+            try:
+                return inbox.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _feed(self, source):
+        try:
+            for item in source:
+                if not self._put(self._queues[0], item):
+                    return
+        except Exception as e:  # pylint: disable=broad-except
+            # A broken source stops the pipeline whatever *errors* says
+            self._fail(e, always=True)
+            return
+        for _ in range(self.stages[0].workers):
+            self._put(self._queues[0], _DONE)
+
+    def _work(self, index, running, lock):
+        stage = self.stages[index]
+        inbox, outbox = self._queues[index], self._queues[index + 1]
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    return
+                with stage.metrics._lock:
+                    stage.metrics.received += 1
+                started = monotonic()
+                try:
+                    outputs = stage._outputs(stage.func(item))
+                except Exception as e:  # pylint: disable=broad-except
+                    stage.metrics._record(monotonic() - started, failed=True)
+                    self._fail(e)
+                    continue
+                stage.metrics._record(monotonic() - started, len(outputs))
+                for output in outputs:
+                    if not self._put(outbox, output):
+                        return
+        finally:
+            with lock:
+                running[index] -= 1
+                last = running[index] == 0
+            if last:
+                for _ in range(self._next_workers(index)):
+                    self._put(outbox, _DONE)
+
+    def run(self, source):
+        """Run *source* through the pipeline on threads.
+
+        Args:
+            source (iterable): Items for the first stage. Read only as
+                fast as the first stage's queue has room.
+
+        Yields:
+            The results of the last stage, as they're ready. Closing the
+            generator early cancels the pipeline.
+
+        Raises:
+            Exception: The first exception from a stage, with
+                ``errors='raise'``.
+        """
+        self._start(queue.Queue)
+        lock = threading.Lock()
+        running = [stage.workers for stage in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(source,),
+                                    daemon=True)]
+        for index, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=self._work,
+                                 args=(index, running, lock), daemon=True)
+                for _ in range(stage.workers))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(self._queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.cancel()
+            for thread in threads:
+                thread.join()
+
+    # asyncio
+
+    async def _aput(self, inbox, item):
+        while not self.cancelled:
+            try:
+                await asyncio.wait_for(inbox.put(item), _POLL)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+    async def _aget(self, inbox):
+        while not self.cancelled:
+            try:
+                return await asyncio.wait_for(inbox.get(), _POLL)
+            except asyncio.TimeoutError:
+                pass
+        return _DONE
+
+    async def _afeed(self, source):
+        try:
+            if hasattr(source, '__aiter__'):
+                async for item in source:
+                    if not await self._aput(self._queues[0], item):
+                        return
+            else:
+                for item in source:
+                    if not await self._aput(self._queues[0], item):
+                        return
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(e, always=True)
+            return
+        for _ in range(self.stages[0].workers):
+            await self._aput(self._queues[0], _DONE)
+
+    async def _awork(self, index, running, executor):
+        stage = self.stages[index]
+        inbox, outbox = self._queues[index], self._queues[index + 1]
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                item = await self._aget(inbox)
+                if item is _DONE:
+                    return
+                stage.metrics.received += 1
+                started = monotonic()
+                try:
+                    if inspect.iscoroutinefunction(stage.func):
+                        result = await stage.func(item)
+                    else:
+                        result = await loop.run_in_executor(
+                            executor, stage.func, item)
+                    outputs = stage._outputs(result)
+                except Exception as e:  # pylint: disable=broad-except
+                    stage.metrics._record(monotonic() - started, failed=True)
+                    self._fail(e)
+                    continue
+                stage.metrics._record(monotonic() - started, len(outputs))
+                for output in outputs:
+                    if not await self._aput(outbox, output):
+                        return
+        finally:
+            running[index] -= 1
+            if running[index] == 0 and not self.cancelled:
+                for _ in range(self._next_workers(index)):
+                    await self._aput(outbox, _DONE)
+
+    async def run_async(self, source):
+        """Run *source* through the pipeline on the running event loop.
+
+        Args:
+            source (iterable): Items for the first stage, from an iterable
+                or an async iterable.
+
+        Yields:
+            The results of the last stage, as they're ready. Closing the
+            generator early cancels the pipeline.
+
+        Raises:
+            Exception: The first exception from a stage, with
+                ``errors='raise'``.
+        """
+        self._start(asyncio.Queue)
+        running = [stage.workers for stage in self.stages]
+        executors = [ThreadPoolExecutor(max_workers=stage.workers)
+                     for stage in self.stages]
+        tasks = [asyncio.ensure_future(self._afeed(source))]
+        for index, stage in enumerate(self.stages):
+            tasks.extend(
+                asyncio.ensure_future(
+                    self._awork(index, running, executors[index]))
+                for _ in range(stage.workers))
+        try:
+            while True:
+                item = await self._aget(self._queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for executor in executors:
+                executor.shutdown(wait=False)
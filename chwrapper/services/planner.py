@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.planner
+~~~~~~~~~~~~~~~~~
+
+This module estimates how many calls a bulk job will make, and how long
+the rate limit will make it take, before it is run.
+
+"""
+
+import math
+import threading
+from collections import namedtuple
+from time import time
+
+import requests
+
+from .cache import CachePolicy
+from .transport import Transport, _build_response
+from .validators import InvalidIdentifier
+
+# Endpoints whose responses are pages of a longer list
+PAGED_ENDPOINTS = frozenset([
+    'officers', 'filing_history', 'charges', 'persons_significant_control',
+    'appointments', 'search_companies', 'search_officers',
+])
+
+DEFAULT_LIMIT = 600
+DEFAULT_WINDOW = 300
+
+
+class EndpointPlan(namedtuple('EndpointPlan',
+                              'inputs invalid cached calls pages')):
+    """The estimate for one endpoint.
+
+    *cached* inputs have a fresh first page in the cache, *pages* is the
+    mean number of pages per input, and *calls* counts every request still
+    needed, including later pages.
+    """
+
+    __slots__ = ()
+
+
+class Plan(namedtuple('Plan', 'calls probe_calls seconds endpoints')):
+    """The estimate for a whole job.
+
+    *probe_calls* were made while planning and aren't included in *calls*.
+    *seconds* is the estimated wall-clock time, and *endpoints* maps each
+    endpoint name to its EndpointPlan.
+    """
+
+    __slots__ = ()
+
+    def as_dict(self):
+        return {'calls': self.calls, 'probe_calls': self.probe_calls,
+                'seconds': self.seconds,
+                'endpoints': {name: plan._asdict()
+                              for name, plan in self.endpoints.items()}}
+
+
+class _DryRunTransport(Transport):
+    """Counts requests and answers them all with an empty 204."""
+
+    def __init__(self):
+        super(_DryRunTransport, self).__init__()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return _build_response(self, request, 204, {}, b'')
+
+
+class JobPlanner(object):
+    """Estimates the calls and time a bulk job over Search endpoints needs.
+
+    Each input is run through a copy of the client whose requests go
+    nowhere, so cache lookups, identifier validation and cache policies
+    apply exactly as they would in the job. Responses that would be served
+    stale and refreshed in the background count as calls, since the
+    refresh is one.
+    """
+
+    def __init__(self, client, keys=1, workers=4, latency=0.25,
+                 window=DEFAULT_WINDOW, limit=DEFAULT_LIMIT):
+        """Construct a JobPlanner.
+
+        Args:
+            client (Search): Client the job will use. Its cache and rate
+                limiter state are read, and probes are made with it.
+            keys (Optional[int]): API keys the job spreads its calls over,
+                each with its own rate limit. Defaults to 1.
+            workers (Optional[int]): Requests the job has in flight at once.
+                Defaults to 4.
+            latency (Optional[float]): Expected seconds per request.
+                Defaults to 0.25.
+            window (Optional[int]): Rate limit window in seconds. Defaults
+                to 300.
+            limit (Optional[int]): Calls allowed per key per window, when
+                the limiter hasn't seen one yet. Defaults to 600.
+        """
+        self.client = client
+        self.keys = keys
+        self.workers = workers
+        self.latency = latency
+        self.window = window
+        self.limit = limit
+
+    def plan(self, inputs, endpoints, probes=10, paginate=True):
+        """Estimate a job calling each of *endpoints* for every input.
+
+        Args:
+            inputs (iterable): Company numbers, officer ids or search terms.
+            endpoints (list): Names of Search methods, such as
+                ``'profile'``.
+            probes (Optional[int]): Inputs per paged endpoint fetched for
+                real to read ``total_results`` and estimate pages per
+                input. Cached responses are used where available. 0 makes
+                no requests and assumes one page. Defaults to 10.
+            paginate (Optional[bool]): Whether the job fetches every page
+                of paged endpoints, rather than just the first. Defaults to
+                True.
+
+        Returns:
+            Plan
+        """
+        inputs = [value for value in (str(v).strip() for v in inputs)
+                  if value]
+        probe_calls = 0
+        plans = {}
+        for endpoint in endpoints:
+            pages = 1.0
+            if paginate and endpoint in PAGED_ENDPOINTS and probes:
+                pages, calls = self._probe(endpoint, inputs[:probes])
+                probe_calls += calls
+            plans[endpoint] = self._plan_endpoint(endpoint, inputs, pages)
+        calls = sum(plan.calls for plan in plans.values())
+        return Plan(calls, probe_calls, self.estimate_seconds(calls), plans)
+
+    def _plan_endpoint(self, endpoint, inputs, pages):
+        transport = _DryRunTransport()
+        client = self._dry_client(transport)
+        method = getattr(client, endpoint)
+        invalid = cached = 0
+        for value in inputs:
+            before = transport.calls
+            try:
+                method(value)
+            except InvalidIdentifier:
+                invalid += 1
+                continue
+            if transport.calls == before:
+                cached += 1
+        valid = len(inputs) - invalid
+        # Later pages aren't looked up, so are assumed not to be cached
+        calls = transport.calls + int(round((pages - 1) * valid))
+        return EndpointPlan(len(inputs), invalid, cached, calls, pages)
+
+    def _dry_client(self, transport):
+        client = self.client
+        # Stale responses are counted as the calls their refresh would make
+        policies = {name: None if policy is None else
+                    CachePolicy(policy.fresh, 0)
+                    for name, policy in client.cache_policies.items()}
+        return client.__class__(rate_limit=False, validate=client.validate,
+                                cache=client.cache,
+                                cache_policy=CachePolicy(
+                                    client.cache_policy.fresh, 0),
+                                cache_policies=policies, transport=transport)
+
+    def _probe(self, endpoint, values):
+        """Return the mean pages per input and the requests made."""
+        method = getattr(self.client, endpoint)
+        before = self.client.stats.requests
+        pages = []
+        for value in values:
+            try:
+                body = method(value).json()
+            except (InvalidIdentifier, requests.exceptions.HTTPError,
+                    ValueError):
+                continue
+            total = body.get('total_results', body.get('total_count'))
+            if total is None:
+                continue
+            per_page = body.get('items_per_page') or len(
+                body.get('items') or ()) or 1
+            pages.append(max(1, math.ceil(total / per_page)))
+        mean = sum(pages) / len(pages) if pages else 1.0
+        return mean, self.client.stats.requests - before
+
+    def estimate_seconds(self, calls):
+        """Estimate the wall-clock seconds *calls* requests will take.
+
+        Calls left in the limiter's current window are spent first, then
+        each further window allows *limit* calls per key.
+        """
+        limiter = self.client.limiter
+        limit = limiter.limit or self.limit
+        per_window = limit * self.keys
+        now = time()
+        if (limiter.reset is not None and limiter.reset > now
+                and limiter.remaining is not None):
+            first = limiter.remaining + limit * (self.keys - 1)
+            until_reset = limiter.reset - now
+        else:
+            first, until_reset = per_window, self.window
+        busy = calls * self.latency / max(1, self.workers)
+        if calls <= first:
+            return busy
+        windows = math.ceil((calls - first) / per_window)
+        return max(busy, until_reset + (windows - 1) * self.window)
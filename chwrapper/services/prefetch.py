@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.prefetch
+~~~~~~~~~~~~~~~~~~
+
+This module provides a Prefetcher that fetches the resources linked from a
+company profile into the cache before they are asked for.
+
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Maps profile link names to the Search method whose cache policy applies
+LINK_ENDPOINTS = {
+    'officers': 'officers',
+    'filing_history': 'filing_history',
+    'charges': 'charges',
+    'persons_with_significant_control': 'persons_significant_control',
+    'persons_with_significant_control_statements':
+        'persons_significant_control',
+    'insolvency': 'insolvency',
+    'registered_office_address': 'address',
+}
+
+DEFAULT_LINKS = ('officers', 'filing_history', 'charges',
+                 'persons_with_significant_control', 'insolvency')
+
+
+class Prefetcher(object):
+    """Fetches a profile's linked resources into the cache in the background.
+
+    Prefetching stops whenever the shared RateLimiter shows fewer than
+    *min_remaining* calls left in the current window, so it never eats into
+    the quota the caller needs for its own requests.
+    """
+
+    def __init__(self, links=DEFAULT_LINKS, min_remaining=100, workers=4,
+                 controller=None):
+        """Construct a Prefetcher.
+
+        Args:
+            links (Optional[iterable]): Names of the profile ``links`` to
+                prefetch. Defaults to officers, filing history, charges,
+                persons with significant control and insolvency.
+            min_remaining (Optional[int]): Calls to leave in the rate limit
+                window. Defaults to 100.
+            workers (Optional[int]): Links fetched concurrently.
+            controller (Optional[AdaptiveConcurrency]): Limits how many of
+                the *workers* have a request in flight, and may be shared
+                with the caller's own requests. Defaults to None.
+        """
+        unknown = set(links) - set(LINK_ENDPOINTS)
+        if unknown:
+            msg = "Unknown link types: {}".format(", ".join(sorted(unknown)))
+            raise ValueError(msg)
+        self.links = tuple(links)
+        self.min_remaining = min_remaining
+        self.workers = workers
+        self.controller = controller
+        self.fetched = 0
+        self.skipped = 0
+        self._pool = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def has_headroom(self, limiter):
+        """Return True if the limiter can spare a call for prefetching."""
+        return limiter.remaining is None or (
+            limiter.remaining > self.min_remaining)
+
+    def submit(self, client, profile):
+        """Queue the linked resources of a profile response body."""
+        links = profile.get('links', {}) if isinstance(profile, dict) else {}
+        for name in self.links:
+            path = links.get(name)
+            if not path:
+                continue
+            url = client._BASE_URI + path.lstrip('/')
+            with self._lock:
+                if url in self._pending:
+                    continue
+                self._pending.add(url)
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            self._pool.submit(self._fetch, client, url, LINK_ENDPOINTS[name])
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads, waiting for queued links by default."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _after_fork(self):
+        # The pool's threads, and the links they were fetching, stay in
+        # the parent
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = set()
+
+    def _fetch(self, client, url, endpoint):
+        try:
+            if not self.has_headroom(client.limiter):
+                with self._lock:
+                    self.skipped += 1
+                return
+            if self.controller is None:
+                made = client._prefetch(url, endpoint)
+            else:
+                with self.controller.slot():
+                    made = client._prefetch(url, endpoint)
+            if made:
+                with self._lock:
+                    self.fetched += 1
+        except Exception:  # pylint: disable=broad-except
+            # Prefetching is best effort; the caller fetches it if needed
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(url)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.replay
+~~~~~~~~~~~~~~~~
+
+This module records the traffic sent through a transport into an archive
+and replays it later, offline: the responses with their recorded latency,
+and the requests at the times they were sent.
+
+"""
+
+import base64
+import gzip
+import json
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep, time
+
+import requests
+
+from .transport import (RequestsTransport, Transport, _build_response,
+                        _route)
+
+# Headers describing the body as sent, which no longer apply once it's
+# been decoded for the archive
+_BODY_HEADERS = frozenset(['content-encoding', 'content-length',
+                           'transfer-encoding'])
+
+_RESET_HEADER = 'x-ratelimit-reset'
+
+
+class Exchange(namedtuple('Exchange',
+                          'offset elapsed method url status headers body')):
+    """A recorded request and its response.
+
+    *offset* is when the request was sent, in seconds from the start of the
+    recording, and *elapsed* how long the response took. *url* is the path
+    and sorted query string, without the access token.
+    """
+
+    __slots__ = ()
+
+
+class TrafficArchive(object):
+    """A list of recorded exchanges, saved as gzipped JSON lines."""
+
+    def __init__(self, exchanges=None, started=None):
+        """Construct a TrafficArchive.
+
+        Args:
+            exchanges (Optional[list]): Exchange tuples, in offset order.
+            started (Optional[float]): Unix time the recording started.
+                Defaults to now.
+        """
+        self.exchanges = list(exchanges or [])
+        self.started = time() if started is None else started
+
+    def __len__(self):
+        return len(self.exchanges)
+
+    def save(self, path):
+        """Write the archive to *path*."""
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'started': self.started}) + '\n')
+            for exchange in sorted(self.exchanges, key=lambda e: e.offset):
+                record = exchange._asdict()
+                record['body'] = base64.b64encode(exchange.body).decode(
+                    'ascii')
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    @classmethod
+    def load(cls, path):
+        """Read an archive written by :meth:`save`."""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            archive = cls(started=json.loads(f.readline())['started'])
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    record['body'] = base64.b64decode(record['body'])
+                    archive.exchanges.append(Exchange(**record))
+        return archive
+
+
+class RecordingTransport(Transport):
+    """Passes requests on to another transport, recording each exchange.
+
+    Bodies are recorded decoded, and access tokens are left out of the
+    recorded URLs. Safe to share between threads.
+    """
+
+    def __init__(self, transport=None):
+        """Construct a RecordingTransport.
+
+        Args:
+            transport (Optional[Transport]): Sends the requests. Defaults to
+                a new RequestsTransport.
+        """
+        super(RecordingTransport, self).__init__()
+        self.transport = (transport if transport is not None
+                          else RequestsTransport())
+        self.archive = TrafficArchive()
+        self._started = monotonic()
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        sent = monotonic()
+        response = self.transport.send(request, **kwargs)
+        body = response.content
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in _BODY_HEADERS}
+        exchange = Exchange(sent - self._started, monotonic() - sent,
+                            request.method, _route(request.url),
+                            response.status_code, headers, body)
+        with self._lock:
+            self.archive.exchanges.append(exchange)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """Plays back the responses in a TrafficArchive.
+
+    Requests are matched on method, path and query, ignoring the access
+    token. Repeats of a request get its recorded responses in order, with
+    the last one repeated once they run out; unrecorded requests get 404s.
+
+    Each response takes its recorded time, divided by *speed*, and rate
+    limit reset times are moved to the same point in the replay, so the
+    client's limiter sees the windows it saw when recording. Safe to share
+    between threads.
+
+    The transport only answers requests; use :func:`replay_traffic` to send
+    the recorded requests at their recorded times as well.
+    """
+
+    def __init__(self, archive, speed=1.0):
+        """Construct a ReplayTransport.
+
+        Args:
+            archive (TrafficArchive, str): Archive, or the path of one.
+            speed (Optional[float]): How many times faster than recorded to
+                play back. None returns responses without any delay.
+                Defaults to 1.0.
+        """
+        super(ReplayTransport, self).__init__()
+        if not isinstance(archive, TrafficArchive):
+            archive = TrafficArchive.load(archive)
+        self.archive = archive
+        self.speed = speed
+        self.calls = 0
+        self._queues = {}
+        for exchange in archive.exchanges:
+            self._queues.setdefault((exchange.method, exchange.url),
+                                    deque()).append(exchange)
+        self._started = time()
+        self._lock = threading.Lock()
+
+    def _replay_time(self, timestamp):
+        offset = timestamp - self.archive.started
+        if self.speed:
+            offset /= self.speed
+        # Never in the past, which the rate limiter would refuse to wait for
+        return max(int(self._started + offset), int(time()))
+
+    def send(self, request, **kwargs):
+        key = (request.method, _route(request.url))
+        with self._lock:
+            self.calls += 1
+            queue = self._queues.get(key)
+            exchange = None
+            if queue:
+                exchange = queue.popleft() if len(queue) > 1 else queue[0]
+        if exchange is None:
+            return _build_response(self, request, 404, {}, b'')
+
+        if self.speed:
+            sleep(exchange.elapsed / self.speed)
+        headers = dict(exchange.headers)
+        for name, value in exchange.headers.items():
+            if name.lower() == _RESET_HEADER:
+                headers[name] = str(self._replay_time(int(value)))
+        return _build_response(self, request, exchange.status, headers,
+                               exchange.body)
+
+
+def replay_traffic(client_factory, archive, speed=1.0, workers=16):
+    """Send the requests in an archive at the times they were recorded.
+
+    Each request is sent at its recorded offset divided by *speed*, so the
+    bursts and gaps of the recording are reproduced, and requests that
+    overlapped then overlap again. With a ReplayTransport answering them
+    this plays back the recorded traffic offline; with a live client it
+    sends the same load to the API. Requests go through each client's
+    session, and so its rate limiter, but not its cache.
+
+    Args:
+        client_factory (callable): Returns the Search client for the
+            calling thread, such as a ClientFactory.
+        archive (TrafficArchive, str): Archive, or the path of one.
+        speed (Optional[float]): How many times faster than recorded to
+            send the requests. None sends each one as soon as a worker is
+            free. Defaults to 1.0.
+        workers (Optional[int]): Most requests in flight at once. Defaults
+            to 16.
+
+    Returns:
+        list: The response to each request, in the order they were sent,
+        or the RequestException it raised.
+    """
+    if not isinstance(archive, TrafficArchive):
+        archive = TrafficArchive.load(archive)
+
+    def send(exchange):
+        client = client_factory()
+        base = (client._DOCUMENT_URI if exchange.url.startswith('/document/')
+                else client._BASE_URI)
+        try:
+            return client.session.request(exchange.method,
+                                          base + exchange.url.lstrip('/'))
+        except requests.exceptions.RequestException as e:
+            return e
+
+    started = monotonic()
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for exchange in sorted(archive.exchanges, key=lambda e: e.offset):
+            if speed:
+                delay = started + exchange.offset / speed - monotonic()
+                if delay > 0:
+                    sleep(delay)
+            futures.append(pool.submit(send, exchange))
+    return [future.result() for future in futures]
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.resolve
+~~~~~~~~~~~~~~~~~
+
+This module resolves free-text company names to company numbers against a
+local trigram index, falling back to the search API only for names the
+index can't resolve confidently.
+
+"""
+
+import json
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+from collections import namedtuple
+
+from .concurrency import ordered_map
+
+Match = namedtuple('Match', ['key', 'name', 'score'])
+
+Resolution = namedtuple(
+    'Resolution',
+    ['query', 'key', 'name', 'score', 'source', 'candidates'])
+Resolution.__doc__ = """The outcome of resolving one name.
+
+*key* and *name* are None when nothing matched well enough. *source* is
+``'index'`` or ``'api'`` for a match and None otherwise, and *score* runs
+from 0 to 1.
+"""
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_REPLACEMENTS = [
+    (re.compile(r"\bCOMPANY\b"), "CO"),
+    (re.compile(r"\bLIMITED\b"), "LTD"),
+]
+# Legal form suffixes are common to so many names that they only add noise
+_SUFFIX = re.compile(
+    r"(?:\s(?:PUBLIC LTD CO|LTD|PLC|LLP|LP|CIC|CYF|CYFYNGEDIG|CCC|UNLTD))+$")
+
+
+def normalise_name(name):
+    """Normalise a company name for matching.
+
+    Case, punctuation, ``&``/``AND``, ``LIMITED``/``LTD`` and trailing legal
+    form suffixes are all ignored.
+    """
+    name = name.upper().replace('&', ' AND ').replace('.', '')
+    name = _PUNCTUATION.sub(' ', name)
+    for pattern, replacement in _REPLACEMENTS:
+        name = pattern.sub(replacement, name)
+    name = _WHITESPACE.sub(' ', name).strip()
+    return _SUFFIX.sub('', name) or name
+
+
+def trigrams(name):
+    """Return the set of character trigrams of a normalised name."""
+    padded = '  ' + name + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex(object):
+    """An in-memory trigram index of company names.
+
+    Each name's trigrams are stored in compact posting arrays, and
+    candidates are scored by the Dice coefficient of their trigram sets.
+    Safe to share between threads.
+
+    Trigrams of words such as HOLDINGS or SERVICES are in a large share of
+    all names, so walking their postings would dominate every lookup.
+    Candidates are instead shortlisted from a query's rarer trigrams, and
+    only the shortlist is checked against the common ones, which gives
+    their exact scores. A name sharing nothing but common trigrams with
+    the query isn't considered unless every trigram of the query is
+    common, when the rarest one is used to shortlist.
+    """
+
+    def __init__(self, common=0.02, min_common=1000, shortlist=200):
+        """Construct a NameIndex.
+
+        Args:
+            common (Optional[float]): Share of the names a trigram must be
+                in to count as common. Defaults to 0.02.
+            min_common (Optional[int]): Names a trigram must be in to count
+                as common however small the index. Defaults to 1000.
+            shortlist (Optional[int]): Candidates with the most rare
+                trigrams in common that are scored. Defaults to 200.
+        """
+        self.common = common
+        self.min_common = min_common
+        self.shortlist = shortlist
+        self.keys = []
+        self.names = []
+        self._sizes = array('I')
+        self._postings = {}
+        self._known = {}
+        self._removed = set()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.keys) - len(self._removed)
+
+    def add(self, name, key):
+        """Add a name for *key*, ignoring exact duplicates."""
+        normalised = normalise_name(name)
+        grams = trigrams(normalised)
+        with self._lock:
+            if (normalised, key) in self._known:
+                return
+            doc = len(self.keys)
+            self._known[(normalised, key)] = doc
+            self.keys.append(key)
+            self.names.append(name)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('I')
+                posting.append(doc)
+
+    def discard(self, name, key):
+        """Stop matching *name* for *key*, if it was added."""
+        normalised = normalise_name(name)
+        with self._lock:
+            doc = self._known.pop((normalised, key), None)
+            if doc is not None:
+                # Postings are append only, so the entry is skipped instead
+                self._removed.add(doc)
+
+    def add_records(self, records, name_field='CompanyName',
+                    key_field='CompanyNumber'):
+        """Add names from an iterable of dicts, such as bulk company data.
+
+        The defaults match the columns of the Companies House basic company
+        data CSV, so rows from :class:`csv.DictReader` can be passed in.
+        """
+        for record in records:
+            name = record.get(name_field)
+            key = record.get(key_field)
+            if name and key:
+                self.add(name, key.strip())
+
+    def add_search_results(self, results):
+        """Add the companies in a ``search_companies`` response body."""
+        for item in results.get('items', []):
+            if item.get('company_number') and item.get('title'):
+                self.add(item['title'], item['company_number'])
+
+    def add_cache(self, cache):
+        """Add every company search result held in a ResponseCache."""
+        for entry in cache.values():
+            if entry.status_code != 200:
+                continue
+            try:
+                body = json.loads(entry.body.decode('utf-8'))
+            except ValueError:
+                continue
+            if isinstance(body, dict):
+                self.add_search_results(body)
+
+    def candidates(self, name, limit=5):
+        """Return up to *limit* Matches for *name*, best first."""
+        grams = trigrams(normalise_name(name))
+        with self._lock:
+            postings = sorted((self._postings[gram] for gram in grams
+                               if gram in self._postings), key=len)
+            cutoff = max(self.min_common, int(self.common * len(self.keys)))
+        rare = [posting for posting in postings if len(posting) <= cutoff]
+        common = postings[len(rare or postings[:1]):]
+        # Scored without the lock: the arrays are only ever appended to, in
+        # increasing document order, and a document's key, name and size are
+        # added before its postings.
+        overlaps = {}
+        removed = self._removed
+        for posting in rare or postings[:1]:
+            for doc in posting:
+                if doc not in removed:
+                    overlaps[doc] = overlaps.get(doc, 0) + 1
+        if common:
+            if len(overlaps) > self.shortlist:
+                overlaps = {doc: overlaps[doc] for doc in nlargest(
+                    self.shortlist, overlaps, key=overlaps.get)}
+            for doc in overlaps:
+                for posting in common:
+                    i = bisect_left(posting, doc)
+                    if i < len(posting) and posting[i] == doc:
+                        overlaps[doc] += 1
+        scored = [
+            (2.0 * overlap / (len(grams) + self._sizes[doc]), doc)
+            for doc, overlap in overlaps.items()]
+        scored.sort(reverse=True)
+        return [Match(self.keys[doc], self.names[doc], score)
+                for score, doc in scored[:limit]]
+
+
+class EntityResolver(object):
+    """Resolves names locally, calling the API only when unsure.
+
+    A name resolves from the index when its best candidate scores at least
+    *threshold* and beats the best candidate for a different company by
+    *margin*. Otherwise ``search_companies`` is called, its results are
+    added to the index, and the name is scored again against them.
+    """
+
+    def __init__(self, index=None, client=None, threshold=0.85, margin=0.05,
+                 workers=4):
+        """Construct an EntityResolver.
+
+        Args:
+            index (Optional[NameIndex]): Index to resolve against. Defaults
+                to an empty one.
+            client (Optional[Search, callable]): Search client used for
+                unresolved names, or a callable returning one per thread
+                such as a ClientFactory. Defaults to None, which never
+                calls the API.
+            threshold (Optional[float]): Lowest score accepted as a match.
+            margin (Optional[float]): Lead needed over the best rival.
+            workers (Optional[int]): Threads used by :meth:`resolve_many`.
+        """
+        self.index = index if index is not None else NameIndex()
+        if client is None or callable(client):
+            self._client = client
+        else:
+            self._client = lambda: client
+        self.threshold = threshold
+        self.margin = margin
+        self.workers = workers
+
+    def resolve(self, name):
+        """Resolve a single name, returning a Resolution."""
+        candidates = self.index.candidates(name)
+        match = self._confident(candidates)
+        if match is not None:
+            return Resolution(name, match.key, match.name, match.score,
+                              'index', candidates)
+        if self._client is None:
+            return Resolution(name, None, None, _top_score(candidates), None,
+                              candidates)
+
+        res = self._client().search_companies(name)
+        if res.status_code == 200:
+            self.index.add_search_results(res.json())
+            candidates = self.index.candidates(name)
+            match = self._confident(candidates)
+            if match is not None:
+                return Resolution(name, match.key, match.name, match.score,
+                                  'api', candidates)
+        return Resolution(name, None, None, _top_score(candidates), None,
+                          candidates)
+
+    def resolve_many(self, names):
+        """Resolve an iterable of names in parallel, in input order.
+
+        Names are read from the iterable as results are consumed, so it can
+        be a file of millions of lines.
+        """
+        return ordered_map(self.resolve, names, self.workers)
+
+    def _confident(self, candidates):
+        if not candidates or candidates[0].score < self.threshold:
+            return None
+        best = candidates[0]
+        for rival in candidates[1:]:
+            if rival.key != best.key:
+                if best.score - rival.score < self.margin:
+                    return None
+                break
+        return best
+
+
+def _top_score(candidates):
+    return candidates[0].score if candidates else 0.0
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.resources
+~~~~~~~~~~~~~~~~~~~
+
+This module wraps API responses in Resource objects whose related
+resources are fetched lazily by following the response ``links``.
+
+"""
+
+import requests
+
+from .prefetch import LINK_ENDPOINTS
+
+# Search methods whose cache policies apply to document links
+DOCUMENT_LINK_ENDPOINTS = {
+    'document_metadata': 'document_metadata',
+    'document': 'document',
+}
+
+# Friendlier names for links whose API names are long-winded
+LINK_ALIASES = {
+    'document': 'document_metadata',
+    'psc': 'persons_with_significant_control',
+}
+
+
+def checked(res):
+    """Return *res*, raising HTTPError unless it's a 200.
+
+    With rate limiting on, a Search client returns 429 responses rather
+    than raising, and their error bodies mustn't be taken for the resource.
+    """
+    if res.status_code != 200:
+        res.raise_for_status()
+        msg = "Unexpected {} response for url: {}".format(res.status_code,
+                                                          res.url)
+        raise requests.exceptions.HTTPError(msg, response=res)
+    return res
+
+
+class Resource(object):
+    """An API response body whose links resolve on first access.
+
+    Attribute access checks the body's ``links`` first, so
+    ``profile.officers`` fetches the company's officers through the same
+    client, with its cache and rate limiter, and keeps the result for later
+    accesses. Other attributes return the body's own fields, with nested
+    objects wrapped as Resources so their links resolve in the same way::
+
+        >>> profile = s.company("00000006")
+        >>> profile.company_name
+        'MARINE AND GENERAL MUTUAL LIFE ASSURANCE SOCIETY'
+        >>> [o.name for o in profile.officers.items]
+        [...]
+    """
+
+    def __init__(self, client, data, response=None):
+        self._client = client
+        self._data = data
+        self._response = response
+        self._resolved = {}
+
+    def __repr__(self):
+        return '<Resource {}>'.format(self.self_link or self._data.get('kind'))
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        links = self._data.get('links') or {}
+        for link in (LINK_ALIASES.get(name), name):
+            if link is not None and link != 'self' and link in links:
+                return self.resolve(link)
+        if name in self._data:
+            return self._wrap(self._data[name])
+        raise AttributeError(
+            "{!r} has no field or link {!r}".format(self, name))
+
+    @property
+    def data(self):
+        """The response body as a dict."""
+        return self._data
+
+    @property
+    def response(self):
+        """The :class:`requests.Response` the body came from, if any."""
+        return self._response
+
+    @property
+    def self_link(self):
+        return (self._data.get('links') or {}).get('self')
+
+    def resolve(self, link):
+        """Follow the link called *link*, memoising the result.
+
+        Returns a Resource for JSON responses and the
+        :class:`requests.Response` itself for anything else, such as
+        document content. Failed responses raise HTTPError and aren't
+        memoised, so the next access tries again.
+        """
+        if link not in self._resolved:
+            target = self._data['links'][link]
+            if isinstance(target, dict):
+                # Grouped links, such as an appointment's officer links
+                resource = Resource(self._client, {'links': target})
+            else:
+                endpoint = LINK_ENDPOINTS.get(
+                    link, DOCUMENT_LINK_ENDPOINTS.get(link))
+                res = checked(self._client.follow(target, endpoint=endpoint))
+                if 'json' in res.headers.get('Content-Type', ''):
+                    resource = Resource(self._client, res.json(), res)
+                else:
+                    # Document content is returned as the raw response
+                    resource = res
+            self._resolved[link] = resource
+        return self._resolved[link]
+
+    def _wrap(self, value):
+        if isinstance(value, dict):
+            return Resource(self._client, value)
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        return value
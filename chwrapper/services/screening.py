@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.screening
+~~~~~~~~~~~~~~~~~~~
+
+This module screens people against a local mirror of disqualified officers,
+calling the API only to confirm likely hits.
+
+"""
+
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+import requests
+
+from .concurrency import ordered_map
+from .resolve import NameIndex
+
+ScreeningHit = namedtuple(
+    'ScreeningHit', ['officer_id', 'natural', 'name', 'score', 'dob_match',
+                     'record'])
+ScreeningHit.__doc__ = """A disqualified officer who may match a screened
+person.
+
+*dob_match* is ``'exact'``, ``'partial'`` when only the year and month
+agree, or None when either date of birth is unknown.
+"""
+
+
+def _officer_link(record):
+    """Split a record's self link into (officer id, natural)."""
+    link = record.get('links', {}).get('self', '')
+    parts = link.strip('/').split('/')
+    if len(parts) != 3 or parts[0] != 'disqualified-officers':
+        return None, None
+    return parts[2], parts[1] == 'natural'
+
+
+def _dob_match(wanted, record_dob):
+    if not wanted or not record_dob:
+        return None
+    if isinstance(record_dob, dict):
+        # Officer style partial dates, e.g. {'year': 1970, 'month': 1}
+        record_dob = '{:04d}-{:02d}'.format(record_dob.get('year', 0),
+                                            record_dob.get('month', 0))
+    wanted = str(wanted)
+    if wanted == record_dob:
+        return 'exact'
+    if wanted[:7] == record_dob[:7]:
+        return 'partial'
+    return False
+
+
+class DisqualifiedIndex(object):
+    """A local mirror of disqualified officer search records.
+
+    Records are keyed by officer id, so loading the same officer again
+    replaces the stored record only if it has changed. Safe to share
+    between threads.
+    """
+
+    def __init__(self, threshold=0.8):
+        """Construct a DisqualifiedIndex.
+
+        Args:
+            threshold (Optional[float]): Lowest name score reported as a
+                hit. Defaults to 0.8.
+        """
+        self.threshold = threshold
+        self.records = {}
+        self._names = NameIndex()
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def upsert(self, record):
+        """Add or update one search record.
+
+        Returns:
+            bool: True if the record was new or had changed.
+        """
+        officer_id, _ = _officer_link(record)
+        if officer_id is None or not record.get('title'):
+            return False
+        digest = hashlib.sha1(
+            json.dumps(record, sort_keys=True).encode('utf-8')).digest()
+        with self._lock:
+            if self._digests.get(officer_id) == digest:
+                return False
+            self._digests[officer_id] = digest
+            previous = self.records.get(officer_id)
+            self.records[officer_id] = record
+            if previous is not None and previous['title'] != record['title']:
+                # Renamed, so screening mustn't keep matching the old name
+                self._names.discard(previous['title'], officer_id)
+            self._names.add(record['title'], officer_id)
+        return True
+
+    def refresh(self, client, terms, page_size=100, stop_after=None):
+        """Mirror the disqualified officers matching each search term.
+
+        Only new or changed records are written, so refreshing with the
+        same terms again is cheap on the index. It isn't on the API: by
+        default every page of every term's results is fetched again. With
+        *stop_after*, a term stops being paged once that many pages in a
+        row bring nothing new or changed. Results are ordered by relevance
+        rather than date, so this can miss changes further down, and a full
+        refresh is still needed now and then.
+
+        Args:
+            client (Search): Client used to search.
+            terms (iterable): Names or surnames to search for.
+            page_size (Optional[int]): Results per call, up to 100.
+            stop_after (Optional[int]): Unchanged pages in a row after
+                which a term stops being paged. Defaults to None, to fetch
+                every page.
+
+        Returns:
+            int: The number of new or changed records.
+        """
+        changed = 0
+        for term in terms:
+            unchanged = 0
+            page_changed = False
+            results = client.iter_search_officers(
+                term, disqualified=True, page_size=page_size)
+            for count, record in enumerate(results, 1):
+                if self.upsert(record):
+                    changed += 1
+                    page_changed = True
+                if count % page_size == 0:
+                    unchanged = 0 if page_changed else unchanged + 1
+                    page_changed = False
+                    if stop_after is not None and unchanged >= stop_after:
+                        break
+        return changed
+
+    def screen(self, name, date_of_birth=None, limit=5):
+        """Screen one person against the mirror.
+
+        Args:
+            name (str): Name to screen.
+            date_of_birth (Optional[str]): ISO date, or year and month, used
+                to rule out officers with a different date of birth.
+            limit (Optional[int]): Most hits returned.
+
+        Returns:
+            list: ScreeningHits, best first.
+        """
+        hits = []
+        for match in self._names.candidates(name, limit=limit * 2):
+            if match.score < self.threshold:
+                break
+            record = self.records[match.key]
+            dob = _dob_match(date_of_birth, record.get('date_of_birth'))
+            if dob is False:
+                continue
+            _, natural = _officer_link(record)
+            hits.append(ScreeningHit(match.key, natural, record['title'],
+                                     match.score, dob, record))
+        return hits[:limit]
+
+    def screen_many(self, people, workers=4):
+        """Screen ``(name, date_of_birth)`` pairs in parallel, in order.
+
+        Pairs are read from *people* as results are consumed.
+        """
+        return ordered_map(lambda p: self.screen(*p), people, workers)
+
+    def confirm(self, client, hit):
+        """Fetch the live disqualification record for a hit.
+
+        Returns:
+            dict: The record, or None if it is no longer published.
+        """
+        try:
+            res = client.disqualified(hit.officer_id, natural=hit.natural)
+            res.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        return res.json()
+
+    def save(self, path):
+        """Write the mirror to *path* as JSON lines."""
+        with open(path, 'w') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record) + '\n')
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Read a mirror written by :meth:`save`."""
+        index = cls(**kwargs)
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    index.upsert(json.loads(line))
+        return index
@@ -29,49 +29,513 @@ This module provides a Search object to query the Companies House API.
 
 """
 
-from .base import Service
+from datetime import date
+import re
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+from .base import RateLimiter, Service
+from .breaker import CircuitOpenError
+from .cache import CachePolicy, cache_key
+from .deadline import Deadline, deadline_scope
+from .resources import Resource, checked
+from .state import DOCUMENT_HOST
+from .stats import ClientStats
+from .validators import normalise_company_number, normalise_officer_id
+from .warmup import instrument, warm
+
+# Document links name the front end host, such as frontend-doc-api, but
+# the same paths are served by the document API
+_DOCUMENT_PATH = re.compile(r'^/document/[^/]+(?:/content)?/?$')
+
+DEFAULT_POLICY = CachePolicy(fresh=300, stale=0)
+DEFAULT_TIMEOUT = (3.05, 30)
+
+
+def _bound_timeout(timeout, remaining):
+    """Cap a requests style timeout at *remaining* seconds."""
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining)
+                     for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
 
 
 class Search(Service):
     """Provides an interface to the Companies House API via a Search object."""
 
-    def __init__(self, access_token=None, rate_limit=True):
+    def __init__(self, access_token=None, rate_limit=True, validate=True,
+                 limiter=None, cache=None, cache_policy=DEFAULT_POLICY,
+                 cache_policies=None, refresh_workers=2, breakers=None,
+                 timeout=DEFAULT_TIMEOUT, prefetcher=None, transport=None,
+                 warm_connections=0, dns_cache=None, store=None,
+                 document_limiter=None):
         """Construct a Search object.
 
+        A Search object holds a single requests session and shouldn't be
+        shared between threads or processes. Use
+        :class:`~chwrapper.services.factory.ClientFactory` to get a client
+        per thread that shares rate limit state with the others.
+
         Args:
             access_token (str): A valid Companies House API. If an
                 access token isn't specified then looks for *CompaniesHouseKey*
                 or COMPANIES_HOUSE_KEY environment variables. Defaults to None.
+            validate (Optional[bool]): Normalise company numbers and officer
+                ids before they're sent, raising InvalidIdentifier for
+                malformed ones. Defaults to True.
+            limiter (Optional[RateLimiter]): Rate limit state to share with
+                other clients using the same key. Defaults to a new one.
+            cache (Optional[ResponseCache]): Cache for successful responses.
+                Defaults to None, which disables caching.
+            cache_policy (Optional[CachePolicy]): Freshness policy for
+                endpoints without their own entry in *cache_policies*.
+            cache_policies (Optional[dict]): Maps method names, such as
+                ``'profile'``, to a CachePolicy, or to None to never cache
+                that endpoint. Documents aren't cached unless given a policy.
+            refresh_workers (Optional[int]): Threads used to refresh stale
+                responses in the background, if the cache hasn't started
+                its shared pool already. Defaults to 2.
+            breakers (Optional[CircuitBreakers]): Per-host circuit breakers.
+                While a host's circuit is open requests to it raise
+                CircuitOpenError at once, or are served from the cache
+                whatever their age when a cached copy exists. Defaults to
+                None.
+            timeout (Optional[float, tuple]): Default connect and read
+                timeouts in seconds, as for requests. Defaults to
+                ``(3.05, 30)``; None waits forever.
+            prefetcher (Optional[Prefetcher]): Fetches the resources linked
+                from each company profile into the cache in the background.
+                Requires a *cache*. Defaults to None.
+            transport (Optional[Transport]): Sends the requests, such as a
+                :class:`~chwrapper.services.transport.StubTransport` for
+                tests without a network. Defaults to requests' own adapter.
+            warm_connections (Optional[int]): Keep-alive connections opened
+                to the API and document hosts before the first request, so
+                it doesn't wait on DNS, TCP and TLS setup. Defaults to 0.
+            dns_cache (Optional[DNSCache]): Reuses host lookups for its TTL,
+                and can be shared between clients. Defaults to None, which
+                looks the host up for each new connection.
+            store (Optional[RateLimitStore]): Saves the new limiter's state
+                so a restarted process carries on from it. Can't be used
+                with *limiter*, which takes its own store. Defaults to None.
+            document_limiter (Optional[RateLimiter]): Rate limit state for
+                the document API, to share with other clients. Defaults to
+                a new one.
         """
         super(Search, self).__init__()
-        self.session = self.get_session(access_token=access_token,
-                                        rate_limit=rate_limit)
+        if limiter is not None and store is not None:
+            raise ValueError("Pass the store to the limiter instead")
+        token = self.resolve_token(access_token)
+        if limiter is None:
+            limiter = RateLimiter(store=store, access_token=token)
+        if document_limiter is None:
+            document_limiter = RateLimiter(store=limiter.store,
+                                           access_token=token,
+                                           host=DOCUMENT_HOST)
+        self.limiter = limiter
+        self.document_limiter = document_limiter
+        self.breakers = breakers
+        self._session_args = dict(access_token=access_token,
+                                  rate_limit=rate_limit,
+                                  limiter=self.limiter,
+                                  breakers=breakers,
+                                  transport=transport,
+                                  document_limiter=self.document_limiter)
+        self.session = self.get_session(**self._session_args)
+        self.validate = validate
+        self.timeout = timeout
+        self.cache = cache
+        self.cache_policy = cache_policy
+        self.cache_policies = {'document': None}
+        self.cache_policies.update(cache_policies or {})
+        if prefetcher is not None and cache is None:
+            raise ValueError("Prefetching requires a cache")
+        self.prefetcher = prefetcher
+        self.stats = ClientStats()
+        self.refresh_workers = refresh_workers
+        self.dns_cache = dns_cache
+        self._instrument(self.session)
+        if warm_connections:
+            connect = timeout[0] if isinstance(timeout, tuple) else timeout
+            warm(self.session, (self._BASE_URI, self._DOCUMENT_URI),
+                 connections=warm_connections, timeout=connect)
+        self._refresh_local = threading.local()
         self._ignore_codes = []
         if rate_limit:
             self._ignore_codes.append(429)
 
-    def search_companies(self, term, **kwargs):
+    def _get(self, url, params=None, endpoint=None, deadline=None,
+             headers=None):
+        """Get *url*, serving it from the cache where the policy allows.
+
+        A response younger than the policy's *fresh* age is returned without
+        a request. One within the further *stale* window is returned at once
+        and refreshed in the background, so callers never wait on the API
+        for it.
+        """
+        deadline = Deadline.coerce(deadline)
+        policy = self.cache_policies.get(endpoint, self.cache_policy)
+        if self.cache is None or policy is None:
+            return self._fetch(self.session, url, params, deadline, headers)
+
+        key = cache_key(url, params, headers)
+        entry = self.cache.get(key)
+        if entry is not None:
+            age = entry.age
+            if age <= policy.fresh:
+                self.stats.record_cache_hit()
+                return entry.to_response()
+            if age <= policy.fresh + policy.stale:
+                self._refresh(key, url, params, headers)
+                self.stats.record_cache_hit()
+                return entry.to_response()
+
+        try:
+            res = self._fetch(self.session, url, params, deadline, headers)
+        except CircuitOpenError:
+            if entry is None:
+                raise
+            return entry.to_response()
+        self._store(key, res)
+        return res
+
+    def _fetch(self, session, url, params=None, deadline=None,
+               headers=None, stream=False):
+        timeout = self.timeout
+        if deadline is not None:
+            deadline.check()
+            timeout = _bound_timeout(timeout, deadline.remaining())
+        with deadline_scope(deadline):
+            res = session.get(url, params=params, headers=headers,
+                              timeout=timeout, stream=stream)
+        self.stats.record_response(res, streamed=stream)
+        self.handle_http_error(res)
+        return res
+
+    def _store(self, key, res):
+        if res.status_code == 200:
+            self.cache.set(key, res)
+
+    def _refresh(self, key, url, params, headers=None):
+        self.cache.refresh(key, self._background_refresh,
+                           (key, url, dict(params or {}), headers),
+                           workers=self.refresh_workers)
+
+    def _instrument(self, session):
+        instrument(session, (self._BASE_URI, self._DOCUMENT_URI),
+                   dns_cache=self.dns_cache,
+                   on_handshake=self.stats.record_handshake)
+
+    def _background_session(self):
+        # Background threads get their own session rather than sharing the
+        # caller's, which may be in use at the same time.
+        session = getattr(self._refresh_local, 'session', None)
+        if session is None:
+            session = self.get_session(**self._session_args)
+            self._instrument(session)
+            self._refresh_local.session = session
+        return session
+
+    def _background_refresh(self, key, url, params, headers=None):
+        try:
+            self._store(key, self._fetch(self._background_session(), url,
+                                         params, headers=headers))
+        except Exception:  # pylint: disable=broad-except
+            # The stale copy keeps being served until a refresh succeeds
+            pass
+
+    def _prefetch(self, url, endpoint):
+        """Fetch *url* into the cache unless a fresh copy is already there.
+
+        Returns True if a request was made.
+        """
+        policy = self.cache_policies.get(endpoint, self.cache_policy)
+        if policy is None:
+            return False
+        key = cache_key(url)
+        entry = self.cache.get(key)
+        if entry is not None and entry.age <= policy.fresh:
+            return False
+        self._store(key, self._fetch(self._background_session(), url))
+        return True
+
+    def _company_number(self, num):
+        return normalise_company_number(num) if self.validate else num
+
+    def _officer_id(self, num):
+        return normalise_officer_id(num) if self.validate else num
+
+    def follow(self, link, endpoint=None, deadline=None, **kwargs):
+        """Get a resource by a link taken from another response.
+
+        Args:
+          link (str): A path such as ``/company/00000006/officers`` or a
+            full URL, as found in a response's ``links``. Document links
+            on any host are sent to the document API, whose paths they
+            share. Other full URLs must be on the API or document host,
+            since the access token is sent with the request.
+          endpoint (Optional[str]): Search method name whose cache policy
+            applies. Defaults to ``'document'`` or
+            ``'document_metadata'`` for document links and otherwise
+            None, for the default policy.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
+          kwargs (dict): additional keywords passed into
+            requests.session.get *params* keyword.
+        """
+        if link.startswith('https://') or link.startswith('http://'):
+            path = urlsplit(link).path
+            if _DOCUMENT_PATH.match(path):
+                baseuri = self._DOCUMENT_URI + path.strip('/')
+            elif link.startswith((self._BASE_URI, self._DOCUMENT_URI)):
+                baseuri = link
+            else:
+                msg = "Not an API or document link: {}".format(link)
+                raise ValueError(msg)
+            if endpoint is None and baseuri.startswith(self._DOCUMENT_URI):
+                endpoint = ('document' if path.rstrip('/').endswith(
+                    '/content') else 'document_metadata')
+        else:
+            baseuri = self._BASE_URI + link.lstrip('/')
+        return self._get(baseuri, kwargs, endpoint, deadline=deadline)
+
+    def company(self, num, deadline=None):
+        """Get a company profile as a Resource with lazily followed links.
+
+        Args:
+          num (str): Company number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
+        """
+        res = checked(self.profile(num, deadline=deadline))
+        return Resource(self, res.json(), res)
+
+    def search_companies(self, term, deadline=None, **kwargs):
         """Search for companies by name.
 
         Args:
           term (str): Company name to search on
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
             requests.session.get params keyword.
         """
         params = kwargs
         params['q'] = term
         baseuri = self._BASE_URI + 'search/companies'
-        res = self.session.get(baseuri, params=params)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, params, 'search_companies',
+                         deadline=deadline)
+
+    def advanced_search(self, deadline=None, **kwargs):
+        """Search for companies using the advanced search filters.
+
+        List values, such as several SIC codes or statuses, are sent comma
+        separated and dates may be given as :class:`datetime.date` objects.
+
+        Args:
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
+          kwargs (dict): advanced search filters passed into
+            requests.session.get params keyword, e.g. *company_name_includes*,
+            *company_status*, *company_type*, *sic_codes*,
+            *incorporated_from*, *incorporated_to*, *location*, *size* and
+            *start_index*.
+        """
+        params = self._filter_params(kwargs)
+        baseuri = self._BASE_URI + 'advanced-search/companies'
+        return self._get(baseuri, params, 'advanced_search', deadline=deadline)
+
+    def alphabetical_search(self, term, deadline=None, **kwargs):
+        """Search for companies alphabetically by name.
+
+        Args:
+          term (str): Company name to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
+          kwargs (dict): additional keywords passed into
+            requests.session.get params keyword, e.g. *search_above*,
+            *search_below* and *size*.
+        """
+        params = kwargs
+        params['q'] = term
+        baseuri = self._BASE_URI + 'alphabetical-search/companies'
+        return self._get(baseuri, params, 'alphabetical_search',
+                         deadline=deadline)
+
+    def dissolved_search(self, term, search_type='best-match', deadline=None,
+                         **kwargs):
+        """Search for dissolved companies by name.
+
+        Args:
+          term (str): Company name to search on.
+          search_type (Optional[str]): One of 'best-match', 'alphabetical'
+            or 'previous-name-dissolved'. Defaults to 'best-match'.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
+          kwargs (dict): additional keywords passed into
+            requests.session.get params keyword.
+        """
+        params = kwargs
+        params['q'] = term
+        params['search_type'] = search_type
+        baseuri = self._BASE_URI + 'dissolved-search/companies'
+        return self._get(baseuri, params, 'dissolved_search',
+                         deadline=deadline)
+
+    def iter_advanced_search(self, page_size=5000, max_results=None,
+                             **kwargs):
+        """Yield every company matching the advanced search filters.
+
+        Pages are requested lazily, so only as many calls are made as the
+        caller consumes.
+
+        Args:
+          page_size (Optional[int]): Results per call, up to 5000.
+          max_results (Optional[int]): Stop after this many results.
+          kwargs (dict): filters passed to :meth:`advanced_search`. A
+            *deadline* applies to each page.
+        """
+        return self._paginate(self.advanced_search, page_size, max_results,
+                              **kwargs)
+
+    def iter_search_officers(self, term, disqualified=False, page_size=100,
+                             max_results=None, **kwargs):
+        """Yield every officer matching *term*.
 
-    def search_officers(self, term, disqualified=False, **kwargs):
+        Args:
+          term (str): Officer name to search on.
+          disqualified (Optional[bool]): True to search for disqualified
+            officers
+          page_size (Optional[int]): Results per call, up to 100.
+          max_results (Optional[int]): Stop after this many results.
+          kwargs (dict): additional keywords passed to
+            :meth:`search_officers`. A *deadline* applies to each page.
+        """
+        return self._paginate(self.search_officers, page_size, max_results,
+                              size_param='items_per_page', term=term,
+                              disqualified=disqualified, **kwargs)
+
+    def iter_dissolved_search(self, term, search_type='best-match',
+                              page_size=100, max_results=None, **kwargs):
+        """Yield every dissolved company matching *term*.
+
+        The ``'alphabetical'`` search type is paged by key, as in
+        :meth:`iter_alphabetical_search`, and the others by offset.
+
+        Args:
+          term (str): Company name to search on.
+          search_type (Optional[str]): See :meth:`dissolved_search`.
+          page_size (Optional[int]): Results per call, up to 100.
+          max_results (Optional[int]): Stop after this many results.
+          kwargs (dict): additional keywords passed to
+            :meth:`dissolved_search`. A *deadline* applies to each page.
+        """
+        if search_type == 'alphabetical':
+            return self._paginate_by_key(self.dissolved_search, page_size,
+                                         max_results, term=term,
+                                         search_type=search_type, **kwargs)
+        return self._paginate(self.dissolved_search, page_size, max_results,
+                              term=term, search_type=search_type, **kwargs)
+
+    def iter_alphabetical_search(self, term, page_size=100,
+                                 max_results=None, **kwargs):
+        """Yield companies in alphabetical order, starting at *term*.
+
+        The alphabetical index is paged by key rather than by offset, so
+        each call continues below the last company returned.
+
+        Args:
+          term (str): Company name to start from.
+          page_size (Optional[int]): Results per call, up to 100.
+          max_results (Optional[int]): Stop after this many results.
+          kwargs (dict): additional keywords passed to
+            :meth:`alphabetical_search`. A *deadline* applies to each page.
+        """
+        return self._paginate_by_key(self.alphabetical_search, page_size,
+                                     max_results, term=term, **kwargs)
+
+    def _paginate_by_key(self, fetch, page_size, max_results, **kwargs):
+        count = 0
+        while max_results is None or count < max_results:
+            res = self._fetch_page(fetch, size=page_size, **kwargs)
+            if res is None:
+                return
+            items = res.json().get('items', [])
+            for item in items:
+                yield item
+                count += 1
+                if max_results is not None and count >= max_results:
+                    return
+            if len(items) < page_size:
+                return
+            kwargs['search_below'] = items[-1]['ordered_alpha_key_with_id']
+            kwargs.pop('search_above', None)
+
+    def _paginate(self, fetch, page_size, max_results, size_param='size',
+                  **kwargs):
+        start_index = kwargs.pop('start_index', 0)
+        kwargs[size_param] = page_size
+        count = 0
+        while max_results is None or count < max_results:
+            res = self._fetch_page(fetch, start_index=start_index, **kwargs)
+            if res is None:
+                return
+            data = res.json()
+            items = data.get('items', [])
+            for item in items:
+                yield item
+                count += 1
+                if max_results is not None and count >= max_results:
+                    return
+            start_index += len(items)
+            total = data.get('hits', data.get('total_results'))
+            if len(items) < page_size or (total is not None and
+                                          start_index >= total):
+                return
+
+    def _fetch_page(self, fetch, retries=3, **kwargs):
+        """Fetch one page, retrying pages the rate limiter swallowed.
+
+        Any deadline covers the page including its retries. Returns None
+        once the API reports there are no more results.
+        """
+        kwargs['deadline'] = Deadline.coerce(kwargs.get('deadline'))
+        for _ in range(retries + 1):
+            try:
+                res = fetch(**kwargs)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    return None
+                raise
+            if res.status_code != 429:
+                return res
+        res.raise_for_status()
+
+    @staticmethod
+    def _filter_params(filters):
+        params = {}
+        for key, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, date):
+                value = value.isoformat()
+            elif isinstance(value, (list, tuple, set)):
+                value = ','.join(str(v) for v in value)
+            params[key] = value
+        return params
+
+    def search_officers(self, term, disqualified=False, deadline=None,
+                        **kwargs):
         """Search for officers by name.
 
         Args:
           term (str): Officer name to search on.
           disqualified (Optional[bool]): True to search for disqualified
             officers
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
             requests.session.get params keyword.
         """
@@ -80,106 +544,112 @@ class Search(Service):
         params = kwargs
         params['q'] = term
         baseuri = self._BASE_URI + 'search/{}'.format(search_type)
-        res = self.session.get(baseuri, params=params)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, params, 'search_officers', deadline=deadline)
 
-    def appointments(self, num, **kwargs):
+    def appointments(self, num, deadline=None, **kwargs):
         """Search for officer appointments by officer number.
 
         Args:
           num (str): Officer number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
           requests.session.get params keyword.
         """
-        baseuri = self._BASE_URI + 'officers/{}/appointments'.format(num)
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        baseuri = self._BASE_URI + 'officers/{}/appointments'.format(
+            self._officer_id(num))
+        return self._get(baseuri, kwargs, 'appointments', deadline=deadline)
 
-    def address(self, num):
+    def address(self, num, deadline=None):
         """Search for company addresses by company number.
 
         Args:
           num (str): Company number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
         """
         url_root = "company/{}/registered-office-address"
-        baseuri = self._BASE_URI + url_root.format(num)
-        res = self.session.get(baseuri)
-        self.handle_http_error(res)
-        return res
+        baseuri = self._BASE_URI + url_root.format(self._company_number(num))
+        return self._get(baseuri, endpoint='address', deadline=deadline)
 
-    def profile(self, num):
+    def profile(self, num, deadline=None):
         """Search for company profile by company number.
 
         Args:
           num (str): Company number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
         """
-        baseuri = self._BASE_URI + "company/{}".format(num)
-        res = self.session.get(baseuri)
-        self.handle_http_error(res)
+        baseuri = self._BASE_URI + "company/{}".format(
+            self._company_number(num))
+        res = self._get(baseuri, endpoint='profile', deadline=deadline)
+        if self.prefetcher is not None and res.status_code == 200:
+            self.prefetcher.submit(self, res.json())
         return res
 
-    def insolvency(self, num):
+    def insolvency(self, num, deadline=None):
         """Search for insolvency records by company number.
 
         Args:
           num (str): Company number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
         """
-        baseuri = self._BASE_URI + "company/{}/insolvency".format(num)
-        res = self.session.get(baseuri)
-        self.handle_http_error(res)
-        return res
+        baseuri = self._BASE_URI + "company/{}/insolvency".format(
+            self._company_number(num))
+        return self._get(baseuri, endpoint='insolvency', deadline=deadline)
 
-    def filing_history(self, num, transaction=None, **kwargs):
+    def filing_history(self, num, transaction=None, deadline=None,
+                       **kwargs):
         """Search for a company's filling history by company number.
 
         Args:
           num (str): Company number to search on.
 
           transaction (Optional[str]): Filing record number.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
             requests.session.get params keyword.
         """
-        baseuri = self._BASE_URI + "company/{}/filing-history".format(num)
+        baseuri = self._BASE_URI + "company/{}/filing-history".format(
+            self._company_number(num))
         if transaction is not None:
             baseuri += "/{}".format(transaction)
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, kwargs, 'filing_history', deadline=deadline)
 
-    def charges(self, num, charge_id=None, **kwargs):
+    def charges(self, num, charge_id=None, deadline=None, **kwargs):
         """Search for charges against a company by company number.
 
         Args:
           num (str): Company number to search on.
           transaction (Optional[str]): Filing record number.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
           requests.session.get params keyword.
         """
-        baseuri = self._BASE_URI + "company/{}/charges".format(num)
+        baseuri = self._BASE_URI + "company/{}/charges".format(
+            self._company_number(num))
         if charge_id is not None:
             baseuri += "/{}".format(charge_id)
-            res = self.session.get(baseuri, params=kwargs)
-        else:
-            res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, kwargs, 'charges', deadline=deadline)
 
-    def officers(self, num, **kwargs):
+    def officers(self, num, deadline=None, **kwargs):
         """Search for a company's registered officers by company number.
 
         Args:
           num (str): Company number to search on.
+          deadline (Optional[float]): Seconds the call may take,
+            including any rate limit wait. Defaults to None.
           kwargs (dict): additional keywords passed into
             requests.session.get *params* keyword.
         """
-        baseuri = self._BASE_URI + "company/{}/officers".format(num)
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        baseuri = self._BASE_URI + "company/{}/officers".format(
+            self._company_number(num))
+        return self._get(baseuri, kwargs, 'officers', deadline=deadline)
 
-    def disqualified(self, num, natural=True, **kwargs):
+    def disqualified(self, num, natural=True, deadline=None, **kwargs):
         """Search for disqualified officers by officer ID.
 
         Searches for natural disqualifications by default. Specify
@@ -188,17 +658,19 @@ class Search(Service):
         Args:
            num (str): Company number to search on.
            natural (Optional[bool]): Natural or corporate search
+           deadline (Optional[float]): Seconds the call may take,
+             including any rate limit wait. Defaults to None.
            kwargs (dict): additional keywords passed into
             requests.session.get *params* keyword.
         """
         search_type = 'natural' if natural else 'corporate'
         baseuri = (self._BASE_URI +
-                   'disqualified-officers/{}/{}'.format(search_type, num))
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+                   'disqualified-officers/{}/{}'.format(
+                       search_type, self._officer_id(num)))
+        return self._get(baseuri, kwargs, 'disqualified', deadline=deadline)
 
-    def persons_significant_control(self, num, statements=False, **kwargs):
+    def persons_significant_control(self, num, statements=False,
+                                    deadline=None, **kwargs):
         """Search for a list of persons with significant control.
 
         Searches for persons of significant control based on company number for
@@ -209,24 +681,27 @@ class Search(Service):
             num (str, int): Company number to search on.
             statements (Optional[bool]): Search only for persons with
                 statements. Default is False.
+            deadline (Optional[float]): Seconds the call may take,
+              including any rate limit wait. Defaults to None.
             kwargs (dict): additional keywords passed into requests.session.get
             *params* keyword.
         """
         baseuri = (self._BASE_URI +
-                   'company/{}/persons-with-significant-control'.format(num))
+                   'company/{}/persons-with-significant-control'.format(
+                       self._company_number(num)))
 
         # Only append statements to the URL if statements is True
         if statements is True:
             baseuri += '-statements'
 
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, kwargs, 'persons_significant_control',
+                         deadline=deadline)
 
     def significant_control(self,
                             num,
                             entity_id,
                             entity_type='individual',
+                            deadline=None,
                             **kwargs):
         """Get details of a specific entity with significant control.
 
@@ -238,6 +713,8 @@ class Search(Service):
                 'corporate' (for corporate entitys), 'legal' (for legal
                 persons), 'statements' (for a person with significant control
                 statement) and 'secure' (for a super secure person).
+            deadline (Optional[float]): Seconds the call may take,
+              including any rate limit wait. Defaults to None.
             kwargs (dict): additional keywords passed into requests.session.get
             *params* keyword.
         """
@@ -258,23 +735,52 @@ class Search(Service):
 
         # Construct the request and return the result
         baseuri = (self._BASE_URI +
-                   'company/{}/persons-with-significant-control/'.format(num) +
+                   'company/{}/persons-with-significant-control/'.format(
+                       self._company_number(num)) +
                    '{}/{}'.format(entity, entity_id))
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        return self._get(baseuri, kwargs, 'significant_control',
+                         deadline=deadline)
+
+    def document_metadata(self, document_id, deadline=None):
+        """Get a document's metadata by the document id.
 
-    def document(self, document_id, **kwargs):
+        The metadata's *resources* lists the content types the document is
+        available in, with the size of each.
+
+        Args:
+           document_id (str): The id of the document, the last part of a
+             filing history item's *document_metadata* link.
+           deadline (Optional[float]): Seconds the call may take,
+             including any rate limit wait. Defaults to None.
+        """
+        baseuri = '{}document/{}'.format(self._DOCUMENT_URI, document_id)
+        return self._get(baseuri, endpoint='document_metadata',
+                         deadline=deadline)
+
+    def document(self, document_id, content_type=None, deadline=None,
+                 stream=False, **kwargs):
         """Requests for a document by the document id.
            Normally the response.content can be saved as a pdf file
 
         Args:
            document_id (str): The id of the document retrieved.
+           content_type (Optional[str]): Content type to request, one of
+             those listed in the document's metadata, such as
+             ``'application/xhtml+xml'``. Defaults to the API's choice,
+             usually PDF.
+           deadline (Optional[float]): Seconds the call may take,
+             including any rate limit wait. Defaults to None.
+           stream (Optional[bool]): Leave the body to be read with
+             ``iter_content``, bypassing the cache. Defaults to False.
            kwargs (dict): additional keywords passed into
             requests.session.get *params* keyword.
         """
         baseuri = '{}document/{}/content'.format(self._DOCUMENT_URI,
                                                  document_id)
-        res = self.session.get(baseuri, params=kwargs)
-        self.handle_http_error(res)
-        return res
+        headers = {'Accept': content_type} if content_type else None
+        if stream:
+            return self._fetch(self.session, baseuri, kwargs,
+                               Deadline.coerce(deadline), headers,
+                               stream=True)
+        return self._get(baseuri, kwargs, 'document', deadline=deadline,
+                         headers=headers)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.state
+~~~~~~~~~~~~~~~
+
+This module keeps rate limit state in a local file, so a restarted process
+carries on from where the last one left its quota.
+
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from time import monotonic, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_HOST = 'api.companieshouse.gov.uk'
+DOCUMENT_HOST = 'document-api.companieshouse.gov.uk'
+
+_stores = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for store in list(_stores):
+        store.flush()
+
+
+class RateLimitStore(object):
+    """Rate limit state for each API key and host, saved to a JSON file.
+
+    Entries are dropped once their window has reset, since the quota they
+    describe no longer applies. Several processes can share a file: each
+    update holds an exclusive lock on ``<path>.lock`` while it reads and
+    rewrites the file, and when two disagree about the same window the
+    lower remaining count is kept. The lock needs :mod:`fcntl`, so on
+    platforms without it only threads in one process are coordinated.
+    """
+
+    def __init__(self, path, interval=1.0):
+        """Construct a RateLimitStore.
+
+        Args:
+            path (str): File to keep the state in. Created on first save.
+            interval (Optional[float]): Seconds between saves of the same
+                key, so busy clients don't rewrite the file on every
+                response. A skipped save is written once the interval
+                has passed. Defaults to 1.0.
+        """
+        self.path = path
+        self.interval = interval
+        self._saved = {}
+        self._pending = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        _stores.add(self)
+
+    @staticmethod
+    def key(access_token=None, host=DEFAULT_HOST):
+        """Return the entry name for an API key and host.
+
+        The key is hashed so it isn't written to disk.
+        """
+        digest = hashlib.sha256((access_token or '').encode('utf-8'))
+        return '{}@{}'.format(digest.hexdigest()[:16], host)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + '.lock', 'a') as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time()
+        return {key: entry for key, entry in entries.items()
+                if entry.get('reset', 0) > now}
+
+    def _write(self, entries):
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def load(self, key):
+        """Return the unexpired state saved under *key*, or None.
+
+        Returns:
+            dict: With ``limit``, ``remaining`` and ``reset`` keys.
+        """
+        with self._locked():
+            return self._read().get(key)
+
+    def reserve(self, key):
+        """Spend one call from the window saved under *key*.
+
+        Every process sharing the file draws from the same count, so
+        between them they don't spend more than the API has left.
+
+        Returns:
+            tuple: ``(reserved, remaining, reset)``, or None if no unexpired
+            window is saved. *reserved* is False if the window has no calls
+            left.
+        """
+        with self._locked():
+            entries = self._read()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if entry['remaining'] <= 0:
+                return False, 0, entry['reset']
+            entry['remaining'] -= 1
+            self._write(entries)
+            return True, entry['remaining'], entry['reset']
+
+    def save(self, key, limit, remaining, reset, force=False):
+        """Save the state for *key*, unless it was saved very recently.
+
+        A save skipped for being within *interval* of the last one is kept
+        and written when the interval has passed, unless a newer save
+        replaces it first.
+
+        Returns True if the file was written.
+        """
+        if reset is None or remaining is None:
+            return False
+        with self._lock:
+            now = monotonic()
+            last = self._saved.get(key)
+            if not force and last is not None and now - last < self.interval:
+                self._pending[key] = (limit, remaining, reset)
+                if key not in self._timers:
+                    timer = threading.Timer(last + self.interval - now,
+                                            self._flush, [key])
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+                return False
+            self._saved[key] = now
+            self._pending.pop(key, None)
+        return self._merge(key, limit, remaining, reset)
+
+    def flush(self):
+        """Write every save still waiting out its interval."""
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush(key)
+
+    def _flush(self, key):
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            state = self._pending.pop(key, None)
+            self._saved[key] = monotonic()
+        if timer is not None:
+            timer.cancel()
+        if state is not None:
+            self._merge(key, *state)
+
+    def _merge(self, key, limit, remaining, reset):
+        with self._locked():
+            entries = self._read()
+            current = entries.get(key)
+            if current is not None and current['reset'] == reset:
+                remaining = min(remaining, current['remaining'])
+            elif current is not None and current['reset'] > reset:
+                return False
+            entries[key] = {'limit': limit, 'remaining': remaining,
+                            'reset': reset}
+            self._write(entries)
+            return True
+
+    def _after_fork(self):
+        # Timer threads aren't copied into a child process, and the saves
+        # they were waiting on belong to the parent
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timers = {}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.stats
+~~~~~~~~~~~~~~~
+
+This module provides the counters a Search client keeps about its traffic.
+
+"""
+import threading
+
+
+class ClientStats(object):
+    """Thread-safe traffic counters for a client.
+
+    *wire_bytes* counts response bodies as they came over the network, so
+    with gzip or brotli transfer encoding it's smaller than *decoded_bytes*.
+    *connections* counts the connections opened, with the time spent on
+    their DNS lookups, TCP connects and TLS handshakes.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.connections = 0
+        self.dns_seconds = 0.0
+        self.connect_seconds = 0.0
+        self.tls_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_response(self, response, streamed=False):
+        """Count a response fetched from the API.
+
+        The body of a *streamed* response hasn't been read yet, so it's
+        counted at its Content-Length.
+        """
+        if streamed:
+            size = int(response.headers.get('Content-Length') or 0)
+            with self._lock:
+                self.requests += 1
+                self.wire_bytes += size
+                self.decoded_bytes += size
+            return
+        decoded = len(response.content)
+        try:
+            wire = response.raw.tell()
+        except (AttributeError, OSError):
+            wire = 0
+        if not wire:
+            wire = int(response.headers.get('Content-Length') or decoded)
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire
+            self.decoded_bytes += decoded
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def record_handshake(self, handshake):
+        """Count a connection opened, from a warmup.Handshake."""
+        with self._lock:
+            self.connections += 1
+            self.dns_seconds += handshake.dns
+            self.connect_seconds += handshake.connect
+            self.tls_seconds += handshake.tls
+
+    @property
+    def handshake_seconds(self):
+        """Mean seconds spent opening a connection, or None before any."""
+        if not self.connections:
+            return None
+        total = self.dns_seconds + self.connect_seconds + self.tls_seconds
+        return total / self.connections
+
+    @property
+    def compression_ratio(self):
+        """Decoded bytes per byte transferred, or None before any requests."""
+        if not self.wire_bytes:
+            return None
+        return self.decoded_bytes / self.wire_bytes
+
+    def as_dict(self):
+        with self._lock:
+            return {'requests': self.requests,
+                    'cache_hits': self.cache_hits,
+                    'wire_bytes': self.wire_bytes,
+                    'decoded_bytes': self.decoded_bytes,
+                    'connections': self.connections,
+                    'dns_seconds': self.dns_seconds,
+                    'connect_seconds': self.connect_seconds,
+                    'tls_seconds': self.tls_seconds}
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.transport
+~~~~~~~~~~~~~~~~~~~
+
+This module provides the transports that carry a Search client's requests:
+requests' own connection pool, urllib3 directly, an asyncio event loop,
+and an in-memory stub for testing without a network.
+
+"""
+
+import asyncio
+import json
+import threading
+from time import sleep, time
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+import urllib3
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class Transport(requests.adapters.BaseAdapter):
+    """Base class for transports.
+
+    A transport is a requests adapter: ``send(request, **kwargs)`` returns
+    a :class:`requests.Response` and ``close()`` releases its connections.
+    Pass one to :class:`~chwrapper.services.search.Search` as *transport*;
+    rate limiting and circuit breaking still apply on top of it. One
+    transport can be shared by many clients, so it's closed by its owner
+    rather than by the clients.
+    """
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(requests.adapters.HTTPAdapter):
+    """requests' own HTTPAdapter, as used when no transport is given.
+
+    Sharing one between clients shares its connection pool, rather than
+    each client holding its own.
+    """
+
+
+def _timeout(timeout):
+    """Split a requests style timeout into connect and read timeouts."""
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+def _route(url):
+    """Path and sorted query of *url*, less the access token."""
+    parts = urlparse(url)
+    query = sorted((name, value) for name, value in parse_qsl(parts.query)
+                   if name != 'access_token')
+    return parts.path + ('?' + urlencode(query) if query else '')
+
+
+def _build_response(adapter, request, status, headers, content, reason=None,
+                    raw=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.reason = reason
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    response.raw = raw
+    if content is not None:
+        response._content = content
+    if raw is not None:
+        extract_cookies_to_jar(response.cookies, request, raw)
+    return response
+
+
+class Urllib3Transport(Transport):
+    """Sends requests through a urllib3 PoolManager directly.
+
+    Skips the per-request proxy and certificate configuration done by
+    requests' HTTPAdapter. Proxies, and per-request *verify* and *cert*
+    settings, aren't supported.
+    """
+
+    def __init__(self, maxsize=10, **pool_kwargs):
+        """Construct a Urllib3Transport.
+
+        Args:
+            maxsize (Optional[int]): Connections kept open per host.
+                Defaults to 10.
+            **pool_kwargs: Passed on to :class:`urllib3.PoolManager`.
+        """
+        super(Urllib3Transport, self).__init__()
+        pool_kwargs.setdefault('ca_certs', requests.certs.where())
+        self.pool = urllib3.PoolManager(maxsize=maxsize, **pool_kwargs)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        connect, read = _timeout(timeout)
+        try:
+            resp = self.pool.urlopen(
+                request.method, request.url, body=request.body,
+                headers=dict(request.headers), redirect=False, retries=False,
+                timeout=urllib3.Timeout(connect=connect, read=read),
+                preload_content=False, decode_content=False)
+        except urllib3.exceptions.ConnectTimeoutError as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request) from e
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ReadTimeout(e, request=request) from e
+        except urllib3.exceptions.SSLError as e:
+            raise requests.exceptions.SSLError(e, request=request) from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e,
+                                                      request=request) from e
+        return self.build_response(request, resp)
+
+    def build_response(self, req, resp):
+        return _build_response(self, req, resp.status, resp.headers, None,
+                               reason=resp.reason, raw=resp)
+
+    def close(self):
+        self.pool.clear()
+
+
+class AsyncTransport(Transport):
+    """Sends requests through aiohttp on an event loop in a background
+    thread.
+
+    This is not an async interface: :meth:`send` blocks the calling thread
+    until its response has been read, like any other transport. What it
+    changes is the I/O, which runs on the one loop, so requests from many
+    client threads share a single aiohttp connection pool. Requires
+    aiohttp.
+    """
+
+    def __init__(self, limit=100):
+        """Construct an AsyncTransport.
+
+        Args:
+            limit (Optional[int]): Connections open at once across all
+                hosts. Defaults to 100.
+
+        Raises:
+            ValueError: If aiohttp isn't installed.
+        """
+        if aiohttp is None:
+            raise ValueError("AsyncTransport requires aiohttp")
+        super(AsyncTransport, self).__init__()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='chwrapper-transport',
+                                        daemon=True)
+        self._thread.start()
+        self._session = self._run(self._open(limit))
+
+    async def _open(self, limit):
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=limit))
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _request(self, request, timeout):
+        connect, read = _timeout(timeout)
+        async with self._session.request(
+                request.method, request.url, data=request.body,
+                headers=dict(request.headers), allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(sock_connect=connect,
+                                              sock_read=read)) as resp:
+            content = await resp.read()
+            return (resp.status, resp.reason, list(resp.headers.items()),
+                    content)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        try:
+            status, reason, headers, content = self._run(
+                self._request(request, timeout))
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(e, request=request) from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(e,
+                                                      request=request) from e
+        # aiohttp has already decoded the body
+        headers = [(name, value) for name, value in headers
+                   if name.lower() != 'content-encoding']
+        return _build_response(self, request, status, headers, content,
+                               reason=reason)
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class StubTransport(Transport):
+    """Replays canned responses from memory, without touching the network.
+
+    Responses are looked up by path and query string, ignoring the access
+    token and parameter order, falling back to the path alone. They get
+    Companies House style rate limit headers counted down over a fixed
+    window. Once a window's calls are used up responses are 429s until it
+    resets, as from the real API. Safe to share between threads.
+    """
+
+    def __init__(self, latency=0, limit=600, window=300):
+        """Construct a StubTransport.
+
+        Args:
+            latency (Optional[float, callable]): Seconds each response is
+                delayed by, or a function returning them. Defaults to 0.
+            limit (Optional[int]): Calls allowed per window. None leaves out
+                the rate limit headers. Defaults to 600.
+            window (Optional[int]): Rate limit window in seconds. Defaults
+                to 300.
+        """
+        super(StubTransport, self).__init__()
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.calls = 0
+        self._routes = {}
+        self._remaining = None
+        self._reset = None
+        self._lock = threading.Lock()
+
+    def add(self, path, json_body=None, body=b'', status=200, headers=None):
+        """Add a canned response.
+
+        Args:
+            path (str): Path, with or without a query string, or a full URL.
+            json_body (Optional[dict, list]): Body to encode as JSON.
+            body (Optional[bytes, str]): Raw body, used without *json_body*.
+            status (Optional[int]): Status code. Defaults to 200.
+            headers (Optional[dict]): Extra response headers.
+        """
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers.setdefault('Content-Type', 'application/json')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self._routes[_route(path)] = (status, headers, body)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        route = _route(request.url)
+        found = (self._routes.get(route)
+                 or self._routes.get(route.split('?')[0]))
+        status, headers, body = found or (404, {}, b'')
+        headers = dict(headers)
+        with self._lock:
+            self.calls += 1
+            if self.limit is not None:
+                now = time()
+                if self._reset is None or self._reset <= now:
+                    self._reset = int(now) + self.window
+                    self._remaining = self.limit
+                if self._remaining > 0:
+                    self._remaining -= 1
+                else:
+                    status, body = 429, b''
+                headers.update({
+                    'X-Ratelimit-Limit': str(self.limit),
+                    'X-Ratelimit-Remain': str(self._remaining),
+                    'X-Ratelimit-Reset': str(self._reset),
+                    'X-Ratelimit-Window': '{}m'.format(self.window // 60),
+                })
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            sleep(latency)
+        headers['Content-Length'] = str(len(body))
+        return _build_response(self, request, status, headers, body)
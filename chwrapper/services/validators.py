@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+chwrapper.validators
+~~~~~~~~~~~~~~~~~~~~
+
+This module normalises and validates Companies House identifiers before
+they are used to build request URLs.
+
+"""
+
+import re
+
+# Canonical company numbers are eight characters: eight digits for England
+# and Wales, a two letter register prefix (SC, NI, OC, ...) and six digits,
+# the older Northern Ireland R0 form, or the I&P form ending in R.
+_COMPANY_NUMBER = re.compile(r"(?:\d{8}|[A-Z]{2}\d{6}|[A-Z]{2}\d{5}R|R\d{7})")
+_PREFIXED_NUMBER = re.compile(r"([A-Z]{2})(\d{1,6})")
+
+# Officer and disqualified officer ids are URL-safe base64 style tokens.
+_OFFICER_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+_ERRORS = ("raise", "coerce")
+
+
+class InvalidIdentifier(ValueError):
+    """Raised when an identifier can't be normalised into a valid form."""
+
+
+def normalise_company_number(num):
+    """Normalise a single company number.
+
+    Surrounding whitespace is stripped, letters are upper-cased and the
+    numeric part is zero padded, so ``6`` becomes ``'00000006'`` and
+    ``'sc123'`` becomes ``'SC000123'``.
+
+    Args:
+        num (str, int): Company number to normalise.
+
+    Raises:
+        InvalidIdentifier: If *num* isn't a valid company number.
+    """
+    value = str(num).strip().upper()
+
+    # Fast path for numbers that are already in canonical form
+    if _COMPANY_NUMBER.fullmatch(value):
+        return value
+
+    value = value.replace(" ", "")
+    if value.isdigit() and len(value) <= 8:
+        return value.zfill(8)
+
+    match = _PREFIXED_NUMBER.fullmatch(value)
+    if match is not None:
+        return match.group(1) + match.group(2).zfill(6)
+
+    if _COMPANY_NUMBER.fullmatch(value):
+        return value
+
+    raise InvalidIdentifier("Invalid company number: {!r}".format(num))
+
+
+def normalise_officer_id(officer_id):
+    """Normalise a single officer id.
+
+    Officer ids are case sensitive so only surrounding whitespace is
+    stripped.
+
+    Args:
+        officer_id (str): Officer id to normalise.
+
+    Raises:
+        InvalidIdentifier: If *officer_id* contains characters that can't
+            appear in an officer id.
+    """
+    value = str(officer_id).strip()
+    if _OFFICER_ID.fullmatch(value):
+        return value
+    raise InvalidIdentifier("Invalid officer id: {!r}".format(officer_id))
+
+
+def _normalise_many(func, values, errors):
+    if errors not in _ERRORS:
+        raise ValueError("errors must be one of {}".format(", ".join(_ERRORS)))
+    if errors == "raise":
+        return [func(value) for value in values]
+
+    results = []
+    append = results.append
+    for value in values:
+        try:
+            append(func(value))
+        except InvalidIdentifier:
+            append(None)
+    return results
+
+
+def normalise_company_numbers(nums, errors="raise"):
+    """Normalise an iterable of company numbers in one pass.
+
+    Args:
+        nums (iterable): Company numbers to normalise.
+        errors (Optional[str]): ``'raise'`` to raise on the first invalid
+            number or ``'coerce'`` to return None in its place. Defaults to
+            ``'raise'``.
+
+    Returns:
+        list: The normalised company numbers, in input order.
+    """
+    return _normalise_many(normalise_company_number, nums, errors)
+
+
+def normalise_officer_ids(officer_ids, errors="raise"):
+    """Normalise an iterable of officer ids in one pass.
+
+    Args:
+        officer_ids (iterable): Officer ids to normalise.
+        errors (Optional[str]): ``'raise'`` to raise on the first invalid id
+            or ``'coerce'`` to return None in its place. Defaults to
+            ``'raise'``.
+
+    Returns:
+        list: The normalised officer ids, in input order.
+    """
+    return _normalise_many(normalise_officer_id, officer_ids, errors)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016 James Gardiner
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+chwrapper.warmup
+~~~~~~~~~~~~~~~~
+
+This module opens keep-alive connections ahead of the first requests, caches
+DNS lookups and times each connection's handshake.
+
+"""
+import socket
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
+
+import requests
+import urllib3
+from urllib3.exceptions import ConnectTimeoutError
+
+Handshake = namedtuple('Handshake', ['host', 'dns', 'connect', 'tls'])
+Handshake.__doc__ = """Seconds spent opening one connection.
+
+*dns* is only split out from *connect* when the lookup went through a
+DNSCache; otherwise it's counted as part of the TCP connect. *tls* is 0 for
+plain HTTP.
+"""
+
+
+class DNSCache(object):
+    """Caches the addresses a host name resolves to for *ttl* seconds.
+
+    Safe to share between threads, so one cache can serve every client made
+    by a ClientFactory. Addresses that all fail to connect are forgotten, so
+    the next connection looks the host up again.
+    """
+
+    def __init__(self, ttl=300):
+        """Construct a DNSCache.
+
+        Args:
+            ttl (Optional[float]): Seconds a lookup is reused for. Defaults
+                to 300.
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """Return the IP addresses for *host*, looking it up if needed.
+
+        Raises:
+            socket.gaierror: If the lookup fails. Failures aren't cached.
+        """
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        addresses = []
+        for info in infos:
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, addresses)
+        return addresses
+
+    def discard(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+class _TimedConnection(object):
+    """Mixin for urllib3 connections that resolves through a DNSCache and
+    reports each handshake."""
+
+    dns_cache = None
+    on_handshake = None
+    _timings = (0.0, 0.0)
+
+    def _new_conn(self):
+        started = perf_counter()
+        host = self._dns_host
+        addresses = None
+        if self.dns_cache is not None:
+            try:
+                addresses = self.dns_cache.resolve(host, self.port)
+            except socket.gaierror:
+                # Left for urllib3 to look up again and report
+                pass
+        resolved = perf_counter()
+        try:
+            if not addresses:
+                sock = super(_TimedConnection, self)._new_conn()
+            else:
+                sock = self._connect_any(host, addresses)
+        finally:
+            self._dns_host = host
+        self._timings = (resolved - started, perf_counter() - resolved)
+        return sock
+
+    def _connect_any(self, host, addresses):
+        # The host name itself is put back before the TLS handshake, which
+        # uses it for SNI and certificate checks
+        for i, address in enumerate(addresses):
+            self._dns_host = address
+            try:
+                return super(_TimedConnection, self)._new_conn()
+            except ConnectTimeoutError:
+                if i == len(addresses) - 1:
+                    self.dns_cache.discard(host, self.port)
+                    raise
+
+    def connect(self):
+        started = perf_counter()
+        super(_TimedConnection, self).connect()
+        if self.on_handshake is not None:
+            dns, connect = self._timings
+            tls = max(perf_counter() - started - dns - connect, 0.0)
+            self.on_handshake(Handshake(self.host, dns, connect, tls))
+
+
+def _pool_classes(dns_cache, on_handshake):
+    attrs = {'dns_cache': dns_cache,
+             'on_handshake': staticmethod(on_handshake)
+             if on_handshake is not None else None}
+    http = type('HTTPConnection', (_TimedConnection,
+                                   urllib3.connection.HTTPConnection), attrs)
+    https = type('HTTPSConnection',
+                 (_TimedConnection, urllib3.connection.HTTPSConnection),
+                 attrs)
+    return {
+        'http': type('HTTPConnectionPool', (urllib3.HTTPConnectionPool,),
+                     {'ConnectionCls': http}),
+        'https': type('HTTPSConnectionPool', (urllib3.HTTPSConnectionPool,),
+                      {'ConnectionCls': https}),
+    }
+
+
+def _target(session, url):
+    # Adapters hand requests on to their transport when they have one
+    adapter = session.get_adapter(url)
+    return getattr(adapter, 'transport', None) or adapter
+
+
+def _pool_manager(target):
+    if isinstance(target, requests.adapters.HTTPAdapter):
+        return target.poolmanager
+    pool = getattr(target, 'pool', None)
+    if isinstance(pool, urllib3.PoolManager):
+        return pool
+    return None
+
+
+def instrument(session, urls, dns_cache=None, on_handshake=None):
+    """Make the connection pools serving *urls* use *dns_cache* and time
+    their handshakes.
+
+    Only connections opened afterwards are affected. Adapters that hand
+    requests on to a transport are left alone, as the transport may be
+    shared with other clients.
+
+    Args:
+        session (requests.Session): Session from Service.get_session.
+        urls (iterable): URLs whose adapters are instrumented.
+        dns_cache (Optional[DNSCache]): Cache for host lookups. Defaults to
+            None, which resolves every new connection.
+        on_handshake (Optional[callable]): Called with a Handshake for each
+            connection opened.
+    """
+    classes = _pool_classes(dns_cache, on_handshake)
+    for url in urls:
+        adapter = session.get_adapter(url)
+        if (isinstance(adapter, requests.adapters.HTTPAdapter) and
+                getattr(adapter, 'transport', None) is None):
+            adapter.poolmanager.clear()
+            adapter.poolmanager.pool_classes_by_scheme = classes
+
+
+def _connection_pool(session, url):
+    target = _target(session, url)
+    if isinstance(target, requests.adapters.HTTPAdapter):
+        # The pool requests itself will pick, which is keyed on the TLS
+        # settings after the environment's CA bundle has been applied
+        settings = session.merge_environment_settings(
+            url, {}, None, session.verify, session.cert)
+        if requests.utils.select_proxy(url, settings['proxies']):
+            return None
+        request = requests.Request('GET', url).prepare()
+        try:
+            return target.get_connection_with_tls_context(
+                request, settings['verify'], cert=settings['cert'])
+        except AttributeError:
+            return target.get_connection(url)
+    manager = _pool_manager(target)
+    if manager is not None:
+        return manager.connection_from_url(url)
+    return None
+
+
+def warm(session, urls, connections=2, timeout=3.05):
+    """Open keep-alive connections to each of *urls* and leave them pooled.
+
+    Warming is best effort: connections that fail are dropped and the
+    first request to use their slot connects as usual. No more connections
+    are opened than each pool keeps.
+
+    Args:
+        session (requests.Session): Session from Service.get_session.
+        urls (iterable): URLs of the hosts to connect to.
+        connections (Optional[int]): Connections opened per host. Defaults
+            to 2.
+        timeout (Optional[float]): Connect timeout in seconds.
+
+    Returns:
+        int: The number of connections opened.
+    """
+    pending = []
+    for url in urls:
+        pool = _connection_pool(session, url)
+        if pool is None:
+            continue
+        count = min(connections, pool.pool.maxsize if pool.pool else 0)
+        pending.append((pool, [pool._get_conn() for _ in range(count)]))
+
+    def connect(conn):
+        conn.timeout = timeout
+        try:
+            conn.connect()
+        except Exception:  # pylint: disable=broad-except
+            conn.close()
+            return False
+        return True
+
+    conns = [conn for _, batch in pending for conn in batch]
+    opened = 0
+    if conns:
+        with ThreadPoolExecutor(max_workers=len(conns)) as executor:
+            opened = sum(executor.map(connect, conns))
+    for pool, batch in pending:
+        for conn in batch:
+            pool._put_conn(conn)
+    return opened
@@ -15,8 +15,12 @@ setup(name='chwrapper',
       license='MIT',
       packages=find_packages(),
       zip_safe=False,
+      entry_points={
+          'console_scripts': ['chwrapper = chwrapper.cli:main'],
+      },
       install_requires=[
-          'requests==2.8.1',
+          'requests>=2.32.2',
+          'urllib3>=1.26',
       ],
       classifiers=[
         "Operating System :: OS Independent",
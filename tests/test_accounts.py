@@ -0,0 +1,135 @@
+import io
+import math
+import zipfile
+from xml.etree import ElementTree
+
+from chwrapper.services import accounts
+from chwrapper.services.accounts import (
+    AccountsTable,
+    parse_accounts,
+    read_accounts,
+)
+
+IXBRL = """<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"
+      xmlns:xbrli="http://www.xbrl.org/2003/instance"
+      xmlns:xbrldi="http://xbrl.org/2006/xbrldi">
+<body>
+<div style="display:none"><ix:header><ix:resources>
+<xbrli:context id="cy"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier></xbrli:entity>
+<xbrli:period><xbrli:instant>2020-03-31</xbrli:instant></xbrli:period></xbrli:context>
+<xbrli:context id="py"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier></xbrli:entity>
+<xbrli:period><xbrli:instant>2019-03-31</xbrli:instant></xbrli:period></xbrli:context>
+<xbrli:context id="dim"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier>
+<xbrli:segment><xbrldi:explicitMember dimension="d">m</xbrldi:explicitMember></xbrli:segment></xbrli:entity>
+<xbrli:period><xbrli:instant>2020-03-31</xbrli:instant></xbrli:period></xbrli:context>
+<xbrli:context id="dur"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier></xbrli:entity>
+<xbrli:period><xbrli:startDate>2019-04-01</xbrli:startDate><xbrli:endDate>2020-03-31</xbrli:endDate></xbrli:period></xbrli:context>
+</ix:resources></ix:header></div>
+<p>Company&nbsp;number <ix:nonNumeric name="bus:UKCompaniesHouseRegisteredNumber" contextRef="dur">{number}</ix:nonNumeric></p>
+<td><ix:nonFraction name="core:Equity" contextRef="cy" unitRef="GBP" decimals="0" scale="3" format="ixt:numdotdecimal">1,<span>234</span></ix:nonFraction></td>
+<td><ix:nonFraction name="core:Equity" contextRef="py" unitRef="GBP" decimals="0">900</ix:nonFraction></td>
+<td><ix:nonFraction name="core:Equity" contextRef="dim" unitRef="GBP" decimals="0">5</ix:nonFraction></td>
+<td>(<ix:nonFraction name="core:ProfitLoss" contextRef="dur" unitRef="GBP" sign="-" decimals="0">250</ix:nonFraction>)</td>
+<td><ix:nonFraction name="core:Creditors" contextRef="cy" unitRef="GBP" format="ixt:zerodash">-</ix:nonFraction></td>
+</body></html>
+"""
+
+XBRL = """<?xml version="1.0"?>
+<xbrl xmlns="http://www.xbrl.org/2003/instance" xmlns:g="http://www.xbrl.org/uk/gaap">
+<context id="c"><entity><identifier scheme="x">2</identifier></entity>
+<period><instant>2021-12-31</instant></period></context>
+<g:NetCurrentAssetsLiabilities contextRef="c" unitRef="GBP" decimals="0">-42</g:NetCurrentAssetsLiabilities>
+</xbrl>
+"""
+
+
+def test_parse_ixbrl():
+    rows = parse_accounts(io.BytesIO(IXBRL.format(number="00000001").encode()),
+                          name="Prod224_0001_00000001_20200331.html")
+    assert rows == [("00000001", "2020-03-31",
+                     {"Equity": 1234000.0, "ProfitLoss": -250.0,
+                      "Creditors": 0.0})]
+
+
+def test_parse_detaches_elements(monkeypatch):
+    """The tree held while parsing doesn't grow with the document."""
+    sizes = []
+
+    class Parser(ElementTree.XMLPullParser):
+        root = None
+
+        def read_events(self):
+            for event, element in super(Parser, self).read_events():
+                if self.root is None:
+                    self.root = element
+                yield event, element
+            if self.root is not None:
+                sizes.append(sum(1 for _ in self.root.iter()))
+
+    monkeypatch.setattr(accounts.ElementTree, "XMLPullParser", Parser)
+    document = IXBRL.replace("</body>", "<p><b>filler</b></p>\n" * 20000
+                             + "</body>")
+    rows = parse_accounts(io.BytesIO(document.format(number="1").encode()),
+                          name="Prod224_0001_00000001_20200331.html")
+    assert rows[0][2]["Equity"] == 1234000.0
+    # One 64KiB chunk holds about 6000 of the 40000 filler elements
+    assert max(sizes) < 10000
+
+
+def test_parse_comparatives_and_registered_number():
+    """Without a bulk file name the company number is read from the tags."""
+    rows = parse_accounts(io.BytesIO(IXBRL.format(number="SC000001").encode()),
+                          facts=["Equity"], comparatives=True)
+    assert rows == [("SC000001", "2019-03-31", {"Equity": 900.0}),
+                    ("SC000001", "2020-03-31", {"Equity": 1234000.0})]
+
+
+def test_parse_xbrl():
+    rows = parse_accounts(io.BytesIO(XBRL.encode()),
+                          name="Prod223_0002_00000002_20211231.xml")
+    assert rows == [("00000002", "2021-12-31",
+                     {"NetCurrentAssetsLiabilities": -42.0})]
+
+
+def test_table():
+    table = AccountsTable(["Equity", "ProfitLoss"])
+    table.add("1", "2020", {"Equity": 1.0})
+    table.add("2", "2020", {"ProfitLoss": 2.0})
+    table.add("1", "2020", {"ProfitLoss": 3.0})
+    assert len(table) == 2
+    assert table.get("1", "2020") == {"Equity": 1.0, "ProfitLoss": 3.0}
+    assert math.isnan(table.columns["Equity"][1])
+    assert list(table.rows())[1] == {"company_number": "2",
+                                     "period_end": "2020", "Equity": None,
+                                     "ProfitLoss": 2.0}
+
+
+def bulk_zip(tmp_path):
+    path = str(tmp_path / "Accounts_Bulk_Data-2021-01-01.zip")
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Prod224_0001_00000001_20200331.html",
+                         IXBRL.format(number="00000001"))
+        archive.writestr("Prod223_0002_00000002_20211231.xml", XBRL)
+        archive.writestr("Prod224_0003_00000003_20200331.html", "<html>")
+    return path
+
+
+def test_read_accounts_in_process(tmp_path):
+    table = read_accounts(bulk_zip(tmp_path), workers=1, chunk_size=1)
+    assert table.company_numbers == ["00000002", "00000001"]
+    assert table.get("00000002", "2021-12-31") == {
+        "NetCurrentAssetsLiabilities": -42.0}
+    assert [name for name, _ in table.errors] == [
+        "Prod224_0003_00000003_20200331.html"]
+
+
+def test_read_accounts_process_pool(tmp_path):
+    table = read_accounts([bulk_zip(tmp_path)], workers=2, chunk_size=1)
+    assert len(table) == 2
+    assert len(table.errors) == 1
+    output = tmp_path / "accounts.csv"
+    table.to_csv(str(output))
+    assert output.read_text().splitlines()[0].startswith(
+        "company_number,period_end,Equity")
@@ -1,11 +1,15 @@
 from datetime import datetime
 from datetime import timezone
+import subprocess
+import sys
+import time
 
 import pytest
 import requests
 import responses
 
 import chwrapper
+from chwrapper.services import base
 
 
 def test_service_session():
@@ -184,6 +188,8 @@ class TestRateLimiting:
     @responses.activate
     def test_rate_limit_renewal(self):
         """Test execution continues when rate limit exceeded."""
+        # Taken now rather than at collection, which may be over a second ago
+        current_timestamp = int(datetime.timestamp(datetime.now(timezone.utc)))
         responses.add(
             responses.GET,
             "https://api.companieshouse.gov.uk/search/companies?"
@@ -194,7 +200,7 @@ class TestRateLimiting:
             content_type="application/json",
             adding_headers={
                 "X-Ratelimit-Remain": "0",
-                "X-Ratelimit-Reset": "{}".format(self.current_timestamp),
+                "X-Ratelimit-Reset": "{}".format(current_timestamp),
             },
         )
 
@@ -221,3 +227,73 @@ class TestRateLimiting:
 
         with pytest.raises(ValueError):
             _ = self.s.search_companies("Python")
+
+
+def test_lazy_import():
+    """Importing chwrapper doesn't import requests until a client is used."""
+    code = (
+        "import sys, chwrapper; "
+        "assert 'requests' not in sys.modules; "
+        "chwrapper.Search; "
+        "assert 'requests' in sys.modules"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_lazy_attributes():
+    """Lazy attributes resolve to the service classes."""
+    from chwrapper.services.search import Search
+
+    assert chwrapper.Search is Search
+    assert "Search" in dir(chwrapper)
+    with pytest.raises(AttributeError):
+        chwrapper.NotAClient
+
+
+class TestRateLimiter:
+    """The shared RateLimiter state."""
+
+    def test_acquire_reserves_calls(self):
+        """Each acquire spends one of the remaining calls."""
+        limiter = chwrapper.RateLimiter()
+        limiter.update({"X-Ratelimit-Remain": "2",
+                        "X-Ratelimit-Reset": str(int(time.time()) + 60),
+                        "X-Ratelimit-Limit": "600"})
+        limiter.acquire()
+        limiter.acquire()
+        assert limiter.remaining == 0
+        assert limiter.limit == 600
+
+    def test_acquire_waits_for_reset(self, monkeypatch):
+        """Acquiring with no calls left sleeps until the window resets."""
+        now = [1000.0]
+        slept = []
+
+        def fake_sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        monkeypatch.setattr(base, "time", lambda: now[0])
+        monkeypatch.setattr(base, "sleep", fake_sleep)
+        limiter = chwrapper.RateLimiter()
+        limiter.update({"X-Ratelimit-Remain": "0", "X-Ratelimit-Reset": "1010"})
+        limiter.acquire()
+        assert slept == [11.0]
+        assert limiter.remaining is None
+
+    def test_update_keeps_lowest_count(self):
+        """Out of order responses in the same window can't raise the count."""
+        limiter = chwrapper.RateLimiter()
+        reset = str(int(time.time()) + 60)
+        limiter.update({"X-Ratelimit-Remain": "5", "X-Ratelimit-Reset": reset})
+        limiter.update({"X-Ratelimit-Remain": "7", "X-Ratelimit-Reset": reset})
+        assert limiter.remaining == 5
+        limiter.update({"X-Ratelimit-Remain": "9",
+                        "X-Ratelimit-Reset": str(int(reset) + 300)})
+        assert limiter.remaining == 9
+
+    def test_update_ignores_missing_headers(self):
+        """Responses without rate limit headers leave the state alone."""
+        limiter = chwrapper.RateLimiter()
+        limiter.update({})
+        assert limiter.remaining is None
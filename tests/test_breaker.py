@@ -0,0 +1,135 @@
+import pytest
+import requests
+import responses
+
+import chwrapper
+from chwrapper.services import breaker as breaker_module
+from chwrapper.services.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitOpenError,
+)
+from chwrapper.services.cache import CachePolicy, ResponseCache
+from chwrapper.services.transport import Transport
+
+PROFILE_URL = "https://api.companieshouse.gov.uk/company/00012345"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(breaker_module, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_on_failure_rate(clock):
+    """The breaker opens once enough calls in the window have failed."""
+    changes = []
+    breaker = CircuitBreaker("host", min_calls=4, failure_rate=0.5,
+                             listeners=[lambda *args: changes.append(args)])
+    for success in (True, True, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert changes == [("host", CLOSED, OPEN)]
+
+
+def test_old_calls_leave_the_window(clock):
+    """Only calls within the window count towards the failure rate."""
+    breaker = CircuitBreaker("host", min_calls=2, window=10)
+    breaker.record(False)
+    clock[0] += 20
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker("host", min_calls=1, slow_call=1.0)
+    breaker.record(True, latency=5.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_trial(clock):
+    """After the reset timeout one trial call decides the next state."""
+    breaker = CircuitBreaker("host", min_calls=1, reset_timeout=30)
+    breaker.record(False)
+    clock[0] += 31
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    clock[0] += 31
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+
+class TestSearchBreaker:
+    """Search fails fast while a host's circuit is open"""
+
+    def search(self, **kwargs):
+        breakers = CircuitBreakers(min_calls=2)
+        return chwrapper.Search(access_token="pk.test", breakers=breakers,
+                                **kwargs)
+
+    @responses.activate
+    def test_fail_fast(self):
+        responses.add(responses.GET, PROFILE_URL, status=503,
+                      adding_headers={"X-Ratelimit-Remain": "10"})
+        s = self.search()
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                s.profile("12345")
+        assert s.breakers.states() == {"api.companieshouse.gov.uk": OPEN}
+
+        with pytest.raises(CircuitOpenError):
+            s.profile("12345")
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_connection_errors_open_circuit(self):
+        s = self.search(rate_limit=False)
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.ConnectionError):
+                s.profile("12345")
+        with pytest.raises(CircuitOpenError):
+            s.profile("12345")
+
+    def test_unexpected_error_releases_trial(self, clock):
+        """A half-open trial that raises something else can be retried."""
+
+        class Broken(Transport):
+            def send(self, request, **kwargs):
+                raise requests.exceptions.ChunkedEncodingError("truncated")
+
+        s = self.search(rate_limit=False, transport=Broken())
+        breaker = s.breakers.get("api.companieshouse.gov.uk")
+        breaker.record(False)
+        breaker.record(False)
+        clock[0] += breaker.reset_timeout + 1
+        for _ in range(breaker.half_open_calls + 1):
+            with pytest.raises(requests.exceptions.ChunkedEncodingError):
+                s.profile("12345")
+        assert breaker.state == HALF_OPEN
+
+    @responses.activate
+    def test_cached_fallback(self):
+        """An expired cached copy is served while the circuit is open."""
+        responses.add(responses.GET, PROFILE_URL, json={"company_name": "A"},
+                      adding_headers={"X-Ratelimit-Remain": "10"})
+        s = self.search(cache=ResponseCache(), cache_policy=CachePolicy(0, 0))
+        s.profile("12345")
+        for _ in range(2):
+            s.breakers.get("api.companieshouse.gov.uk").record(False)
+
+        res = s.profile("12345")
+        assert res.json() == {"company_name": "A"}
+        assert res.from_cache
+        assert len(responses.calls) == 1
@@ -0,0 +1,82 @@
+import json
+import zipfile
+
+import responses
+
+import chwrapper
+from chwrapper.services.bulk import PSCSnapshot
+from chwrapper.services.cache import ResponseCache
+
+
+def psc(number, name, kind="individual-person-with-significant-control",
+        **fields):
+    data = dict(kind=kind, name=name, etag="e",
+                links={"self": "/company/{}/persons-with-significant-control"
+                                "/individual/{}".format(number, name)},
+                **fields)
+    return {"company_number": number, "data": data}
+
+
+LINES = [
+    psc("00000001", "A"),
+    psc("00000001", "B", ceased_on="2020-01-01"),
+    psc("00000001", "S", kind="persons-with-significant-control-statement"),
+    psc("SC000002", "C"),
+    {"data": {"kind": "totals#persons-of-significant-control-snapshot",
+              "persons_of_significant_control_count": 3}},
+]
+
+
+def write_parts(tmp_path):
+    for part, lines in enumerate((LINES[:2], LINES[2:]), 1):
+        path = tmp_path / "psc-snapshot_{}of2.zip".format(part)
+        with zipfile.ZipFile(str(path), "w") as archive:
+            archive.writestr("psc-snapshot_{}of2.txt".format(part),
+                             "".join(json.dumps(l) + "\n" for l in lines))
+    return str(tmp_path / "psc-snapshot_*.zip")
+
+
+def test_records(tmp_path):
+    records = list(PSCSnapshot(write_parts(tmp_path)))
+    assert [(num, r["name"]) for num, r in records] == [
+        ("00000001", "A"), ("00000001", "B"), ("SC000002", "C")]
+
+
+def test_statements(tmp_path):
+    records = list(PSCSnapshot(write_parts(tmp_path), statements=True))
+    assert [r["name"] for _, r in records] == ["S"]
+
+
+def test_projection_and_filter(tmp_path):
+    snapshot = PSCSnapshot(write_parts(tmp_path), fields=["name"],
+                           company_numbers=["sc2", "not a number"])
+    assert list(snapshot) == [("SC000002", {"name": "C"})]
+
+
+def test_companies_match_api_shape(tmp_path):
+    """Records are grouped into list responses across part boundaries."""
+    snapshot = PSCSnapshot(write_parts(tmp_path), fields=["name", "kind"])
+    companies = dict(snapshot.companies())
+    body = companies["00000001"]
+    assert [item["name"] for item in body["items"]] == ["A", "B"]
+    assert body["total_results"] == 2
+    assert (body["active_count"], body["ceased_count"]) == (1, 1)
+    assert body["links"]["self"] == (
+        "/company/00000001/persons-with-significant-control")
+
+
+@responses.activate
+def test_seed_cache(tmp_path):
+    cache = ResponseCache()
+    assert PSCSnapshot(write_parts(tmp_path)).seed(cache) == 2
+    s = chwrapper.Search(access_token="pk.test", cache=cache)
+    res = s.persons_significant_control("1")
+    assert res.from_cache
+    assert res.json()["total_results"] == 2
+    assert len(responses.calls) == 0
+
+
+def test_plain_text_part(tmp_path):
+    path = tmp_path / "snapshot.txt"
+    path.write_text(json.dumps(LINES[3]) + "\n\n")
+    assert [num for num, _ in PSCSnapshot(str(path))] == ["SC000002"]
@@ -0,0 +1,166 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import responses
+
+import chwrapper
+from chwrapper.services.cache import (
+    CachedResponse,
+    CachePolicy,
+    ResponseCache,
+    cache_key,
+)
+
+PROFILE_URL = "https://api.companieshouse.gov.uk/company/00012345"
+HEADERS = {"X-Ratelimit-Remain": "10"}
+
+
+def add_profile(name):
+    responses.add(responses.GET, PROFILE_URL, json={"company_name": name},
+                  adding_headers=HEADERS)
+
+
+def age(cache, seconds):
+    for key in list(cache._entries):
+        cache._entries[key].stored_at -= seconds
+
+
+def test_cache_key_ignores_param_order():
+    """Keys are stable whatever order params are given in."""
+    assert cache_key("u", {"b": 1, "a": 2}) == cache_key("u", {"a": 2, "b": 1})
+    assert cache_key("u") == "u"
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first."""
+    cache = ResponseCache(max_entries=2)
+    for key in "abc":
+        if key == "c":
+            cache.get("a")
+        cache.set(key, CachedResponse(key, 200, {}, b"{}"))
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert len(cache) == 2
+
+
+def test_cached_response_round_trip():
+    """Rebuilt responses carry the original body and headers."""
+    entry = CachedResponse("u", 200, {"Content-Type": "application/json"},
+                           b'{"a": 1}')
+    res = entry.to_response()
+    assert res.json() == {"a": 1}
+    assert res.headers["content-type"] == "application/json"
+    assert res.from_cache
+
+
+def test_compressed_storage():
+    """Compressed entries round-trip and take less space."""
+    body = b'{"items": [' + b'{"company_name": "A"},' * 200 + b'{}]}'
+    cache = ResponseCache(compression="zlib")
+    cache.set("a", CachedResponse("a", 200, {}, body))
+    assert cache.get("a").to_response().content == body
+    assert cache.body_bytes == len(body)
+    assert cache.stored_bytes < len(body) / 10
+
+
+def test_byte_budget_eviction():
+    """Entries are evicted once the stored bytes exceed *max_bytes*."""
+    cache = ResponseCache(max_bytes=10)
+    for key in "abc":
+        cache.set(key, CachedResponse(key, 200, {}, b"12345"))
+    assert "a" not in cache and len(cache) == 2
+    assert cache.stored_bytes == 10
+    cache.delete("b")
+    assert cache.stored_bytes == 5
+
+
+def test_cache_module_doesnt_import_requests():
+    code = ("import sys, chwrapper.services.cache; "
+            "assert 'requests' not in sys.modules")
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_one_refresh_per_key():
+    """Clients sharing a cache don't refresh the same key twice at once."""
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def slow(name):
+        calls.append(name)
+        release.wait(5)
+
+    assert cache.refresh("k", slow, ("a",))
+    assert not cache.refresh("k", slow, ("b",))
+    release.set()
+    cache.shutdown(wait=True)
+    assert calls == ["a"]
+    assert cache.refresh("k", slow, ("c",))
+    cache.shutdown(wait=True)
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        ResponseCache(compression="lz4")
+
+
+class TestSearchCache:
+    """Search serves cached responses according to the policy"""
+
+    def search(self, **kwargs):
+        return chwrapper.Search(access_token="pk.test", cache=ResponseCache(),
+                                cache_policy=CachePolicy(60, 600), **kwargs)
+
+    @responses.activate
+    def test_fresh_response_served_from_cache(self):
+        add_profile("A")
+        s = self.search()
+        s.profile("12345")
+        res = s.profile("12345")
+        assert res.json() == {"company_name": "A"}
+        assert res.from_cache
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_stale_response_refreshed_in_background(self):
+        add_profile("A")
+        s = self.search()
+        s.profile("12345")
+        age(s.cache, 120)
+        responses.replace(responses.GET, PROFILE_URL,
+                          json={"company_name": "B"}, headers=HEADERS)
+
+        assert s.profile("12345").json() == {"company_name": "A"}
+        s.cache.shutdown(wait=True)
+        assert len(responses.calls) == 2
+        assert s.profile("12345").json() == {"company_name": "B"}
+
+    @responses.activate
+    def test_expired_response_fetched(self):
+        add_profile("A")
+        s = self.search()
+        s.profile("12345")
+        age(s.cache, 3600)
+        res = s.profile("12345")
+        assert not getattr(res, "from_cache", False)
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_endpoint_policy(self):
+        """Endpoints mapped to None are never cached."""
+        add_profile("A")
+        s = self.search(cache_policies={"profile": None})
+        s.profile("12345")
+        s.profile("12345")
+        assert len(responses.calls) == 2
+        assert len(s.cache) == 0
+
+    @responses.activate
+    def test_errors_not_cached(self):
+        responses.add(responses.GET, PROFILE_URL, status=429,
+                      adding_headers=HEADERS)
+        s = self.search()
+        s.profile("12345")
+        assert len(s.cache) == 0
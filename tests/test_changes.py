@@ -0,0 +1,89 @@
+import responses
+
+import chwrapper
+from chwrapper.services.changes import Change, diff_snapshots
+
+CHARGES = {
+    "etag": "a",
+    "total_count": 2,
+    "items": [
+        {"id": "c1", "status": "outstanding", "etag": "x"},
+        {"id": "c2", "status": "outstanding"},
+    ],
+}
+
+
+def test_matching_etag_short_circuits():
+    """Snapshots with the same etag aren't compared."""
+    assert diff_snapshots(CHARGES, dict(CHARGES, total_count=3)) == []
+
+
+def test_field_changes():
+    old = {"company_name": "A", "sic_codes": ["1", "2"],
+           "address": {"locality": "Leeds", "region": None}}
+    new = {"company_name": "B", "sic_codes": ["2", "3"],
+           "address": {"locality": "Leeds", "region": "Yorkshire"},
+           "has_charges": True}
+    assert diff_snapshots(old, new) == [
+        Change("changed", ("company_name",), "A", "B"),
+        Change("removed", ("sic_codes", "1"), "1", None),
+        Change("added", ("sic_codes", "3"), None, "3"),
+        Change("added", ("address", "region"), None, "Yorkshire"),
+        Change("added", ("has_charges",), None, True),
+    ]
+
+
+def test_items_matched_by_stable_key():
+    """Reordered items are matched by id rather than position."""
+    new = {
+        "etag": "b",
+        "total_count": 2,
+        "items": [
+            {"id": "c3", "status": "outstanding"},
+            {"id": "c1", "status": "fully-satisfied", "etag": "y"},
+        ],
+    }
+    assert diff_snapshots(CHARGES, new) == [
+        Change("changed", ("items", "c1", "status"), "outstanding",
+               "fully-satisfied"),
+        Change("removed", ("items", "c2"), {"id": "c2",
+                                            "status": "outstanding"}, None),
+        Change("added", ("items", "c3"), None, {"id": "c3",
+                                                "status": "outstanding"}),
+    ]
+
+
+def test_officers_keyed_by_appointment_link():
+    def officer(link, resigned=None):
+        item = {"name": "SMITH, John", "links": {"self": link}}
+        if resigned:
+            item["resigned_on"] = resigned
+        return item
+
+    old = {"items": [officer("/a/1"), officer("/a/2")]}
+    new = {"items": [officer("/a/2"), officer("/a/1", "2020-01-01")]}
+    assert diff_snapshots(old, new) == [
+        Change("added", ("items", "/a/1", "resigned_on"), None, "2020-01-01"),
+    ]
+
+
+def test_unkeyed_items_compared_whole():
+    old = {"previous_company_names": [{"name": "A"}]}
+    new = {"previous_company_names": [{"name": "B"}, {"name": "A"}]}
+    changes = diff_snapshots(old, new)
+    assert [c.kind for c in changes] == ["changed"]
+
+
+@responses.activate
+def test_diff_responses():
+    url = "https://api.companieshouse.gov.uk/company/00012345"
+    headers = {"X-Ratelimit-Remain": "10"}
+    responses.add(responses.GET, url, json={"company_status": "active"},
+                  adding_headers=headers)
+    responses.add(responses.GET, url, json={"company_status": "dissolved"},
+                  adding_headers=headers)
+    s = chwrapper.Search(access_token="pk.test")
+    old, new = s.profile("12345"), s.profile("12345")
+    assert diff_snapshots(old, new) == [
+        Change("changed", ("company_status",), "active", "dissolved"),
+    ]
@@ -0,0 +1,139 @@
+import csv
+import json
+
+import responses
+
+from chwrapper import cli
+
+PROFILE_URL = "https://api.companieshouse.gov.uk/company/{}"
+HEADERS = {"X-Ratelimit-Remain": "10"}
+
+
+def add_profile(num, status=200):
+    responses.add(
+        responses.GET,
+        PROFILE_URL.format(num),
+        status=status,
+        json={"company_number": num},
+        adding_headers=HEADERS,
+    )
+
+
+def run(tmp_path, *extra, lines=("1", "2", "3")):
+    source = tmp_path / "input.txt"
+    source.write_text("\n".join(lines) + "\n")
+    output = tmp_path / "output"
+    args = cli.parse_args(
+        ["profile", "-i", str(source), "-o", str(output),
+         "--access-token", "pk.test"] + list(extra))
+    return cli.run(args), output
+
+
+@responses.activate
+def test_ndjson_output_in_input_order(tmp_path):
+    """Records are written in input order with the response JSON."""
+    for num in ("00000001", "00000002", "00000003"):
+        add_profile(num)
+
+    done, output = run(tmp_path, "-w", "3")
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert done == 3
+    assert [r["input"] for r in records] == ["1", "2", "3"]
+    assert records[2]["data"] == {"company_number": "00000003"}
+
+
+@responses.activate
+def test_errors_are_recorded(tmp_path):
+    """Bad inputs and HTTP errors are written rather than raised."""
+    add_profile("00000001", status=404)
+
+    _, output = run(tmp_path, "-f", "csv", lines=("1", "bad/num"))
+
+    rows = list(csv.DictReader(output.open()))
+    assert rows[0]["status"] == "404"
+    assert rows[1]["status"] == ""
+    assert "Invalid company number" in rows[1]["error"]
+
+
+@responses.activate
+def test_resume_from_checkpoint(tmp_path):
+    """A checkpointed job skips inputs that were already written."""
+    checkpoint = tmp_path / "job.checkpoint"
+    checkpoint.write_text(json.dumps({"done": 2}))
+    (tmp_path / "output").write_text('{"input": "1"}\n{"input": "2"}\n')
+    add_profile("00000003")
+
+    done, output = run(tmp_path, "-c", str(checkpoint))
+
+    assert done == 3
+    assert len(responses.calls) == 1
+    assert len(output.read_text().splitlines()) == 3
+    assert json.loads(checkpoint.read_text()) == {
+        "done": 3, "offset": len(output.read_bytes())}
+
+
+@responses.activate
+def test_resume_drops_rows_after_checkpoint(tmp_path):
+    """Rows written after the last checkpoint aren't repeated on resume."""
+    checkpoint = tmp_path / "job.checkpoint"
+    written = '{"input": "1"}\n'
+    checkpoint.write_text(json.dumps({"done": 1, "offset": len(written)}))
+    (tmp_path / "output").write_text(written + '{"input": "2"}\n')
+    add_profile("00000002")
+    add_profile("00000003")
+
+    done, output = run(tmp_path, "-c", str(checkpoint))
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert done == 3
+    assert [r["input"] for r in records] == ["1", "2", "3"]
+
+
+@responses.activate
+def test_invalid_json_recorded(tmp_path):
+    """A non-JSON body fails its own record rather than the job."""
+    responses.add(responses.GET, PROFILE_URL.format("00000001"),
+                  body="<html>", adding_headers=HEADERS)
+    add_profile("00000002")
+
+    done, output = run(tmp_path, lines=("1", "2"))
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert done == 2
+    assert "Invalid JSON" in records[0]["error"]
+    assert records[1]["data"] == {"company_number": "00000002"}
+
+
+@responses.activate
+def test_repeated_inputs_served_from_cache(tmp_path):
+    add_profile("00000001")
+
+    done, output = run(tmp_path, "-w", "1", lines=("1", "1", "1"))
+
+    assert done == 3
+    assert len(output.read_text().splitlines()) == 3
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_adaptive_concurrency(tmp_path):
+    """Adaptive runs produce the same output as fixed concurrency."""
+    for num in ("00000001", "00000002", "00000003"):
+        add_profile(num)
+
+    done, output = run(tmp_path, "-w", "4", "--adaptive")
+
+    assert done == 3
+    assert len(output.read_text().splitlines()) == 3
+
+
+def test_dry_run(tmp_path, capsys):
+    """A dry run prints the plan without making any requests."""
+    done, output = run(tmp_path, "--dry-run", lines=("1", "bad/num", "3"))
+
+    plan = json.loads(capsys.readouterr().out)
+    assert done == 3
+    assert plan["calls"] == 2
+    assert plan["endpoints"]["profile"]["invalid"] == 1
+    assert not output.exists()
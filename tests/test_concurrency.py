@@ -0,0 +1,95 @@
+import itertools
+import threading
+
+import pytest
+import requests
+
+from chwrapper.services.concurrency import AdaptiveConcurrency, ordered_map
+
+HEALTHY = {"X-Ratelimit-Remain": "500", "X-Ratelimit-Limit": "600"}
+
+
+def test_additive_increase():
+    """Healthy responses raise the limit by about one per round trip."""
+    controller = AdaptiveConcurrency(initial=1, maximum=4)
+    for _ in range(10):
+        assert controller.acquire()
+        controller.release(0.1, 200, HEALTHY)
+    assert controller.limit == 4
+    assert controller.in_flight == 0
+
+
+def test_multiplicative_decrease_once_per_round_trip():
+    """A burst of 429s from one round trip only cuts the limit once."""
+    controller = AdaptiveConcurrency(initial=8)
+    controller.latency = 60.0
+    for _ in range(3):
+        controller.acquire()
+    for _ in range(3):
+        controller.release(0.1, 429)
+    assert controller.limit == 4
+    assert controller.decreases == 1
+
+
+@pytest.mark.parametrize("kwargs", [{"status": 503}, {"failed": True}])
+def test_errors_decrease(kwargs):
+    """Server errors and failed requests are treated as congestion."""
+    controller = AdaptiveConcurrency(initial=8, minimum=2)
+    controller.acquire()
+    controller.release(0.1, **kwargs)
+    assert controller.limit == 4
+
+
+def test_latency_spike_decreases():
+    """Latency well above the moving average is treated as congestion."""
+    controller = AdaptiveConcurrency(initial=8)
+    controller.acquire()
+    controller.release(0.1, 200, HEALTHY)
+    controller.acquire()
+    controller.release(1.0, 200, HEALTHY)
+    assert controller.limit == 4
+
+
+def test_low_headroom_holds():
+    """The limit stops growing when the rate limit window is nearly spent."""
+    controller = AdaptiveConcurrency(initial=2)
+    controller.acquire()
+    controller.release(0.1, 200, {"X-Ratelimit-Remain": "5",
+                                  "X-Ratelimit-Limit": "600"})
+    assert controller._limit == 2.0
+
+
+def test_acquire_blocks_at_limit():
+    """No more than limit slots can be held at once."""
+    controller = AdaptiveConcurrency(initial=1)
+    assert controller.acquire()
+    assert not controller.acquire(timeout=0.01)
+    threading.Timer(0.01, controller.release).start()
+    assert controller.acquire(timeout=1)
+
+
+def test_slot_reports_http_errors():
+    """HTTPErrors are reported with their response's status."""
+    controller = AdaptiveConcurrency(initial=4)
+    response = requests.Response()
+    response.status_code = 404
+    with pytest.raises(requests.exceptions.HTTPError):
+        with controller.slot():
+            raise requests.exceptions.HTTPError(response=response)
+    assert controller.decreases == 0
+    assert controller.in_flight == 0
+
+
+def test_ordered_map_reads_lazily():
+    """Only a window of items is taken ahead of the results consumed."""
+    taken = []
+
+    def items():
+        for i in itertools.count():
+            taken.append(i)
+            yield i
+
+    results = ordered_map(lambda i: i * 2, items(), workers=2)
+    assert list(itertools.islice(results, 5)) == [0, 2, 4, 6, 8]
+    assert len(taken) <= 5 + 4
+    results.close()
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+import responses
+
+import chwrapper
+from chwrapper.services import base
+from chwrapper.services.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    current_deadline,
+    deadline_scope,
+)
+
+PROFILE_URL = "https://api.companieshouse.gov.uk/company/00012345"
+
+
+def test_coerce():
+    """Numbers become deadlines and deadlines pass through."""
+    deadline = Deadline.coerce(5)
+    assert 4 < deadline.remaining() <= 5
+    assert Deadline.coerce(deadline) is deadline
+    assert Deadline.coerce(None) is None
+
+
+def test_check():
+    with pytest.raises(DeadlineExceeded):
+        Deadline(-1).check()
+    Deadline(1).check()
+
+
+def test_scope():
+    deadline = Deadline(1)
+    with deadline_scope(deadline):
+        assert current_deadline() is deadline
+    assert current_deadline() is None
+
+
+def test_limiter_fails_fast():
+    """The limiter doesn't sleep when the reset is past the deadline."""
+    limiter = chwrapper.RateLimiter()
+    limiter.update({"X-Ratelimit-Remain": "0",
+                    "X-Ratelimit-Reset": str(int(time.time()) + 300)})
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(Deadline(1))
+
+
+class TestSearchDeadline:
+    """Search passes timeouts and respects deadlines"""
+
+    def capture(self, monkeypatch, s):
+        calls = []
+        original = s.session.get
+
+        def get(url, **kwargs):
+            calls.append(kwargs)
+            return original(url, **kwargs)
+
+        monkeypatch.setattr(s.session, "get", get)
+        return calls
+
+    @responses.activate
+    def test_default_timeout(self, monkeypatch):
+        responses.add(responses.GET, PROFILE_URL, json={},
+                      adding_headers={"X-Ratelimit-Remain": "10"})
+        s = chwrapper.Search(access_token="pk.test")
+        calls = self.capture(monkeypatch, s)
+        s.profile("12345")
+        assert calls[0]["timeout"] == (3.05, 30)
+
+    @responses.activate
+    def test_deadline_bounds_timeout(self, monkeypatch):
+        responses.add(responses.GET, PROFILE_URL, json={},
+                      adding_headers={"X-Ratelimit-Remain": "10"})
+        s = chwrapper.Search(access_token="pk.test", timeout=None)
+        calls = self.capture(monkeypatch, s)
+        s.profile("12345", deadline=2)
+        assert 0 < calls[0]["timeout"] <= 2
+
+    @responses.activate
+    def test_expired_deadline_not_sent(self):
+        s = chwrapper.Search(access_token="pk.test")
+        with pytest.raises(DeadlineExceeded):
+            s.profile("12345", deadline=0)
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_rate_limit_sleep_skipped(self, monkeypatch):
+        """A response isn't held past the deadline waiting for the reset."""
+        slept = []
+        monkeypatch.setattr(base, "sleep", slept.append)
+        responses.add(
+            responses.GET, PROFILE_URL, json={},
+            adding_headers={"X-Ratelimit-Remain": "0",
+                            "X-Ratelimit-Reset": str(int(time.time()) + 300)})
+        s = chwrapper.Search(access_token="pk.test")
+        assert s.profile("12345", deadline=5).status_code == 200
+        assert slept == []
+        with pytest.raises(DeadlineExceeded):
+            s.profile("12345", deadline=5)
@@ -0,0 +1,139 @@
+import responses
+
+import chwrapper
+from chwrapper.services import documents
+from chwrapper.services.concurrency import AdaptiveConcurrency
+from chwrapper.services.documents import DocumentDownloader, document_id
+
+DOC_URI = "https://document-api.companieshouse.gov.uk/document/"
+HEADERS = {"X-Ratelimit-Remain": "10", "X-Ratelimit-Reset": "9999999999"}
+
+
+def item(doc, category="accounts", type_="AA"):
+    return {"category": category, "type": type_, "transaction_id": "t" + doc,
+            "links": {"document_metadata":
+                      "https://frontend-doc-api.company-information.service"
+                      ".gov.uk/document/" + doc}}
+
+
+def add_metadata(doc, resources):
+    responses.add(responses.GET, DOC_URI + doc,
+                  json={"company_number": "00000001",
+                        "resources": resources},
+                  adding_headers=HEADERS)
+
+
+def downloader(**kwargs):
+    client = chwrapper.Search(access_token="pk.test")
+    return DocumentDownloader(lambda: client, **kwargs)
+
+
+def test_document_id():
+    assert document_id(item("abc")) == "abc"
+    assert document_id({"links": {}}) is None
+
+
+def test_select_filters_category_and_type():
+    items = [item("a"), item("b", type_="AA01"),
+             item("c", category="officers"), {"category": "accounts"}]
+    selected = downloader(categories=["accounts"], types=["AA"]).select(items)
+    assert [document_id(i) for i in selected] == ["a"]
+
+
+@responses.activate
+def test_metadata_endpoint():
+    add_metadata("abc", {"application/pdf": {"content_length": 10}})
+    res = chwrapper.Search(access_token="pk.test").document_metadata("abc")
+    assert res.json()["resources"]["application/pdf"]["content_length"] == 10
+
+
+@responses.activate
+def test_document_content_type():
+    """The requested content type is sent as the Accept header."""
+    responses.add(responses.GET, DOC_URI + "abc/content", body=b"<html/>",
+                  adding_headers=HEADERS)
+    s = chwrapper.Search(access_token="pk.test")
+    s.document("abc", content_type="application/xhtml+xml")
+    assert responses.calls[0].request.headers["Accept"] == (
+        "application/xhtml+xml")
+
+
+@responses.activate
+def test_download_prefers_xhtml(tmp_path):
+    add_metadata("a", {"application/pdf": {"content_length": 90000},
+                       "application/xhtml+xml": {"content_length": 7}})
+    responses.add(responses.GET, DOC_URI + "a/content", body=b"<html/>",
+                  adding_headers=HEADERS)
+
+    results = downloader().download([item("a")], str(tmp_path))
+
+    assert results[0].content_type == "application/xhtml+xml"
+    assert results[0].skipped is None
+    assert (tmp_path / "00000001_ta.xhtml").read_bytes() == b"<html/>"
+    assert responses.calls[1].request.headers["Accept"] == (
+        "application/xhtml+xml")
+
+
+@responses.activate
+def test_download_skips_large_and_existing(tmp_path):
+    add_metadata("a", {"application/pdf": {"content_length": 5000}})
+    add_metadata("b", {"application/pdf": {"content_length": 50}})
+    (tmp_path / "00000001_tb.pdf").write_bytes(b"%PDF")
+
+    results = downloader(max_bytes=1000).download([item("a"), item("b")],
+                                                  str(tmp_path))
+
+    assert [r.skipped for r in results] == ["too large", None]
+    assert results[1].path.endswith("00000001_tb.pdf")
+    # Only the two metadata requests were made
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_download_reports_errors(tmp_path):
+    responses.add(responses.GET, DOC_URI + "a", status=404,
+                  adding_headers=HEADERS)
+    results = downloader().download([item("a")], str(tmp_path))
+    assert "404" in results[0].skipped
+
+
+@responses.activate
+def test_size_limit_enforced_while_streaming(tmp_path):
+    """Documents without a size in their metadata still honour max_bytes."""
+    add_metadata("a", {"application/pdf": {}})
+    responses.add(responses.GET, DOC_URI + "a/content", body=b"x" * 5000,
+                  adding_headers=HEADERS)
+    results = downloader(max_bytes=1000).download([item("a")], str(tmp_path))
+    assert results[0].skipped == "too large"
+    assert list(tmp_path.iterdir()) == []
+
+
+@responses.activate
+def test_rate_limited_without_headers_backs_off(tmp_path, monkeypatch):
+    slept = []
+    monkeypatch.setattr(documents, "sleep", slept.append)
+    responses.add(responses.GET, DOC_URI + "a", status=429)
+    results = downloader(retries=2).download([item("a")], str(tmp_path))
+    assert results[0].skipped == "429 Too Many Requests"
+    assert slept == [1, 2]
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_download_reports_to_controller(tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, "sleep", lambda seconds: None)
+    responses.add(responses.GET, DOC_URI + "a", status=429)
+    controller = AdaptiveConcurrency(initial=2)
+    downloader(retries=1, controller=controller).download([item("a")],
+                                                          str(tmp_path))
+    assert controller.decreases >= 1
+    assert controller.in_flight == 0
+
+
+def test_document_host_rate_limited():
+    """Document calls wait on the client's own document limiter."""
+    factory = chwrapper.ClientFactory(access_token="pk.test")
+    adapter = factory.get().session.get_adapter(DOC_URI)
+    assert adapter.limiter is factory.document_limiter
+    assert factory.document_limiter.key.endswith(
+        "@document-api.companieshouse.gov.uk")
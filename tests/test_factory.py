@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+import pytest
+
+import chwrapper
+from chwrapper.services.deadline import Deadline, DeadlineExceeded
+from chwrapper.services.factory import ClientFactory
+from chwrapper.services.state import RateLimitStore
+
+
+def test_client_per_thread():
+    """Each thread gets its own client sharing the factory's limiter."""
+    factory = ClientFactory(access_token="pk.test")
+    clients = []
+
+    def worker():
+        clients.append(factory.get())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, clients))) == 3
+    assert all(c.limiter is factory.limiter for c in clients)
+    adapter = clients[0].session.get_adapter("https://api.companieshouse.gov.uk/")
+    assert adapter.limiter is factory.limiter
+
+
+def test_same_thread_reuses_client():
+    """Repeated calls from one thread return the same client."""
+    factory = ClientFactory(access_token="pk.test", validate=False)
+    assert factory() is factory.get()
+    assert factory.get().validate is False
+    assert isinstance(factory.get(), chwrapper.Search)
+
+
+def test_close():
+    """Closing the factory drops the clients it created."""
+    factory = ClientFactory(access_token="pk.test")
+    client = factory.get()
+    factory.close()
+    assert factory.get() is not client
+
+
+def test_new_process_gets_new_clients(monkeypatch):
+    """Clients aren't reused by a process other than the one creating them."""
+    factory = ClientFactory(access_token="pk.test")
+    client = factory.get()
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    assert factory.get() is not client
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_resets_clients():
+    """A forked child builds its own clients rather than reusing sockets."""
+    factory = ClientFactory(access_token="pk.test")
+    parent_client = factory.get()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if factory.get() is not parent_client else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert factory.get() is parent_client
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_replaces_shared_locks():
+    """Locks held in the parent at the fork don't block the child."""
+    cache = chwrapper.ResponseCache()
+    breakers = chwrapper.CircuitBreakers()
+    breakers.get("api.companieshouse.gov.uk")
+    dns_cache = chwrapper.DNSCache()
+    factory = ClientFactory(access_token="pk.test", cache=cache,
+                            breakers=breakers, dns_cache=dns_cache)
+    locks = [cache._lock, breakers._lock, dns_cache._lock,
+             breakers.get("api.companieshouse.gov.uk")._lock]
+    for lock in locks:
+        lock.acquire()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            factory.get()
+            cache.get("key")
+            breakers.get("api.companieshouse.gov.uk").allow()
+            dns_cache.clear()
+            os._exit(0)
+    finally:
+        for lock in locks:
+            lock.release()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        time.sleep(0.01)
+    else:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        pytest.fail("child deadlocked")
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_shared_limiter_lock_kept():
+    """A second factory on the same limiter leaves its lock alone."""
+    limiter = chwrapper.RateLimiter()
+    lock = limiter._lock
+    ClientFactory(access_token="pk.test", limiter=limiter)
+    ClientFactory(access_token="pk.test", limiter=limiter)
+    assert limiter._lock is lock
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_workers_share_store_budget(tmp_path):
+    """Children of a factory with a stored limiter don't overspend."""
+    path = str(tmp_path / "limits.json")
+    store = RateLimitStore(path)
+    limiter = chwrapper.RateLimiter(store, "pk.test")
+    store.save(limiter.key, 600, 6, int(time.time()) + 60)
+    factory = ClientFactory(access_token="pk.test", limiter=limiter)
+    pids = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            calls = 0
+            try:
+                while calls < 10:
+                    factory.limiter.acquire(Deadline(5))
+                    calls += 1
+            except DeadlineExceeded:
+                pass
+            os._exit(calls)
+        pids.append(pid)
+    spent = [os.WEXITSTATUS(os.waitpid(pid, 0)[1]) for pid in pids]
+    assert sum(spent) == 6
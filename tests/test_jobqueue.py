@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from chwrapper.services.jobqueue import SQLiteJobQueue, partition, run_worker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_partition():
+    shards = list(partition(["1", "00000001", "2", "bad/num", "3"], 2))
+    assert shards == [["00000001", "00000002"], ["00000003"]]
+
+
+def test_create_is_idempotent(queue):
+    assert queue.create("job", range(1, 11), shard_size=4) == 3
+    assert queue.create("job", range(1, 11), shard_size=4) == 0
+    assert queue.progress("job") == {"pending": 3, "done": 0, "failed": 0}
+
+
+def test_claims_are_exclusive(queue):
+    queue.create("job", range(1, 5), shard_size=2)
+    first, second = queue.claim("job"), queue.claim("job")
+    assert (first.index, second.index) == (0, 1)
+    assert queue.claim("job") is None
+
+
+def test_expired_lease_reclaimed(queue):
+    """A crashed worker's shard is claimable once its lease expires."""
+    queue.create("job", ["1"])
+    crashed = queue.claim("job", visibility=0.05)
+    assert queue.claim("job") is None
+    time.sleep(0.1)
+    shard = queue.claim("job")
+    assert shard.index == crashed.index and shard.attempts == 2
+    # The old lease can't be extended once taken over
+    assert not queue.extend(crashed)
+    assert queue.extend(shard)
+
+
+def test_complete_is_idempotent(queue):
+    queue.create("job", ["1"])
+    shard = queue.claim("job")
+    assert queue.complete(shard, {"00000001": "A"})
+    assert not queue.complete(shard, {"00000001": "B"})
+    assert list(queue.results("job")) == [(0, {"00000001": "A"})]
+
+
+def test_release_and_max_attempts(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    queue.create("job", ["1"])
+    queue.release(queue.claim("job"))
+    queue.release(queue.claim("job"))
+    assert queue.claim("job") is None
+    assert queue.progress("job")["failed"] == 1
+
+
+def test_workers_process_every_shard_once(queue):
+    queue.create("job", range(1, 101), shard_size=7)
+    calls = []
+    workers = [threading.Thread(target=run_worker,
+                                args=(queue, "job", calls.append),
+                                kwargs={"poll": 0.01})
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(calls) == 100 == len(set(calls))
+    results = dict(queue.results("job"))
+    assert len(results) == 15
+    assert queue.progress("job")["done"] == 15
+
+
+def test_worker_releases_on_error(queue):
+    queue.create("job", ["1"])
+
+    def fail(num):
+        raise RuntimeError(num)
+
+    with pytest.raises(RuntimeError):
+        run_worker(queue, "job", fail)
+    assert run_worker(queue, "job", str) == 1
+
+
+def test_worker_takes_over_crashed_lease(queue):
+    """A worker waits out a crashed worker's lease, then takes its shard."""
+    queue.create("job", range(1, 5), shard_size=1)
+    crashed = queue.claim("job", visibility=0.2)
+    assert run_worker(queue, "job", str, visibility=1) == 4
+    assert queue.progress("job") == {"pending": 0, "done": 4, "failed": 0}
+    assert not queue.extend(crashed)
+
+
+def test_worker_without_wait(queue):
+    queue.create("job", range(1, 3), shard_size=1)
+    queue.claim("job")
+    assert run_worker(queue, "job", str, wait=False) == 1
+    assert queue.progress("job")["pending"] == 1
+    assert queue.next_expiry("job") > time.time()
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import chwrapper
+from chwrapper.services.concurrency import AdaptiveConcurrency
+from chwrapper.services.pipeline import Pipeline, Stage, search_stage
+from chwrapper.services.transport import StubTransport
+
+
+def test_stages_chain():
+    pipeline = Pipeline([
+        Stage("split", lambda n: range(n), flat=True),
+        Stage("square", lambda n: n * n, workers=3),
+        Stage("odd", lambda n: n if n % 2 else None, workers=2),
+    ])
+    assert sorted(pipeline.run([2, 3])) == [1, 1]
+    metrics = pipeline.metrics()
+    assert metrics["split"]["emitted"] == 5
+    assert metrics["square"]["processed"] == 5
+    assert metrics["odd"]["emitted"] == 2
+
+
+def test_back_pressure():
+    """A slow stage stops the source being read ahead of it."""
+    read = []
+
+    def source():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    pipeline = Pipeline([Stage("slow", lambda n: time.sleep(0.01) or n,
+                               queue_size=2)])
+    results = pipeline.run(source())
+    next(results)
+    time.sleep(0.05)
+    # The queue, the worker and the output queue hold a handful at most
+    assert len(read) < 10
+    results.close()
+    assert pipeline.cancelled
+
+
+def test_errors_raised():
+    def fail(n):
+        raise KeyError(n)
+
+    with pytest.raises(KeyError):
+        list(Pipeline([Stage("fail", fail, workers=2)]).run(range(10)))
+
+
+def test_errors_skipped():
+    pipeline = Pipeline([Stage("div", lambda n: 1 / n)], errors="skip")
+    assert sorted(pipeline.run([0, 1, 2])) == [0.5, 1.0]
+    assert pipeline.metrics()["div"]["failed"] == 1
+
+
+def test_cancel_from_another_thread():
+    pipeline = Pipeline([Stage("slow", lambda n: time.sleep(0.01) or n)])
+    threading.Timer(0.05, pipeline.cancel).start()
+    assert len(list(pipeline.run(range(1000)))) < 1000
+
+
+def test_search_stages():
+    transport = StubTransport()
+    transport.add("/search/companies", {"items": [
+        {"company_number": "00000001"}, {"company_number": "00000002"}]})
+    transport.add("/company/00000001", {"company_name": "A"})
+    transport.add("/company/00000002", {"company_name": "B"})
+    factory = chwrapper.ClientFactory(access_token="pk.test",
+                                      transport=transport)
+
+    pipeline = Pipeline([
+        search_stage(factory, "search_companies", workers=1, items=True,
+                     name="search"),
+        Stage("number", lambda item: item["company_number"]),
+        search_stage(factory, "profile", workers=2),
+    ])
+    names = sorted(p["company_name"] for p in pipeline.run(["acme"]))
+    assert names == ["A", "B"]
+    assert pipeline.metrics()["profile"]["throughput"] > 0
+
+
+def test_rate_limited_search_counts_as_failed():
+    """A 429 returned while rate limiting isn't passed on as a result."""
+    transport = StubTransport()
+    transport.add("/company/00000001", {"company_name": "A"})
+    transport.add("/company/00000002", {"error": "rate limited"},
+                  status=429)
+    factory = chwrapper.ClientFactory(access_token="pk.test",
+                                      transport=transport)
+    pipeline = Pipeline([search_stage(factory, "profile")], errors="skip")
+    results = list(pipeline.run(["00000001", "00000002"]))
+    assert results == [{"company_name": "A"}]
+    assert pipeline.metrics()["profile"]["failed"] == 1
+
+
+def test_rate_limited_search_retried():
+    """A 429 from an exhausted window is retried once the window resets."""
+    transport = StubTransport(limit=2, window=1)
+    for num in ("00000001", "00000002", "00000003"):
+        transport.add("/company/" + num, {"company_number": num})
+    # Another client uses up the window behind the factory's limiter
+    other = chwrapper.Search(access_token="pk.test", transport=transport)
+    other.profile("00000001")
+    other.profile("00000001")
+    factory = chwrapper.ClientFactory(access_token="pk.test",
+                                      transport=transport)
+    controller = AdaptiveConcurrency(maximum=2)
+    pipeline = Pipeline([search_stage(factory, "profile", workers=1,
+                                      controller=controller)])
+    results = list(pipeline.run(["00000001", "00000002", "00000003"]))
+    assert len(results) == 3
+    assert controller.decreases == 1
+
+
+def test_run_async():
+    async def double(n):
+        await asyncio.sleep(0)
+        return 2 * n
+
+    async def source():
+        for i in range(5):
+            yield i
+
+    async def main():
+        pipeline = Pipeline([Stage("double", double, workers=2),
+                             Stage("inc", lambda n: n + 1, workers=2)])
+        return sorted([n async for n in pipeline.run_async(source())])
+
+    assert asyncio.run(main()) == [1, 3, 5, 7, 9]
+
+
+def test_run_async_errors():
+    async def main():
+        pipeline = Pipeline([Stage("div", lambda n: 1 / n)])
+        return [n async for n in pipeline.run_async([1, 0])]
+
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(main())
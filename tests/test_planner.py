@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import chwrapper
+from chwrapper.services.cache import ResponseCache
+from chwrapper.services.planner import JobPlanner
+from chwrapper.services.transport import StubTransport
+
+
+def client(**kwargs):
+    transport = StubTransport()
+    transport.add("/company/00000001", {"company_name": "A"})
+    transport.add("/company/00000001/officers",
+                  {"total_results": 250, "items_per_page": 35, "items": []})
+    transport.add("/company/00000002/officers",
+                  {"total_results": 10, "items_per_page": 35, "items": []})
+    return chwrapper.Search(access_token="pk.test", transport=transport,
+                            **kwargs)
+
+
+def test_cache_hits_not_counted():
+    s = client(cache=ResponseCache())
+    s.profile("1")
+    plan = JobPlanner(s).plan(["1", "2", "x/y", ""], ["profile"])
+    assert plan.endpoints["profile"].cached == 1
+    assert plan.endpoints["profile"].invalid == 1
+    assert plan.calls == 1
+    assert plan.probe_calls == 0
+
+
+def test_stale_entries_count_as_calls():
+    s = client(cache=ResponseCache(),
+               cache_policy=chwrapper.CachePolicy(fresh=0, stale=3600))
+    s.profile("1")
+    time.sleep(0.01)
+    assert JobPlanner(s).plan(["1"], ["profile"]).calls == 1
+
+
+def test_pages_estimated_from_probes():
+    """Probes read total_results to estimate the pages per input."""
+    s = client(cache=ResponseCache())
+    plan = JobPlanner(s).plan(["1", "2"], ["officers"], probes=2)
+    officers = plan.endpoints["officers"]
+    assert officers.pages == 4.5
+    assert plan.probe_calls == 2
+    # The probes cached the first pages, leaving 7 later pages to fetch
+    assert officers.cached == 2
+    assert plan.calls == 7
+
+
+def test_no_probes_assumes_one_page():
+    s = client()
+    plan = JobPlanner(s).plan(["1", "2"], ["officers", "profile"], probes=0)
+    assert plan.probe_calls == 0
+    assert plan.calls == 4
+
+
+def test_seconds_from_rate_window():
+    s = client()
+    s.limiter.update({"X-Ratelimit-Remain": "100", "X-Ratelimit-Limit": "600",
+                      "X-Ratelimit-Reset": str(int(time.time()) + 60)})
+    planner = JobPlanner(s, workers=10, latency=0.1)
+    assert planner.estimate_seconds(100) == pytest.approx(1.0)
+    # 100 now, then two more windows for the remaining 1000
+    assert planner.estimate_seconds(1100) == pytest.approx(360, abs=1)
+    # A second key adds its own full window straight away
+    keys = JobPlanner(s, keys=2, workers=10, latency=0.1)
+    assert keys.estimate_seconds(700) == pytest.approx(7)
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+import responses
+
+import chwrapper
+from chwrapper.services.cache import ResponseCache
+from chwrapper.services.concurrency import AdaptiveConcurrency
+from chwrapper.services.prefetch import Prefetcher
+
+BASE = "https://api.companieshouse.gov.uk/company/00012345"
+PROFILE = {
+    "company_number": "00012345",
+    "links": {
+        "self": "/company/00012345",
+        "officers": "/company/00012345/officers",
+        "charges": "/company/00012345/charges",
+    },
+}
+
+
+def add(url, body, remain="500"):
+    responses.add(
+        responses.GET, url, json=body,
+        adding_headers={"X-Ratelimit-Remain": remain,
+                        "X-Ratelimit-Reset": str(int(time.time()) + 300)})
+
+
+@responses.activate
+def test_links_prefetched_into_cache():
+    add(BASE, PROFILE)
+    add(BASE + "/officers", {"items": []})
+    add(BASE + "/charges", {"items": []})
+    prefetcher = Prefetcher(links=["officers", "charges"])
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache(),
+                         prefetcher=prefetcher)
+
+    s.profile("12345")
+    prefetcher.shutdown()
+    assert prefetcher.fetched == 2
+    assert len(responses.calls) == 3
+
+    assert s.officers("12345").from_cache
+    assert s.charges("12345").from_cache
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_prefetch_through_controller():
+    add(BASE, PROFILE)
+    add(BASE + "/officers", {"items": []})
+    controller = AdaptiveConcurrency()
+    prefetcher = Prefetcher(links=["officers"], controller=controller)
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache(),
+                         prefetcher=prefetcher)
+    s.profile("12345")
+    prefetcher.shutdown()
+    assert prefetcher.fetched == 1
+    assert controller.increases == 1
+    assert controller.in_flight == 0
+
+
+@responses.activate
+def test_only_configured_links():
+    add(BASE, PROFILE)
+    add(BASE + "/charges", {"items": []})
+    prefetcher = Prefetcher(links=["charges"])
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache(),
+                         prefetcher=prefetcher)
+    s.profile("12345")
+    prefetcher.shutdown()
+    urls = [call.request.url for call in responses.calls]
+    assert not any("officers" in url for url in urls)
+
+
+@responses.activate
+def test_stops_when_headroom_low():
+    add(BASE, PROFILE, remain="10")
+    prefetcher = Prefetcher(links=["officers"], min_remaining=50)
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache(),
+                         prefetcher=prefetcher)
+    s.profile("12345")
+    prefetcher.shutdown()
+    assert prefetcher.skipped == 1
+    assert len(responses.calls) == 1
+
+
+def test_configuration_errors():
+    with pytest.raises(ValueError):
+        Prefetcher(links=["not_a_link"])
+    with pytest.raises(ValueError):
+        chwrapper.Search(access_token="pk.test", prefetcher=Prefetcher())
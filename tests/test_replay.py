@@ -0,0 +1,89 @@
+import time
+
+import chwrapper
+from chwrapper.services.replay import (
+    Exchange,
+    RecordingTransport,
+    ReplayTransport,
+    TrafficArchive,
+    replay_traffic,
+)
+from chwrapper.services.transport import StubTransport
+
+
+def record(tmp_path, latency=0):
+    stub = StubTransport(latency=latency)
+    stub.add("/company/00012345", {"company_name": "A"})
+    stub.add("/search/companies?q=a", {"items": [1]})
+    recorder = RecordingTransport(stub)
+    s = chwrapper.Search(access_token="pk.test", transport=recorder)
+    s.profile("12345")
+    s.search_companies("a")
+    s.profile("12345")
+    path = str(tmp_path / "traffic.jsonl.gz")
+    recorder.archive.save(path)
+    return path
+
+
+def test_round_trip(tmp_path):
+    archive = TrafficArchive.load(record(tmp_path))
+    assert len(archive) == 3
+    first = archive.exchanges[0]
+    assert first.url == "/company/00012345"
+    assert first.body == b'{"company_name": "A"}'
+    assert first.headers["X-Ratelimit-Remain"] == "599"
+    assert archive.exchanges[1].url == "/search/companies?q=a"
+
+
+def test_replay(tmp_path):
+    replay = ReplayTransport(record(tmp_path), speed=None)
+    s = chwrapper.Search(access_token="other", rate_limit=False,
+                         transport=replay)
+    s._ignore_codes.append(404)
+    assert s.search_companies("a").json() == {"items": [1]}
+    assert s.profile("12345").headers["X-Ratelimit-Remain"] == "599"
+    assert s.profile("12345").headers["X-Ratelimit-Remain"] == "597"
+    # The last recorded response repeats
+    assert s.profile("12345").headers["X-Ratelimit-Remain"] == "597"
+    assert s.profile("99999999").status_code == 404
+    assert replay.calls == 5
+
+
+def test_reset_times_rebased():
+    """Reset times move with the replay, scaled by its speed."""
+    headers = {"X-Ratelimit-Remain": "5", "X-Ratelimit-Reset": "1000300"}
+    archive = TrafficArchive(
+        [Exchange(0, 0, "GET", "/company/00012345", 200, headers, b"{}")],
+        started=1000000)
+    replay = ReplayTransport(archive, speed=10)
+    s = chwrapper.Search(access_token="pk.test", transport=replay)
+    reset = int(s.profile("12345").headers["X-Ratelimit-Reset"])
+    assert 28 <= reset - time.time() <= 31
+
+
+def test_accelerated_replay(tmp_path):
+    replay = ReplayTransport(record(tmp_path, latency=0.2), speed=4)
+    s = chwrapper.Search(access_token="pk.test", transport=replay)
+    started = time.monotonic()
+    s.profile("12345")
+    assert 0.05 <= time.monotonic() - started < 0.2
+
+
+def test_replay_traffic_timing():
+    """Requests are sent at their recorded offsets, scaled by speed."""
+    exchanges = [
+        Exchange(offset, 0, "GET", "/company/0000000{}".format(n), 200,
+                 {}, b"{}")
+        for n, offset in enumerate((0, 0.4, 0.4, 0.6))]
+    archive = TrafficArchive(exchanges)
+    recorder = RecordingTransport(ReplayTransport(archive, speed=None))
+    s = chwrapper.Search(access_token="pk.test", rate_limit=False,
+                         transport=recorder)
+
+    responses = replay_traffic(lambda: s, archive, speed=2)
+
+    assert [r.status_code for r in responses] == [200] * 4
+    offsets = sorted(e.offset for e in recorder.archive.exchanges)
+    expected = [0, 0.2, 0.2, 0.3]
+    assert all(abs(a - b - offsets[0]) < 0.05
+               for a, b in zip(offsets, expected))
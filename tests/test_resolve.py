@@ -0,0 +1,113 @@
+import itertools
+import json
+
+import responses
+
+import chwrapper
+from chwrapper.services.cache import CachedResponse, ResponseCache
+from chwrapper.services.resolve import EntityResolver, NameIndex, normalise_name
+
+SEARCH_URL = "https://api.companieshouse.gov.uk/search/companies"
+
+
+def build_index():
+    index = NameIndex()
+    index.add_records([
+        {"CompanyName": "DYSON TECHNOLOGY LIMITED", "CompanyNumber": "01959704"},
+        {"CompanyName": "DYSON LIMITED", "CompanyNumber": "02023199"},
+        {"CompanyName": "ACME WIDGETS LTD", "CompanyNumber": "00000001"},
+        {"CompanyName": "ACME WIDGET LTD", "CompanyNumber": "00000002"},
+    ])
+    return index
+
+
+def test_normalise_name():
+    """Case, punctuation and legal form suffixes are ignored."""
+    assert normalise_name("Dyson Technology Ltd.") == "DYSON TECHNOLOGY"
+    assert normalise_name("Marks & Spencer p.l.c.") == "MARKS AND SPENCER"
+    assert normalise_name("Ltd") == "LTD"
+
+
+def test_candidates():
+    index = build_index()
+    best = index.candidates("Dyson Technology Ltd")[0]
+    assert best.key == "01959704"
+    assert best.score == 1.0
+    index.add("Dyson Technology Limited", "01959704")
+    assert len(index) == 4
+
+
+def test_common_trigrams_shortlisted():
+    """Common words don't drown out rarer ones, and scores stay exact."""
+    exact, shortlisted = NameIndex(), NameIndex(common=0.1, min_common=0,
+                                                shortlist=3)
+    names = ["{} HOLDINGS LTD".format(word) for word in
+             ("ALPHA", "BRAVO", "CHARLIE", "DELTA", "ECHO", "FOXTROT",
+              "GOLF", "HOTEL", "INDIA", "JULIET")]
+    names.append("DYSON HOLDING SERVICES LTD")
+    for key, name in enumerate(names):
+        exact.add(name, str(key))
+        shortlisted.add(name, str(key))
+    query = "Dyson Holdings Services"
+    assert shortlisted.candidates(query, limit=1) == exact.candidates(
+        query, limit=1)
+    assert shortlisted.candidates(query)[0].key == "10"
+
+
+def test_add_cache():
+    """Company search results in the cache are indexed."""
+    body = {"items": [{"title": "PYTHON LTD", "company_number": "00000003"}]}
+    cache = ResponseCache()
+    cache.set("k", CachedResponse("u", 200, {}, json.dumps(body).encode()))
+    index = NameIndex()
+    index.add_cache(cache)
+    assert index.candidates("python limited")[0].key == "00000003"
+
+
+def test_resolve_from_index():
+    resolver = EntityResolver(build_index())
+    resolution = resolver.resolve("DYSON TECHNOLOGY LTD")
+    assert resolution.key == "01959704"
+    assert resolution.source == "index"
+
+
+def test_ambiguous_without_client():
+    """Close rival candidates leave the name unresolved."""
+    resolver = EntityResolver(build_index(), threshold=0.5, margin=0.2)
+    resolution = resolver.resolve("Acme Widgetz")
+    assert resolution.key is None
+    assert resolution.source is None
+    assert len(resolution.candidates) >= 2
+
+
+@responses.activate
+def test_resolve_falls_back_to_api():
+    """Unresolved names are searched and the results indexed."""
+    responses.add(
+        responses.GET, SEARCH_URL,
+        json={"items": [{"title": "PYTHON SOFTWARE LTD",
+                         "company_number": "00000004"}]},
+        adding_headers={"X-Ratelimit-Remain": "10"})
+    client = chwrapper.Search(access_token="pk.test")
+    resolver = EntityResolver(build_index(), client=client)
+
+    resolution = resolver.resolve("Python Software Limited")
+    assert resolution.key == "00000004"
+    assert resolution.source == "api"
+
+    assert resolver.resolve("Python Software Ltd").source == "index"
+    assert len(responses.calls) == 1
+
+
+def test_resolve_many_keeps_order():
+    resolver = EntityResolver(build_index(), workers=2)
+    names = ["Dyson Ltd", "Dyson Technology", "Unknown"]
+    keys = [r.key for r in resolver.resolve_many(names)]
+    assert keys == ["02023199", "01959704", None]
+
+
+def test_resolve_many_streams_input():
+    resolver = EntityResolver(build_index(), workers=2)
+    names = itertools.cycle(["Dyson Ltd", "Unknown"])
+    keys = [r.key for r in itertools.islice(resolver.resolve_many(names), 4)]
+    assert keys == ["02023199", None, "02023199", None]
@@ -0,0 +1,147 @@
+import pytest
+import requests
+import responses
+
+import chwrapper
+from chwrapper.services.cache import ResponseCache
+
+BASE = "https://api.companieshouse.gov.uk/"
+HEADERS = {"X-Ratelimit-Remain": "500"}
+PROFILE = {
+    "company_name": "PYTHON LTD",
+    "registered_office_address": {"locality": "London"},
+    "links": {
+        "self": "/company/00012345",
+        "officers": "/company/00012345/officers",
+        "filing_history": "/company/00012345/filing-history",
+    },
+}
+OFFICERS = {
+    "items": [{
+        "name": "SMITH, John",
+        "links": {"officer": {"appointments": "/officers/abc/appointments"}},
+    }],
+}
+FILINGS = {
+    "items": [{
+        "type": "AA",
+        "links": {
+            "self": "/company/00012345/filing-history/xyz",
+            "document_metadata":
+                "https://frontend-doc-api.companieshouse.gov.uk/document/doc1",
+        },
+    }],
+}
+
+
+def add(url, body):
+    responses.add(responses.GET, url, json=body, adding_headers=HEADERS)
+
+
+@responses.activate
+def test_fields_and_lazy_links():
+    add(BASE + "company/00012345", PROFILE)
+    add(BASE + "company/00012345/officers", OFFICERS)
+    add(BASE + "officers/abc/appointments", {"items": [{"appointed_to": {}}]})
+    s = chwrapper.Search(access_token="pk.test")
+
+    profile = s.company("12345")
+    assert profile.company_name == "PYTHON LTD"
+    assert profile.registered_office_address.locality == "London"
+    assert profile["company_name"] == "PYTHON LTD"
+    assert len(responses.calls) == 1
+
+    officer = profile.officers.items[0]
+    assert officer.name == "SMITH, John"
+    assert len(officer.officer.appointments.items) == 1
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_links_are_memoised():
+    add(BASE + "company/00012345", PROFILE)
+    add(BASE + "company/00012345/officers", OFFICERS)
+    s = chwrapper.Search(access_token="pk.test")
+    profile = s.company("12345")
+    assert profile.officers is profile.officers
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_document_alias_follows_absolute_link():
+    add(BASE + "company/00012345", PROFILE)
+    add(BASE + "company/00012345/filing-history", FILINGS)
+    add("https://document-api.companieshouse.gov.uk/document/doc1",
+        {"pages": 3})
+    s = chwrapper.Search(access_token="pk.test")
+    filing = s.company("12345").filing_history.items[0]
+    assert filing.document.pages == 3
+
+
+@responses.activate
+def test_follow_uses_cache():
+    add(BASE + "company/00012345/officers", OFFICERS)
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache())
+    s.officers("12345")
+    assert s.follow("/company/00012345/officers",
+                    endpoint="officers").from_cache
+    assert len(responses.calls) == 1
+
+
+def test_missing_attribute():
+    resource = chwrapper.Resource(None, {"links": {"self": "/x"}})
+    with pytest.raises(AttributeError):
+        resource.officers
+    with pytest.raises(AttributeError):
+        resource.self
+
+
+@responses.activate
+def test_rate_limited_link_not_memoised():
+    """A 429 returned while rate limiting raises and is tried again."""
+    add(BASE + "company/00012345", PROFILE)
+    responses.add(responses.GET, BASE + "company/00012345/officers",
+                  status=429, json={"error": "rate limited"},
+                  adding_headers={"X-Ratelimit-Remain": "1"})
+    add(BASE + "company/00012345/officers", OFFICERS)
+    s = chwrapper.Search(access_token="pk.test")
+    profile = s.company("12345")
+    with pytest.raises(requests.exceptions.HTTPError):
+        profile.officers
+    assert profile.officers.items[0].name == "SMITH, John"
+
+
+@responses.activate
+def test_company_rate_limited():
+    responses.add(responses.GET, BASE + "company/00012345", status=429,
+                  json={"error": "rate limited"},
+                  adding_headers={"X-Ratelimit-Remain": "1"})
+    s = chwrapper.Search(access_token="pk.test")
+    with pytest.raises(requests.exceptions.HTTPError):
+        s.company("12345")
+
+
+def test_follow_rejects_other_hosts():
+    """The access token is never sent to hosts outside the API."""
+    s = chwrapper.Search(access_token="pk.test")
+    with pytest.raises(ValueError):
+        s.follow("https://api.companieshouse.gov.uk.example.com/x")
+
+
+@responses.activate
+def test_document_links_use_document_policies():
+    """Document content isn't cached, while its metadata is."""
+    doc = "https://document-api.companieshouse.gov.uk/document/doc1"
+    add(doc, {"links": {"document": "https://frontend-doc-api"
+                        ".companieshouse.gov.uk/document/doc1/content"}})
+    responses.add(responses.GET, doc + "/content", body=b"%PDF",
+                  content_type="application/pdf", adding_headers=HEADERS)
+    s = chwrapper.Search(access_token="pk.test", cache=ResponseCache())
+    metadata = s.follow(
+        "https://frontend-doc-api.companieshouse.gov.uk/document/doc1")
+    resource = chwrapper.Resource(s, metadata.json(), metadata)
+    assert resource.document.content == b"%PDF"
+    assert s.follow(doc).from_cache
+    assert not getattr(s.follow(doc + "/content"), "from_cache", False)
+    assert [call.request.url.split("?")[0] for call in responses.calls] == [
+        doc, doc + "/content", doc + "/content"]
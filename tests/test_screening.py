@@ -0,0 +1,135 @@
+import itertools
+
+import pytest
+import requests
+import responses
+
+import chwrapper
+from chwrapper.services.screening import DisqualifiedIndex
+
+HEADERS = {"X-Ratelimit-Remain": "10"}
+
+
+def record(officer_id, title, dob, kind="natural"):
+    return {
+        "title": title,
+        "date_of_birth": dob,
+        "links": {"self": "/disqualified-officers/{}/{}".format(kind, officer_id)},
+    }
+
+
+def build_index():
+    index = DisqualifiedIndex()
+    index.upsert(record("aaa", "John SMITH", "1970-01-02"))
+    index.upsert(record("bbb", "John SMITH", "1980-05-06"))
+    index.upsert(record("ccc", "Jane DOE", "1965-03-04"))
+    return index
+
+
+def test_upsert_is_incremental():
+    index = build_index()
+    assert not index.upsert(record("aaa", "John SMITH", "1970-01-02"))
+    assert index.upsert(record("aaa", "John SMITH", "1970-01-03"))
+    assert not index.upsert({"title": "No link"})
+    assert len(index) == 3
+
+
+def test_renamed_officer_stops_matching_old_name():
+    index = build_index()
+    index.upsert(record("ccc", "Jane ROE", "1965-03-04"))
+    assert index.screen("Jane Doe") == []
+    assert [h.officer_id for h in index.screen("Jane Roe")] == ["ccc"]
+    assert len(index._names) == 3
+
+
+def test_screen_by_name_and_dob():
+    """Date of birth rules out namesakes."""
+    index = build_index()
+    assert {h.officer_id for h in index.screen("john smith")} == {"aaa", "bbb"}
+
+    hits = index.screen("John Smith", date_of_birth="1970-01-02")
+    assert [(h.officer_id, h.dob_match) for h in hits] == [("aaa", "exact")]
+
+    hits = index.screen("John Smith", date_of_birth="1980-05")
+    assert [(h.officer_id, h.dob_match) for h in hits] == [("bbb", "partial")]
+    assert index.screen("Someone Else") == []
+
+
+def test_screen_many():
+    index = build_index()
+    results = list(index.screen_many([("Jane Doe", None), ("Nobody", None)]))
+    assert [h.officer_id for h in results[0]] == ["ccc"]
+    assert results[1] == []
+
+
+def test_screen_many_streams_input():
+    index = build_index()
+    people = itertools.cycle([("Jane Doe", None), ("Nobody", None)])
+    results = list(itertools.islice(index.screen_many(people, workers=2), 4))
+    assert [len(hits) for hits in results] == [1, 0, 1, 0]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "disqualified.jsonl")
+    build_index().save(path)
+    index = DisqualifiedIndex.load(path)
+    assert len(index) == 3
+    assert index.screen("Jane Doe")[0].officer_id == "ccc"
+
+
+@responses.activate
+def test_refresh_and_confirm():
+    responses.add(
+        responses.GET,
+        "https://api.companieshouse.gov.uk/search/disqualified-officers",
+        json={"items": [record("ddd", "Fred BLOGGS", "1950-01-01",
+                               kind="corporate")],
+              "total_results": 1},
+        adding_headers=HEADERS)
+    responses.add(
+        responses.GET,
+        "https://api.companieshouse.gov.uk/disqualified-officers/corporate/ddd",
+        json={"kind": "corporate-disqualification"},
+        adding_headers=HEADERS)
+    client = chwrapper.Search(access_token="pk.test")
+    index = DisqualifiedIndex()
+
+    assert index.refresh(client, ["Bloggs"]) == 1
+    assert index.refresh(client, ["Bloggs"]) == 0
+
+    hit = index.screen("Fred Bloggs")[0]
+    assert hit.natural is False
+    assert index.confirm(client, hit) == {"kind": "corporate-disqualification"}
+
+
+@responses.activate
+def test_confirm_withdrawn():
+    responses.add(
+        responses.GET,
+        "https://api.companieshouse.gov.uk/disqualified-officers/natural/aaa",
+        status=404, adding_headers=HEADERS)
+    client = chwrapper.Search(access_token="pk.test")
+    index = build_index()
+    hit = index.screen("John Smith", "1970-01-02")[0]
+    assert index.confirm(client, hit) is None
+
+
+def test_refresh_stops_after_unchanged_pages():
+    """With stop_after, a term isn't paged past pages with nothing new."""
+    pages = []
+
+    class Client(object):
+        def iter_search_officers(self, term, disqualified, page_size):
+            for page in range(5):
+                pages.append(page)
+                for n in range(page_size):
+                    num = page * page_size + n
+                    yield record("id{}".format(num), "Name {}".format(num),
+                                 "1970-01-01")
+
+    index = DisqualifiedIndex()
+    assert index.refresh(Client(), ["Name"], page_size=2) == 10
+    del pages[:]
+    assert index.refresh(Client(), ["Name"], page_size=2,
+                         stop_after=2) == 0
+    assert pages == [0, 1]
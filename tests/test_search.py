@@ -1,5 +1,8 @@
+from datetime import date
 from datetime import datetime
 from datetime import timezone
+from urllib.parse import parse_qs, urlparse
+import json
 
 import pytest
 import responses
@@ -112,7 +115,7 @@ class TestSearch:
         """Getting a company profile works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345?access_token=pk.test",
+            "https://api.companieshouse.gov.uk/company/00012345?access_token=pk.test",
             match_querystring=True,
             status=200,
             body=self.results,
@@ -127,7 +130,7 @@ class TestSearch:
         """Searching for officers by company number works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345/officers?"
+            "https://api.companieshouse.gov.uk/company/00012345/officers?"
             + "access_token=pk.test",
             match_querystring=True,
             status=200,
@@ -143,7 +146,7 @@ class TestSearch:
         """Searching for filing history works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345/"
+            "https://api.companieshouse.gov.uk/company/00012345/"
             + "filing-history?access_token=pk.test",
             match_querystring=True,
             status=200,
@@ -160,7 +163,7 @@ class TestSearch:
         """Searching for a specific filing transaction works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345/"
+            "https://api.companieshouse.gov.uk/company/00012345/"
             + "filing-history/6789jhefD?access_token=pk.test",
             match_querystring=True,
             status=200,
@@ -177,7 +180,7 @@ class TestSearch:
         """Searching for an insolvency works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345/"
+            "https://api.companieshouse.gov.uk/company/00012345/"
             + "insolvency?access_token=pk.test",
             match_querystring=True,
             status=200,
@@ -195,7 +198,7 @@ class TestSearch:
         responses.add(
             responses.GET,
             "https://api.companieshouse.gov.uk/company/"
-            + "12345/charges?access_token=pk.test",
+            + "00012345/charges?access_token=pk.test",
             match_querystring=True,
             status=200,
             body=self.results,
@@ -210,7 +213,7 @@ class TestSearch:
         responses.add(
             responses.GET,
             "https://api.companieshouse.gov.uk/company/"
-            + "12345/charges/6789jhefD?access_token=pk.test",
+            + "00012345/charges/6789jhefD?access_token=pk.test",
             match_querystring=True,
             status=200,
             body=self.results,
@@ -226,7 +229,7 @@ class TestSearch:
         """Searching for a company's registered address works"""
         responses.add(
             responses.GET,
-            "https://api.companieshouse.gov.uk/company/12345/"
+            "https://api.companieshouse.gov.uk/company/00012345/"
             + "registered-office-address?access_token=pk.test",
             match_querystring=True,
             status=200,
@@ -316,7 +319,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control?access_token=pk.test"
             ),
             match_querystring=True,
@@ -343,7 +346,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control-statements?access_token=pk.test"
             ),
             match_querystring=True,
@@ -365,7 +368,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control?access_token=pk.test"
             ),
             match_querystring=True,
@@ -380,7 +383,7 @@ class TestSignificantControl:
         assert res.status_code == 200
         assert sorted(res.json().keys()) == self.items
         assert res.url == (
-            "https://api.companieshouse.gov.uk/company/12345/"
+            "https://api.companieshouse.gov.uk/company/00012345/"
             + "persons-with-significant-control?"
             + "access_token=pk.test"
         )
@@ -391,7 +394,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control/individual/12345?access_token=pk.test"
             ),
             match_querystring=True,
@@ -424,7 +427,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control/legal-person/12345"
                 + "?access_token=pk.test"
             ),
@@ -446,7 +449,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control/super-secure/12345?"
                 + "access_token=pk.test"
             ),
@@ -468,7 +471,7 @@ class TestSignificantControl:
         responses.add(
             responses.GET,
             (
-                "https://api.companieshouse.gov.uk/company/12345/"
+                "https://api.companieshouse.gov.uk/company/00012345/"
                 + "persons-with-significant-control/corporate-entity/12345?"
                 + "access_token=pk.test"
             ),
@@ -483,3 +486,151 @@ class TestSignificantControl:
 
         assert res.status_code == 200
         assert sorted(res.json().keys()) == self.items
+
+
+class TestValidation:
+    """Identifiers are normalised before any request is made"""
+    s = chwrapper.Search(access_token="pk.test")
+
+    @responses.activate
+    def test_invalid_company_number_not_sent(self):
+        """Malformed company numbers raise without a network call"""
+        with pytest.raises(ValueError):
+            _ = self.s.profile("12/345")
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_invalid_officer_id_not_sent(self):
+        """Malformed officer ids raise without a network call"""
+        with pytest.raises(ValueError):
+            _ = self.s.appointments("../company/1")
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_validation_disabled(self):
+        """Numbers are sent untouched when validation is off"""
+        responses.add(
+            responses.GET,
+            "https://api.companieshouse.gov.uk/company/sc1?access_token=pk.test",
+            match_querystring=True,
+            status=200,
+            body="{}",
+            content_type="application/json",
+            adding_headers={"X-Ratelimit-Remain": "10"},
+        )
+        s = chwrapper.Search(access_token="pk.test", validate=False)
+        assert s.profile("sc1").status_code == 200
+
+
+class TestAdvancedSearch:
+    """Advanced, alphabetical and dissolved search endpoints"""
+    s = chwrapper.Search(access_token="pk.test")
+    headers = {"X-Ratelimit-Remain": "10"}
+
+    def page(self, numbers, **extra):
+        body = {"items": [{"company_number": n} for n in numbers]}
+        body.update(extra)
+        return json.dumps(body)
+
+    @responses.activate
+    def test_advanced_search_params(self):
+        """Filters are encoded as comma separated lists and ISO dates"""
+        responses.add(
+            responses.GET,
+            "https://api.companieshouse.gov.uk/advanced-search/companies",
+            status=200,
+            body=self.page(["00000001"], hits=1),
+            content_type="application/json",
+            adding_headers=self.headers,
+        )
+        res = self.s.advanced_search(
+            sic_codes=["62012", "62020"],
+            incorporated_from=date(2020, 1, 2),
+            location=None,
+        )
+        assert res.status_code == 200
+        params = parse_qs(urlparse(responses.calls[0].request.url).query)
+        assert params["sic_codes"] == ["62012,62020"]
+        assert params["incorporated_from"] == ["2020-01-02"]
+        assert "location" not in params
+
+    @responses.activate
+    def test_iter_advanced_search(self):
+        """Pages are followed by start_index until hits are exhausted"""
+        url = "https://api.companieshouse.gov.uk/advanced-search/companies"
+        for start, numbers in [("0", ["1", "2"]), ("2", ["3"])]:
+            responses.add(
+                responses.GET,
+                url + "?access_token=pk.test&company_status=active"
+                + "&size=2&start_index=" + start,
+                match_querystring=True,
+                status=200,
+                body=self.page(numbers, hits=3),
+                content_type="application/json",
+                adding_headers=self.headers,
+            )
+        items = list(self.s.iter_advanced_search(page_size=2,
+                                                 company_status="active"))
+        assert [i["company_number"] for i in items] == ["1", "2", "3"]
+        assert len(responses.calls) == 2
+
+    @responses.activate
+    def test_iter_advanced_search_no_results(self):
+        """A 404 from advanced search ends iteration"""
+        responses.add(
+            responses.GET,
+            "https://api.companieshouse.gov.uk/advanced-search/companies",
+            status=404,
+            adding_headers=self.headers,
+        )
+        assert list(self.s.iter_advanced_search(sic_codes="99999")) == []
+
+    @responses.activate
+    def test_iter_dissolved_search_max_results(self):
+        """Iteration stops once max_results have been yielded"""
+        responses.add(
+            responses.GET,
+            "https://api.companieshouse.gov.uk/dissolved-search/companies",
+            status=200,
+            body=self.page(["1", "2"], total_results=10),
+            content_type="application/json",
+            adding_headers=self.headers,
+        )
+        items = list(self.s.iter_dissolved_search("Python", page_size=2,
+                                                  max_results=1))
+        assert len(items) == 1
+        params = parse_qs(urlparse(responses.calls[0].request.url).query)
+        assert params["search_type"] == ["best-match"]
+
+    @responses.activate
+    def test_iter_dissolved_search_alphabetical(self):
+        """Alphabetical dissolved pages are keyed rather than offset"""
+        url = "https://api.companieshouse.gov.uk/dissolved-search/companies"
+        first = {"items": [{"ordered_alpha_key_with_id": "PYTHONA:1"},
+                           {"ordered_alpha_key_with_id": "PYTHONB:2"}]}
+        second = {"items": [{"ordered_alpha_key_with_id": "PYTHONC:3"}]}
+        responses.add(responses.GET, url, json=first, adding_headers=self.headers)
+        responses.add(responses.GET, url, json=second, adding_headers=self.headers)
+
+        items = list(self.s.iter_dissolved_search(
+            "Python", search_type="alphabetical", page_size=2))
+        assert len(items) == 3
+        params = parse_qs(urlparse(responses.calls[1].request.url).query)
+        assert params["search_below"] == ["PYTHONB:2"]
+        assert params["search_type"] == ["alphabetical"]
+        assert "start_index" not in params
+
+    @responses.activate
+    def test_iter_alphabetical_search(self):
+        """Alphabetical pages continue below the last key returned"""
+        url = "https://api.companieshouse.gov.uk/alphabetical-search/companies"
+        first = {"items": [{"ordered_alpha_key_with_id": "PYTHONA:1"},
+                           {"ordered_alpha_key_with_id": "PYTHONB:2"}]}
+        second = {"items": [{"ordered_alpha_key_with_id": "PYTHONC:3"}]}
+        responses.add(responses.GET, url, json=first, adding_headers=self.headers)
+        responses.add(responses.GET, url, json=second, adding_headers=self.headers)
+
+        items = list(self.s.iter_alphabetical_search("Python", page_size=2))
+        assert len(items) == 3
+        params = parse_qs(urlparse(responses.calls[1].request.url).query)
+        assert params["search_below"] == ["PYTHONB:2"]
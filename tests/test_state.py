@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import chwrapper
+from chwrapper.services.state import RateLimitStore
+
+
+def headers(remaining, reset):
+    return {"X-Ratelimit-Remain": str(remaining),
+            "X-Ratelimit-Reset": str(reset), "X-Ratelimit-Limit": "600"}
+
+
+def test_state_restored(tmp_path):
+    """A new limiter picks up the window saved by the last one."""
+    path = str(tmp_path / "limits.json")
+    reset = int(time.time()) + 60
+    limiter = chwrapper.RateLimiter(RateLimitStore(path), "pk.test")
+    limiter.update(headers(42, reset))
+
+    restored = chwrapper.RateLimiter(RateLimitStore(path), "pk.test")
+    assert (restored.limit, restored.remaining, restored.reset) == (
+        600, 42, reset)
+    other = chwrapper.RateLimiter(RateLimitStore(path), "pk.other")
+    assert other.remaining is None
+
+
+def test_token_not_written(tmp_path):
+    path = str(tmp_path / "limits.json")
+    limiter = chwrapper.RateLimiter(RateLimitStore(path), "pk.secret")
+    limiter.update(headers(1, int(time.time()) + 60))
+    with open(path) as f:
+        content = f.read()
+    assert "pk.secret" not in content
+    assert "@api.companieshouse.gov.uk" in content
+
+
+def test_expired_state_ignored(tmp_path):
+    path = str(tmp_path / "limits.json")
+    key = RateLimitStore.key("pk.test")
+    with open(path, "w") as f:
+        json.dump({key: {"limit": 600, "remaining": 0,
+                         "reset": int(time.time()) - 1}}, f)
+    limiter = chwrapper.RateLimiter(RateLimitStore(path), "pk.test")
+    assert limiter.remaining is None
+
+
+def test_saves_throttled(tmp_path):
+    """Saves within the interval are skipped until forced."""
+    path = str(tmp_path / "limits.json")
+    store = RateLimitStore(path, interval=60)
+    reset = int(time.time()) + 60
+    limiter = chwrapper.RateLimiter(store, "pk.test")
+    limiter.update(headers(10, reset))
+    limiter.update(headers(9, reset))
+    assert store.load(limiter.key)["remaining"] == 10
+    limiter.save()
+    assert store.load(limiter.key)["remaining"] == 9
+
+
+def test_lowest_count_kept_between_processes(tmp_path):
+    path = str(tmp_path / "limits.json")
+    reset = int(time.time()) + 60
+    RateLimitStore(path).save("k", 600, 5, reset)
+    RateLimitStore(path).save("k", 600, 8, reset)
+    assert RateLimitStore(path).load("k")["remaining"] == 5
+    # An older window doesn't overwrite a newer one
+    RateLimitStore(path).save("k", 600, 100, reset - 300)
+    assert RateLimitStore(path).load("k")["reset"] == reset
+
+
+def test_corrupt_file_ignored(tmp_path):
+    path = tmp_path / "limits.json"
+    path.write_text("{")
+    assert RateLimitStore(str(path)).load("k") is None
+
+
+def test_skipped_save_flushed_after_interval(tmp_path):
+    path = str(tmp_path / "limits.json")
+    store = RateLimitStore(path, interval=0.1)
+    reset = int(time.time()) + 60
+    store.save("k", 600, 10, reset)
+    store.save("k", 600, 9, reset)
+    assert store.load("k")["remaining"] == 10
+    time.sleep(0.3)
+    assert store.load("k")["remaining"] == 9
+
+
+def _save_keys(path, prefix, reset):
+    store = RateLimitStore(path, interval=0)
+    for i in range(20):
+        store.save("{}{}".format(prefix, i), 600, i, reset)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_concurrent_processes_keep_each_others_keys(tmp_path):
+    path = str(tmp_path / "limits.json")
+    reset = int(time.time()) + 60
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_save_keys, args=(path, p, reset))
+               for p in "abcd"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with open(path) as f:
+        assert len(json.load(f)) == 80
+
+
+def test_search_store(tmp_path):
+    path = str(tmp_path / "limits.json")
+    reset = int(time.time()) + 60
+    RateLimitStore(path).save(RateLimitStore.key("pk.test"), 600, 7, reset)
+    s = chwrapper.Search(access_token="pk.test", store=RateLimitStore(path))
+    assert s.limiter.remaining == 7
+    with pytest.raises(ValueError):
+        chwrapper.Search(access_token="pk.test", store=RateLimitStore(path),
+                         limiter=chwrapper.RateLimiter())
@@ -0,0 +1,38 @@
+import gzip
+import json
+
+import responses
+
+import chwrapper
+from chwrapper.services.cache import ResponseCache
+
+PROFILE_URL = "https://api.companieshouse.gov.uk/company/00012345"
+HEADERS = {"X-Ratelimit-Remain": "10"}
+
+
+@responses.activate
+def test_compressed_transfer_counted():
+    """Wire bytes are the compressed size, decoded bytes the JSON."""
+    body = json.dumps({"items": [{"company_name": "A"}] * 100}).encode()
+    wire = gzip.compress(body)
+    headers = dict(HEADERS, **{"Content-Encoding": "gzip",
+                               "Content-Length": str(len(wire))})
+    responses.add(responses.GET, PROFILE_URL, body=wire,
+                  content_type="application/json", adding_headers=headers)
+    s = chwrapper.Search(access_token="pk.test")
+    assert s.profile("12345").json()["items"][0] == {"company_name": "A"}
+    assert s.stats.decoded_bytes == len(body)
+    assert s.stats.wire_bytes == len(wire)
+    assert s.stats.compression_ratio > 5
+
+
+@responses.activate
+def test_cache_hits_counted():
+    responses.add(responses.GET, PROFILE_URL, json={"company_name": "A"},
+                  adding_headers=HEADERS)
+    s = chwrapper.Search(access_token="pk.test",
+                         cache=ResponseCache(compression="zlib"))
+    s.profile("12345")
+    s.profile("12345")
+    assert s.stats.as_dict()["requests"] == 1
+    assert s.stats.cache_hits == 1
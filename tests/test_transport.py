@@ -0,0 +1,110 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+import chwrapper
+from chwrapper.services.transport import StubTransport, Urllib3Transport
+
+
+def test_stub_replays_canned_responses():
+    transport = StubTransport()
+    transport.add("/company/00012345", {"company_name": "A"})
+    s = chwrapper.Search(access_token="pk.test", transport=transport)
+    res = s.profile("12345")
+    assert res.json() == {"company_name": "A"}
+    assert res.headers["X-Ratelimit-Remain"] == "599"
+    assert transport.calls == 1
+    assert s.limiter.remaining == 599
+
+
+def test_stub_missing_route_is_404():
+    s = chwrapper.Search(access_token="pk.test", transport=StubTransport())
+    with pytest.raises(requests.exceptions.HTTPError):
+        s.profile("12345")
+
+
+def test_stub_query_string_routes():
+    transport = StubTransport(limit=None)
+    transport.add("/search/companies?q=a", {"items": ["a"]})
+    transport.add("/search/companies", {"items": []})
+    s = chwrapper.Search(access_token="pk.test", rate_limit=False,
+                         transport=transport)
+    assert s.search_companies("a").json() == {"items": ["a"]}
+    assert s.search_companies("b").json() == {"items": []}
+    assert "X-Ratelimit-Remain" not in s.search_companies("a").headers
+
+
+def test_stub_rate_limit_window():
+    """Calls past the limit get 429s until the window resets."""
+    transport = StubTransport(limit=2, window=1)
+    transport.add("/company/00012345", {})
+    s = chwrapper.Search(access_token="pk.test", rate_limit=False,
+                         transport=transport)
+    s._ignore_codes.append(429)
+    statuses = [s.profile("12345").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_stub_latency():
+    transport = StubTransport(latency=lambda: 0.05)
+    transport.add("/company/00012345", {})
+    s = chwrapper.Search(access_token="pk.test", transport=transport)
+    started = time.monotonic()
+    s.profile("12345")
+    assert time.monotonic() - started >= 0.05
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = b'{"company_name": "A"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Ratelimit-Remain", "10")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_port)
+    httpd.shutdown()
+
+
+def test_urllib3_transport(server):
+    transport = Urllib3Transport()
+    s = chwrapper.Search(access_token="pk.test", transport=transport)
+    s._BASE_URI = server
+    s.session = s.get_session(**s._session_args)
+    res = s.profile("12345")
+    assert res.json() == {"company_name": "A"}
+    assert s.stats.wire_bytes == len(res.content)
+    transport.close()
+
+
+def test_async_transport(server):
+    pytest.importorskip("aiohttp")
+    transport = chwrapper.AsyncTransport()
+    s = chwrapper.Search(access_token="pk.test", transport=transport)
+    s._BASE_URI = server
+    s.session = s.get_session(**s._session_args)
+    assert s.profile("12345").json() == {"company_name": "A"}
+    transport.close()
+
+
+def test_async_transport_requires_aiohttp(monkeypatch):
+    from chwrapper.services import transport
+
+    monkeypatch.setattr(transport, "aiohttp", None)
+    with pytest.raises(ValueError):
+        transport.AsyncTransport()
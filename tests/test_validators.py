@@ -0,0 +1,64 @@
+import pytest
+
+from chwrapper.services.validators import (
+    InvalidIdentifier,
+    normalise_company_number,
+    normalise_company_numbers,
+    normalise_officer_id,
+    normalise_officer_ids,
+)
+
+
+@pytest.mark.parametrize(
+    "num,expected",
+    [
+        ("00000006", "00000006"),
+        ("6", "00000006"),
+        (6, "00000006"),
+        (" 3772814 ", "03772814"),
+        ("sc123456", "SC123456"),
+        ("SC123", "SC000123"),
+        ("ni 012345", "NI012345"),
+        ("R0000123", "R0000123"),
+        ("ip12345r", "IP12345R"),
+    ],
+)
+def test_normalise_company_number(num, expected):
+    """Company numbers are padded and upper-cased."""
+    assert normalise_company_number(num) == expected
+
+
+@pytest.mark.parametrize("num", ["", "123456789", "SC1234567", "12/34", "S1"])
+def test_normalise_company_number_invalid(num):
+    """Malformed company numbers raise InvalidIdentifier."""
+    with pytest.raises(InvalidIdentifier):
+        normalise_company_number(num)
+
+
+def test_invalid_identifier_is_value_error():
+    """InvalidIdentifier can be caught as a ValueError."""
+    with pytest.raises(ValueError):
+        normalise_company_number("not a number")
+
+
+def test_normalise_company_numbers():
+    """Batches keep input order and can coerce bad values to None."""
+    nums = ["6", "sc1", "bad/num", 3772814]
+    assert normalise_company_numbers(nums, errors="coerce") == [
+        "00000006",
+        "SC000001",
+        None,
+        "03772814",
+    ]
+    with pytest.raises(InvalidIdentifier):
+        normalise_company_numbers(nums)
+    with pytest.raises(ValueError):
+        normalise_company_numbers(nums, errors="ignore")
+
+
+def test_normalise_officer_ids():
+    """Officer ids are stripped but keep their case."""
+    assert normalise_officer_id(" aBc-12_3 ") == "aBc-12_3"
+    assert normalise_officer_ids(["abc", "a/b"], errors="coerce") == ["abc", None]
+    with pytest.raises(InvalidIdentifier):
+        normalise_officer_id("../company")
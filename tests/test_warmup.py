@@ -0,0 +1,110 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+import chwrapper
+from chwrapper.services import warmup
+from chwrapper.services.stats import ClientStats
+from chwrapper.services.transport import StubTransport
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+
+    def setup(self):
+        super(Handler, self).setup()
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        body = b'{"company_name": "A"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def accepted(count, timeout=2):
+    """Wait for the server threads to record *count* connections."""
+    deadline = time.monotonic() + timeout
+    while len(Handler.connections) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return len(Handler.connections)
+
+
+@pytest.fixture
+def server():
+    Handler.connections = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://localhost:{}/".format(httpd.server_port)
+    httpd.shutdown()
+
+
+def test_warm_connections_are_reused(server):
+    session = chwrapper.Service().get_session("pk.test")
+    stats = ClientStats()
+    dns_cache = warmup.DNSCache()
+    warmup.instrument(session, [server], dns_cache=dns_cache,
+                      on_handshake=stats.record_handshake)
+    assert warmup.warm(session, [server], connections=2) == 2
+    assert accepted(2) == 2
+    assert stats.connections == 2
+    assert stats.handshake_seconds > 0
+    assert dns_cache.misses == 1
+
+    for _ in range(3):
+        assert session.get(server + "company/1").json()["company_name"] == "A"
+    assert len(Handler.connections) == 2
+    assert stats.as_dict()["connections"] == 2
+
+
+def test_warm_capped_at_pool_size(server):
+    session = chwrapper.Service().get_session("pk.test")
+    assert warmup.warm(session, [server], connections=50) == 10
+
+
+def test_warm_skips_unreachable_hosts():
+    session = chwrapper.Service().get_session("pk.test")
+    assert warmup.warm(session, ["http://127.0.0.1:9/"], timeout=1) == 0
+
+
+def test_dns_cache_ttl(monkeypatch):
+    now = [100.0]
+    lookups = []
+
+    def getaddrinfo(host, port, *args):
+        lookups.append(host)
+        return [(None, None, None, "", ("10.0.0.1", port)),
+                (None, None, None, "", ("10.0.0.1", port)),
+                (None, None, None, "", ("10.0.0.2", port))]
+
+    monkeypatch.setattr(warmup, "monotonic", lambda: now[0])
+    monkeypatch.setattr(warmup.socket, "getaddrinfo", getaddrinfo)
+    cache = warmup.DNSCache(ttl=60)
+    assert cache.resolve("example.com", 443) == ["10.0.0.1", "10.0.0.2"]
+    now[0] += 59
+    cache.resolve("example.com", 443)
+    assert lookups == ["example.com"]
+    now[0] += 2
+    cache.resolve("example.com", 443)
+    assert lookups == ["example.com"] * 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_search_warm_with_stub_transport():
+    """Transports without a connection pool are left alone."""
+    transport = StubTransport()
+    transport.add("/company/00012345", {"company_name": "A"})
+    s = chwrapper.Search(access_token="pk.test", transport=transport,
+                         warm_connections=2, dns_cache=chwrapper.DNSCache())
+    assert s.profile("12345").json() == {"company_name": "A"}
+    assert s.stats.connections == 0